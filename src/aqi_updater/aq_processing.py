@@ -1,11 +1,41 @@
 from logging import Logger
-from typing import Union
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, Sequence, Tuple, Union
+import io
 import zipfile
 import rioxarray
 import xarray
 import rasterio
 import numpy as np
+from affine import Affine
 from rasterio import fill
+try:
+    import netCDF4
+except ImportError:
+    netCDF4 = None
+
+
+@dataclass(frozen=True)
+class AqRaster:
+    """An in-memory single band AQ raster (e.g. AQI of an hour) in WGS84. Has the same properties
+    as an opened rasterio dataset that are needed for sampling it (see aq_sampling), so that AQ
+    data can be sampled without writing it to a GeoTiff file first.
+    """
+    band: np.ndarray
+    transform: Affine
+    nodata: Union[float, None] = None
+    crs: str = 'epsg:4326'
+
+    @property
+    def width(self) -> int:
+        return self.band.shape[1]
+
+    @property
+    def height(self) -> int:
+        return self.band.shape[0]
+
+    def read(self, index: int = 1) -> np.ndarray:
+        return self.band
 
 
 def extract_zipped_aq_file(
@@ -25,6 +55,330 @@ def extract_zipped_aq_file(
             return file_name
 
 
+def read_zipped_aq_nc(
+    aq_zip: Union[str, bytes, BinaryIO],
+    aq_file_name: str = 'allPollutants'
+) -> Union[Tuple[str, bytes], None]:
+    """Reads AQ file from zip archive (filepath, bytes or file object) to memory.
+    Returns the name and the contents of the file (if found) or None.
+    """
+    if isinstance(aq_zip, bytes):
+        aq_zip = io.BytesIO(aq_zip)
+    with zipfile.ZipFile(aq_zip, 'r') as zip_archive:
+        for file_name in zip_archive.namelist():
+            if aq_file_name in file_name:
+                return file_name, zip_archive.read(file_name)
+
+
+def __open_nc_dataset(nc_name: str, nc_bytes: bytes) -> xarray.Dataset:
+    """Opens a netCDF file from memory without decoding (scaling & masking) the values.
+    """
+    if netCDF4:
+        store = xarray.backends.NetCDF4DataStore(netCDF4.Dataset(nc_name, memory=nc_bytes))
+        return xarray.open_dataset(store, mask_and_scale=False)
+    return xarray.open_dataset(io.BytesIO(nc_bytes), mask_and_scale=False)
+
+
+def __read_nc_variable_raster(data: xarray.Dataset, variable: str) -> AqRaster:
+    # the data of the variable has shape (time, lat, lon)
+    aq = data[variable].rio.set_crs('epsg:4326')
+    transform = aq.rio.transform()
+    aq_band = aq.values[0] if aq.ndim == 3 else aq.values
+    # scale & offset in double precision as in fix_aqi_tiff_scale_offset
+    scale = float(aq.attrs.get('scale_factor', 1.0))
+    offset = float(aq.attrs.get('add_offset', 0.0))
+    fill_value = aq.attrs.get('_FillValue', aq.attrs.get('missing_value', None))
+
+    fill_mask = aq_band == fill_value if fill_value is not None else None
+    if np.issubdtype(aq_band.dtype, np.integer):
+        aq_band = aq_band * scale + offset
+    aq_band = aq_band.astype(np.float32)
+    # AQI is read as it is, as its nodata is filled later (see fill_aqi_nodata)
+    if variable == 'AQI':
+        return AqRaster(aq_band, transform)
+    if fill_mask is not None:
+        aq_band[fill_mask] = np.nan
+    return AqRaster(aq_band, transform, nodata=np.nan)
+
+
+def read_aq_nc_rasters(
+    nc_name: str,
+    nc_bytes: bytes,
+    variables: Sequence[str] = ('AQI',)
+) -> Dict[str, AqRaster]:
+    """Reads layers (variables) of a netCDF file (in memory) to AQ rasters by the names of the
+    variables (e.g. AQI, NO2, PM25), so that all of them are read from one opened file. Unscaled
+    (integer) values are scaled and offset to real values with the scale & offset of the layer.
+    Other layers than AQI have NaN as nodata, i.e. their fill values are set to NaN and points
+    outside them are sampled as NaN. Variables that are not found in the file are skipped.
+
+    Args:
+        nc_name: The filename of the nc file, e.g. allPollutants_2019-09-11T15.nc
+        nc_bytes: The contents of the nc file.
+        variables: The names of the variables to read.
+    """
+    with __open_nc_dataset(nc_name, nc_bytes) as data:
+        return {
+            variable: __read_nc_variable_raster(data, variable)
+            for variable in variables if variable in data.variables
+        }
+
+
+def read_aqi_nc_raster(nc_name: str, nc_bytes: bytes) -> AqRaster:
+    """Reads the AQI layer of a netCDF file (in memory) to an AQ raster. Unscaled (int8) AQI values
+    are scaled and offset to real AQI values with the scale & offset of the layer. The result is
+    the same as with convert_aq_nc_to_tif and fix_aqi_tiff_scale_offset, but without writing and
+    reading GeoTiff files.
+
+    Args:
+        nc_name: The filename of the nc file, e.g. allPollutants_2019-09-11T15.nc
+        nc_bytes: The contents of the nc file.
+    """
+    return read_aq_nc_rasters(nc_name, nc_bytes, ['AQI'])['AQI']
+
+
+def get_aqi_nodata_mask(
+    aqi_band: np.ndarray,
+    na_val: float = 1.0,
+    log: Logger = None
+) -> np.ndarray:
+    """Returns a mask of the nodata values in an AQI band. Value 1.0 is considered as nodata.
+    If no nodata is found with that value, a small offset will be applied, as sometimes the nodata
+    value is slightly higher than 1.0 (assumably due to inaccuracy in netcdf to geotiff
+    conversion).
+    """
+    na_offsets = [0.0, 0.01, 0.02, 0.04, 0.06, 0.08, 0.1, 0.12]
+    na_thresholds = [na_val + offset for offset in na_offsets]
+
+    # scan the band only once, the thresholds are checked from the values below the highest one
+    low_values = aqi_band[aqi_band <= na_thresholds[-1]]
+    for na_threshold in na_thresholds:
+        nodata_count = np.count_nonzero(low_values <= na_threshold)
+        if log:
+            log.info(f'Nodata threshold: {na_threshold} / nodata count: {nodata_count}')
+        # check if nodata values can be mapped with the current offset
+        if nodata_count > 180000:
+            break
+    if nodata_count < 180000:
+        if log:
+            log.info(f'Failed to set nodata values in the AQI tif, nodata count: {nodata_count}')
+
+    return aqi_band <= na_threshold
+
+
+def _fill_masked_nodata(aqi_band: np.ndarray, nodata_mask: np.ndarray) -> np.ndarray:
+    return fill.fillnodata(aqi_band, mask=np.where(nodata_mask, 0, aqi_band))
+
+
+def _validate_filled_aqi(aqi_band_fillna: np.ndarray, log: Logger = None) -> None:
+    invalid_count = np.sum(aqi_band_fillna < 1.0)
+
+    if invalid_count > 0:
+        if log:
+            log.warning(f'AQI band has {invalid_count} below 1.0 AQI values after na fill')
+
+
+def fill_aqi_nodata(
+    aqi_band: np.ndarray,
+    na_val: float = 1.0,
+    log: Logger = None
+) -> np.ndarray:
+    """Fills nodata values in an AQI band by interpolating values from surrounding cells.
+    Value 1.0 is considered as nodata. If no nodata is found with that value, a small offset
+    will be applied, as sometimes the nodata value is slightly higher than 1.0 (assumably
+    due to inaccuracy in netcdf to geotiff conversion).
+    """
+    nodata_mask = get_aqi_nodata_mask(aqi_band, na_val, log)
+
+    # fill nodata in aqi_band using nodata mask
+    aqi_band_fillna = _fill_masked_nodata(aqi_band, nodata_mask)
+
+    # validate AQI values after na fill
+    _validate_filled_aqi(aqi_band_fillna, log)
+
+    return aqi_band_fillna
+
+
+@dataclass(frozen=True)
+class NodataFillPlan:
+    """A plan for filling the nodata pixels of bands that have the same nodata mask as a sparse
+    gather of source pixels. Filling by the plan gives the same values as fillnodata (GDAL) with
+    the default max_search_distance (100) and no smoothing, in which each nodata pixel gets the
+    inverse distance weighted mean of the nearest valid pixels of its four quadrants.
+    """
+    nodata_mask: np.ndarray  # (height, width) bool
+    fill_indices: np.ndarray  # flat indices of the nodata pixels that have source pixels
+    source_indices: np.ndarray  # (n, 4) flat indices of the source pixels by quadrant
+    source_weights: np.ndarray  # (n, 4) inverse distances, 0 for quadrants without source
+
+    def fill(self, band: np.ndarray) -> np.ndarray:
+        values = band.ravel()[self.source_indices].astype(np.float64)
+        value_sums = np.zeros(len(self.fill_indices))
+        weight_sums = np.zeros(len(self.fill_indices))
+        # sum in the order of the quadrants as GDAL, so that the values are identical
+        for quad in range(4):
+            value_sums += values[:, quad] * self.source_weights[:, quad]
+            weight_sums += self.source_weights[:, quad]
+        band_fillna = band.copy()
+        band_fillna.ravel()[self.fill_indices] = value_sums / weight_sums
+        return band_fillna
+
+
+def get_nodata_fill_plan(
+    nodata_mask: np.ndarray,
+    max_search_distance: int = 100
+) -> NodataFillPlan:
+    """Creates a nodata fill plan (see NodataFillPlan) by searching the nearest valid pixel of each
+    quadrant of each nodata pixel like GDALFillNodata: the candidates of the upper (lower)
+    quadrants are the nearest valid pixels above (below) the nodata pixel in the columns within
+    the search distance, so that the upper quadrants also include the row of the pixel and the
+    left quadrants the column of the pixel.
+    """
+    height, width = nodata_mask.shape
+    rows = np.arange(height, dtype=np.int32)[:, None]
+    # the nearest valid rows above (including the row) and below (excluding the row) by column
+    valid_above = np.maximum.accumulate(np.where(nodata_mask, -1, rows), axis=0)
+    valid_below = np.minimum.accumulate(np.where(nodata_mask, height, rows)[::-1], axis=0)[::-1]
+    valid_below = np.vstack((valid_below[1:], np.full((1, width), height)))
+
+    nodata_rows, nodata_cols = (indices.astype(np.int32) for indices in np.nonzero(nodata_mask))
+    fill_indices = nodata_rows.astype(np.int64) * width + nodata_cols
+    # quadrants without source pixel refer to the (nodata) pixel itself with zero weight
+    source_indices = np.repeat(fill_indices[:, None], 4, axis=1)
+    distances = np.full(source_indices.shape, np.inf)
+
+    quadrants = ((valid_above, -1), (valid_below, -1), (valid_above, 1), (valid_below, 1))
+    for quad, (valid_rows, direction) in enumerate(quadrants):
+        pixels = np.arange(len(fill_indices))
+        pixel_rows, pixel_cols = nodata_rows, nodata_cols
+        pixel_distances = distances[:, quad]
+        for step in range(0 if direction < 0 else 1, max_search_distance + 1):
+            if step % 4 == 0:
+                # pixels of which the nearest source so far is within the step cannot find
+                # nearer ones (as the distances to the next columns are at least the step)
+                searching = pixel_distances[pixels] > step
+                pixels = pixels[searching]
+                pixel_rows, pixel_cols = pixel_rows[searching], pixel_cols[searching]
+                if not len(pixels):
+                    break
+            # columns outside the band are clamped to the edge as in GDAL
+            cols = np.clip(pixel_cols + direction * step, 0, width - 1)
+            source_rows = valid_rows[pixel_rows, cols]
+            dist_sq = ((cols - pixel_cols) ** 2 + (source_rows - pixel_rows) ** 2).astype(float)
+            # compare squared distances as GDAL, as it affects which one of equidistant pixels
+            # is selected
+            nearer = (
+                (source_rows >= 0) & (source_rows < height)
+                & (dist_sq < pixel_distances[pixels] ** 2)
+            )
+            nearer_pixels = pixels[nearer]
+            pixel_distances[nearer_pixels] = np.sqrt(dist_sq[nearer])
+            source_indices[nearer_pixels, quad] = (
+                source_rows[nearer].astype(np.int64) * width + cols[nearer]
+            )
+
+    in_distance = distances <= max_search_distance
+    source_weights = np.where(in_distance, 1.0 / distances, 0.0)
+    source_indices = np.where(in_distance, source_indices, fill_indices[:, None])
+    has_source = np.any(in_distance, axis=1)
+    return NodataFillPlan(
+        nodata_mask,
+        fill_indices[has_source],
+        source_indices[has_source],
+        source_weights[has_source]
+    )
+
+
+class AqiNodataFiller:
+    """AqiNodataFiller fills nodata values in AQI bands as fill_aqi_nodata, but with a cached
+    nodata fill plan: the nodata areas of the bands (mainly the sea and the edges of the model
+    area) stay the same from hour to hour, so the plan built from the first filled band can be
+    reused (as a sparse gather) instead of interpolating the whole band. If the nodata mask
+    changes, the band is filled with fillnodata and the plan is built again.
+
+    Attributes:
+        log: An instance of Logger class for writing log messages.
+        __fill_plan (NodataFillPlan): The fill plan of the latest nodata mask (if any).
+        __use_fill_plans (bool): False if a fill plan did not reproduce fillnodata, after which
+            the bands are always filled with fillnodata.
+    """
+
+    def __init__(self, log: Logger = None):
+        self.log = log
+        self.__fill_plan: Union[NodataFillPlan, None] = None
+        self.__use_fill_plans = True
+
+    def fill(self, aqi_band: np.ndarray, na_val: float = 1.0) -> np.ndarray:
+        nodata_mask = get_aqi_nodata_mask(aqi_band, na_val)
+        if (
+            self.__fill_plan is not None
+            and np.array_equal(nodata_mask, self.__fill_plan.nodata_mask)
+        ):
+            aqi_band_fillna = self.__fill_plan.fill(aqi_band)
+        else:
+            aqi_band_fillna = _fill_masked_nodata(aqi_band, nodata_mask)
+            if self.__use_fill_plans:
+                self.__update_fill_plan(aqi_band, nodata_mask, aqi_band_fillna)
+        _validate_filled_aqi(aqi_band_fillna, self.log)
+        return aqi_band_fillna
+
+    def __update_fill_plan(
+        self,
+        aqi_band: np.ndarray,
+        nodata_mask: np.ndarray,
+        aqi_band_fillna: np.ndarray
+    ) -> None:
+        """Builds a fill plan for the nodata mask and keeps it if it reproduces the band filled
+        with fillnodata (e.g. the search of GDAL may differ between its versions).
+        """
+        if self.__fill_plan is not None and self.log:
+            self.log.info('Nodata mask of AQI changed, updating nodata fill plan')
+        fill_plan = get_nodata_fill_plan(nodata_mask)
+        if np.allclose(fill_plan.fill(aqi_band), aqi_band_fillna, rtol=0, atol=1e-5):
+            self.__fill_plan = fill_plan
+            if self.log:
+                self.log.info(f'Created nodata fill plan for {len(fill_plan.fill_indices)} pixels')
+        else:
+            self.__fill_plan = None
+            self.__use_fill_plans = False
+            if self.log:
+                self.log.warning('Nodata fill plan differs from fillnodata, not using fill plans')
+
+
+def fill_aqi_raster_nodata(
+    aqi_raster: AqRaster,
+    na_val: float = 1.0,
+    log: Logger = None,
+    nodata_filler: AqiNodataFiller = None
+) -> AqRaster:
+    """Returns a copy of an AQI raster with nodata values filled (see fill_aqi_nodata). If
+    nodata_filler is given, its cached nodata fill plan is used (see AqiNodataFiller).
+    """
+    return AqRaster(
+        nodata_filler.fill(aqi_raster.band, na_val) if nodata_filler
+        else fill_aqi_nodata(aqi_raster.band, na_val, log),
+        aqi_raster.transform,
+        aqi_raster.nodata,
+        aqi_raster.crs
+    )
+
+
+def write_aq_raster_tif(aq_raster: AqRaster, file_path: str) -> None:
+    with rasterio.open(
+        file_path,
+        'w',
+        driver='GTiff',
+        height=aq_raster.height,
+        width=aq_raster.width,
+        count=1,
+        dtype='float32',
+        transform=aq_raster.transform,
+        crs=aq_raster.crs,
+        nodata=aq_raster.nodata
+    ) as aq_raster_file:
+        aq_raster_file.write(aq_raster.band.astype(np.float32), 1)
+
+
 def convert_aq_nc_to_tif(
     dir: str,
     aqi_nc_name: str
@@ -121,30 +475,7 @@ def fillna_in_raster(
     if _has_unscaled_aqi(aqi_raster):
         raise ValueError('AQI values are still unscaled')
 
-    na_offsets = [0.0, 0.01, 0.02, 0.04, 0.06, 0.08, 0.1, 0.12]
-    na_thresholds = [na_val + offset for offset in na_offsets]
-
-    for na_threshold in na_thresholds:
-        nodata_count = np.sum(aqi_band <= na_threshold)
-        if log:
-            log.info(f'Nodata threshold: {na_threshold} / nodata count: {nodata_count}')
-        # check if nodata values can be mapped with the current offset
-        if nodata_count > 180000:
-            break
-    if nodata_count < 180000:
-        if log:
-            log.info(f'Failed to set nodata values in the AQI tif, nodata count: {nodata_count}')
-
-    # fill nodata in aqi_band using nodata mask
-    aqi_nodata_mask = np.where(aqi_band <= na_threshold, 0, aqi_band)
-    aqi_band_fillna = fill.fillnodata(aqi_band, mask=aqi_nodata_mask)
-
-    # validate AQI values after na fill
-    invalid_count = np.sum(aqi_band_fillna < 1.0)
-
-    if invalid_count > 0:
-        if log:
-            log.warning(f'AQI band has {invalid_count} below 1.0 AQI values after na fill')
+    aqi_band_fillna = fill_aqi_nodata(aqi_band, na_val, log)
 
     # write raster with filled nodata
     aqi_raster_fillna = rasterio.open(
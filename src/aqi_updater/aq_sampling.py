@@ -1,13 +1,18 @@
 from typing import Any, List, Union
+from dataclasses import dataclass
+from math import cos, radians
 from pandas import DataFrame
-from collections import Counter
 from common.igraph import Edge as E
 from geopandas import GeoDataFrame
+import shapely
 from shapely.geometry import LineString
 from logging import Logger
-from enum import Enum
 import common.igraph as ig_utils
+import common.aqi_validation as aqi_validation
+from common.aqi_validation import AqiValidationReport
+from common.sampling_manifest import SamplingManifest
 import rasterio
+import rasterio.transform
 import pandas as pd
 import numpy as np
 
@@ -16,7 +21,9 @@ def get_sampling_point_gdf_from_graph(graph) -> GeoDataFrame:
     """Creates GeoDataFrame of edges of the graph. Filters out null geometries and
     adds point geometries to be used as sampling points.
     """
-    edge_gdf = ig_utils.get_edge_gdf(graph, attrs=[E.id_ig, E.id_way], geom_attr=E.geom_wgs)
+    edge_gdf = ig_utils.get_edge_gdf(
+        graph, attrs=[E.id_ig, E.id_way, E.length], geom_attr=E.geom_wgs
+    )
     # filter out edges with null geometry
     edge_gdf = edge_gdf[edge_gdf[E.geom_wgs.name].apply(lambda x: isinstance(x, LineString))]
     edge_gdf['point_geom'] = [
@@ -26,6 +33,27 @@ def get_sampling_point_gdf_from_graph(graph) -> GeoDataFrame:
     return edge_gdf
 
 
+def get_sampling_point_gdf_from_manifest(manifest: SamplingManifest) -> GeoDataFrame:
+    """Creates GeoDataFrame of the edges of a sampling manifest (see common.sampling_manifest) as
+    get_sampling_point_gdf_from_graph does from a graph. The edge geometries are included only if
+    the manifest was read with them (as they are needed only for sampling at multiple points).
+    """
+    columns = {
+        E.id_ig.name: manifest.id_ig,
+        E.id_way.name: manifest.id_way,
+        E.length.name: manifest.length,
+        'point_geom': shapely.points(manifest.lon, manifest.lat)
+    }
+    if manifest.has_geometries:
+        columns[E.geom_wgs.name] = manifest.get_geometries()
+    return GeoDataFrame(
+        columns,
+        geometry=E.geom_wgs.name if manifest.has_geometries else 'point_geom',
+        index=manifest.id_ig,
+        crs='EPSG:4326'
+    )
+
+
 def round_coordinates(coords_list: List[tuple], digits=6) -> List[tuple]:
     return [
         (round(coords[0], digits), round(coords[1], digits))
@@ -33,40 +61,222 @@ def round_coordinates(coords_list: List[tuple], digits=6) -> List[tuple]:
     ]
 
 
-def sample_aq_to_point_gdf(
+class PointRasterSampler:
+    """PointRasterSampler samples values of (the first band of) rasters at a fixed set of points,
+    e.g. at the center points of the edges of a graph. The pixel indices (row & col) of the points
+    are computed once for a raster grid and reused for all rasters of the same grid (e.g. hourly
+    AQI rasters), so that sampling a raster is a single array lookup.
+
+    Sampled values are the same as with rasterio's sample method, i.e. points outside the raster
+    get the nodata value of the raster (or 0).
+
+    Attributes:
+        __xs (np.ndarray): X coordinates of the sampling points (rounded to 6 decimals).
+        __ys (np.ndarray): Y coordinates of the sampling points (rounded to 6 decimals).
+        __grid (tuple): The transform, width and height of the raster grid of the pixel indices.
+        __rows (np.ndarray): Row indices of the sampling points in the raster grid.
+        __cols (np.ndarray): Column indices of the sampling points in the raster grid.
+        __inside (np.ndarray): A mask of the sampling points that are inside the raster grid.
+    """
+
+    def __init__(self, coords: List[tuple]):
+        coords = round_coordinates(coords)
+        self.__xs = np.array([x for x, _ in coords], dtype=np.float64)
+        self.__ys = np.array([y for _, y in coords], dtype=np.float64)
+        self.__grid = None
+        self.__rows = None
+        self.__cols = None
+        self.__inside = None
+
+    def __set_pixel_indices(self, raster) -> None:
+        rows, cols = rasterio.transform.rowcol(raster.transform, self.__xs, self.__ys)
+        rows = np.asarray(rows, dtype=np.int64).reshape(-1)
+        cols = np.asarray(cols, dtype=np.int64).reshape(-1)
+        self.__inside = (rows >= 0) & (rows < raster.height) & (cols >= 0) & (cols < raster.width)
+        self.__rows = rows[self.__inside]
+        self.__cols = cols[self.__inside]
+        self.__grid = (raster.transform, raster.width, raster.height)
+
+    def sample(self, raster, outside_value: Union[float, None] = None) -> np.ndarray:
+        """Returns the values of the first band of an (open) raster at the sampling points. Points
+        outside the raster get outside_value (as float) if given.
+        """
+        if self.__grid != (raster.transform, raster.width, raster.height):
+            self.__set_pixel_indices(raster)
+        band = raster.read(1)
+        if outside_value is None:
+            values = np.full(len(self.__xs), raster.nodata or 0, dtype=band.dtype)
+        else:
+            values = np.full(len(self.__xs), outside_value, dtype=np.float64)
+        values[self.__inside] = band[self.__rows, self.__cols]
+        return values
+
+
+@dataclass(frozen=True)
+class MultiPointSampling:
+    """Sampling points placed at (about) regular intervals along the edges of a sampling
+    GeoDataFrame as flat arrays. Points of the i:th edge are at indices offsets[i]:offsets[i + 1].
+    """
+    coords: List[tuple]  # WGS coordinates of the sampling points
+    weights: np.ndarray  # shares of the lengths of the edges represented by the points
+    offsets: np.ndarray  # indices of the first points of the edges
+
+
+def __interpolate_wgs_points(line: LineString, fractions: np.ndarray) -> List[tuple]:
+    """Returns points at the given fractions of the length of a WGS line. Longitudes are scaled by
+    the cosine of the latitude of the line, so that the points are evenly spaced in metres.
+    """
+    x_scale = cos(radians(line.coords[0][1]))
+    scaled_line = LineString([(x * x_scale, y) for x, y in line.coords])
+    points = [scaled_line.interpolate(fraction, normalized=True) for fraction in fractions]
+    return [(point.x / x_scale, point.y) for point in points]
+
+
+def get_multi_point_sampling(
     sampling_gdf: GeoDataFrame,
-    aq_tif_file: str,
-    aq_attr_name: str
+    interval_m: float
+) -> MultiPointSampling:
+    """Places sampling points along the edges of a sampling GeoDataFrame (see
+    get_sampling_point_gdf_from_graph) at the centers of equal length parts of the edges that are
+    at most interval_m long, e.g. edges shorter than interval_m are sampled at the midpoint only.
+    """
+    lengths = np.nan_to_num(sampling_gdf[E.length.name].to_numpy(dtype=np.float64))
+    point_counts = np.maximum(np.ceil(lengths / interval_m), 1).astype(np.int64)
+
+    coords = []
+    for geom, point_count in zip(sampling_gdf[E.geom_wgs.name], point_counts.tolist()):
+        coords.extend(
+            __interpolate_wgs_points(geom, (np.arange(point_count) + 0.5) / point_count)
+        )
+
+    offsets = np.zeros(len(point_counts), dtype=np.int64)
+    offsets[1:] = np.cumsum(point_counts)[:-1]
+    return MultiPointSampling(
+        coords=coords,
+        weights=np.repeat(1 / point_counts, point_counts),
+        offsets=offsets
+    )
+
+
+def get_length_weighted_means(
+    samples: np.ndarray,
+    weights: np.ndarray,
+    offsets: np.ndarray
+) -> np.ndarray:
+    """Returns the length weighted means of the samples of the edges (NaN if an edge has no
+    finite samples). Samples of the i:th edge are at indices offsets[i]:offsets[i + 1].
+    """
+    valid = np.isfinite(samples)
+    valid_weights = np.where(valid, weights, 0.0)
+    weighted_sums = np.add.reduceat(np.where(valid, samples, 0.0) * valid_weights, offsets)
+    weight_sums = np.add.reduceat(valid_weights, offsets)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(weight_sums > 0, weighted_sums / weight_sums, np.nan)
+
+
+class MultiPointRasterSampler:
+    """MultiPointRasterSampler samples raster values at multiple points along each edge (see
+    get_multi_point_sampling) and returns them as length weighted means by edge. Points outside
+    the raster or with nodata value are ignored in the means.
+
+    Attributes:
+        __sampling (MultiPointSampling): The sampling points of the edges.
+        __point_sampler (PointRasterSampler): A raster sampler for the sampling points.
+    """
+
+    def __init__(self, sampling: MultiPointSampling):
+        self.__sampling = sampling
+        self.__point_sampler = PointRasterSampler(sampling.coords)
+
+    def sample(self, raster) -> np.ndarray:
+        """Returns the length weighted means of the values of the first band of an (open)
+        raster by edge.
+        """
+        samples = self.__point_sampler.sample(raster, outside_value=np.nan)
+        if raster.nodata is not None:
+            samples[samples == raster.nodata] = np.nan
+        return get_length_weighted_means(
+            samples, self.__sampling.weights, self.__sampling.offsets
+        )
+
+
+def get_point_raster_sampler(sampling_gdf: GeoDataFrame) -> PointRasterSampler:
+    """Returns a raster sampler for the sampling points (point_geom) of a sampling GeoDataFrame
+    (see get_sampling_point_gdf_from_graph).
+    """
+    return PointRasterSampler([(point.x, point.y) for point in sampling_gdf['point_geom']])
+
+
+def get_raster_sampler(
+    sampling_gdf: GeoDataFrame,
+    interval_m: float = 0
+) -> Union[PointRasterSampler, MultiPointRasterSampler]:
+    """Returns a raster sampler for the edges of a sampling GeoDataFrame. If interval_m is given,
+    the edges are sampled at multiple points (see get_multi_point_sampling), else at the midpoints.
+    """
+    if interval_m:
+        return MultiPointRasterSampler(get_multi_point_sampling(sampling_gdf, interval_m))
+    return get_point_raster_sampler(sampling_gdf)
+
+
+def get_edge_sample_indices(
+    edge_gdf: GeoDataFrame,
+    sampling_gdf: GeoDataFrame,
+    edge_count: int
+) -> np.ndarray:
+    """Returns the (positional) indices of the sampling points of the edges (i.e. of the rows of
+    the sampling GeoDataFrame of unique edge geometries by id_way) by edge ID, or -1 for edges
+    without sampling point. The indices map samples to all edges as merge_edge_aq_samples does.
+    """
+    sample_positions = pd.Series(
+        np.arange(len(sampling_gdf)), index=sampling_gdf[E.id_way.name].to_numpy()
+    )
+    edge_sample_indices = np.full(edge_count, -1, dtype=np.int64)
+    edge_sample_indices[edge_gdf[E.id_ig.name].to_numpy()] = (
+        sample_positions.reindex(edge_gdf[E.id_way.name].to_numpy(), fill_value=-1).to_numpy()
+    )
+    return edge_sample_indices
+
+
+def sample_aq_raster_to_point_gdf(
+    sampling_gdf: GeoDataFrame,
+    aq_raster,
+    aq_attr_name: str,
+    sampler: Union[PointRasterSampler, MultiPointRasterSampler, None] = None
 ) -> GeoDataFrame:
-    """Joins AQI values from an AQI raster file to edges (edge_gdf) of a graph by spatial sampling.
-    Column 'aqi' will be added to the G.edge_gdf. Center points of the edges are used in the
-    spatial join. Exports a csv file of ege keys and corresponding AQI values to use for updating
-    AQI values to a graph.
+    """Joins AQ values from an AQ raster (an opened rasterio dataset or an in-memory
+    aq_processing.AqRaster) to sampling points (e.g. center points of edges) by spatial sampling.
+    Returns a copy of the sampling GeoDataFrame with the sampled values (rounded to two decimals)
+    as column aq_attr_name.
 
     Args:
-        G: A GraphHandler object that has edge_gdf and graph as properties.
-        aqi_tif_name: The filename of an AQI raster (GeoTiff) file (in aqi_cache directory).
-    Todo:
-        Implement more precise join for longer edges.
-    Returns:
-        The name of the exported csv file (e.g. aqi_2019-11-08T14.csv).
+        sampling_gdf: A GeoDataFrame of sampling points (see get_sampling_point_gdf_from_graph).
+        aq_raster: The AQ raster to sample.
+        aq_attr_name: The name of the column for the sampled values (e.g. 'aqi').
+        sampler: A raster sampler for the same sampling GeoDataFrame (see get_raster_sampler),
+            to reuse the pixel indices of the points between rasters (if not given, a sampler of
+            the midpoints of the edges is created).
     """
+    if sampler is None:
+        sampler = get_point_raster_sampler(sampling_gdf)
     gdf = sampling_gdf.copy()
-    aqi_raster = rasterio.open(aq_tif_file)
-    # get coordinates of edge centers as list of tuples
-    coords = [
-        (x, y) for x, y
-        in zip(
-            [point.x for point in gdf['point_geom']],
-            [point.y for point in gdf['point_geom']]
-        )
-    ]
-    coords = round_coordinates(coords)
-    # extract aqi values at coordinates from raster using sample method from rasterio
-    gdf[aq_attr_name] = [round(x.item(), 2) for x in aqi_raster.sample(coords)]
+    gdf[aq_attr_name] = np.round(sampler.sample(aq_raster).astype(np.float64), 2)
     return gdf
 
 
+def sample_aq_to_point_gdf(
+    sampling_gdf: GeoDataFrame,
+    aq_tif_file: str,
+    aq_attr_name: str,
+    sampler: Union[PointRasterSampler, MultiPointRasterSampler, None] = None
+) -> GeoDataFrame:
+    """Joins AQ values from an AQ raster file (GeoTiff) to sampling points by spatial sampling
+    (see sample_aq_raster_to_point_gdf).
+    """
+    with rasterio.open(aq_tif_file) as aq_raster:
+        return sample_aq_raster_to_point_gdf(sampling_gdf, aq_raster, aq_attr_name, sampler)
+
+
 def validate_aqi_sample_df(
     df: DataFrame,
     aqi_attr: str,
@@ -75,14 +285,15 @@ def validate_aqi_sample_df(
     """Validates sampled AQI values. Prints error if invalid values are found
     and returns the dataframe where invalid AQI values are replaced with np.nan.
     """
-    if not validate_aqi_samples(list(df[aqi_attr]), log):
+    aqi_samples = df[aqi_attr].to_numpy()
+    if validate_aqi_samples(aqi_samples, log).invalid_count:
         if log:
             log.error('AQI sampling failed')
 
-    df[aqi_attr] = [get_valid_aqi_or_nan(aqi) for aqi in df[aqi_attr]]
+    df[aqi_attr] = aqi_validation.get_valid_aqis_or_nan(aqi_samples)
 
     sample_count = len(df[aqi_attr])
-    count_valid = len([aqi for aqi in list(df[aqi_attr]) if np.isfinite(aqi)])
+    count_valid = np.count_nonzero(np.isfinite(df[aqi_attr].to_numpy()))
     log.info(f'Found {count_valid} AQI values for {sample_count} points')
 
     return df
@@ -113,63 +324,21 @@ def merge_edge_aq_samples(
     return final_sample_df[[E.id_ig.name, aq_attr]]
 
 
-class AqiValidity(Enum):
-    OK = 0
-    Missing = 1
-    UnderOne = 2
-    UnderZero = 3
-    HigherThan5 = 4
-    WrongType = 5
-
-
-def validate_aqi_exp(aqi: Union[float, Any]) -> AqiValidity:
-    if not isinstance(aqi, float):
-        return AqiValidity.WrongType
-    elif aqi < 0:
-        return AqiValidity.UnderZero
-    elif aqi == 0.0 or not np.isfinite(aqi):
-        return AqiValidity.Missing
-    elif aqi < 0.95:
-        return AqiValidity.UnderOne
-    elif aqi > 5.05:
-        return AqiValidity.HigherThan5
-    else:
-        return AqiValidity.OK
-
-
-def get_valid_aqi_or_nan(aqi: Union[float, Any]):
-    """Returns np.nan for invalid or missing AQI, else returns the AQI.
-    """
-    if validate_aqi_exp(aqi) == AqiValidity.OK:
-        return max(1.0, min(5.0, aqi))
-    else:
-        return np.nan
-
-
 def validate_aqi_samples(
-    aqi_samples: List[Union[float, Any]],
+    aqi_samples: Union[np.ndarray, List[Union[float, Any]]],
     log: Logger = None
-) -> bool:
-    """Validates list of sampled AQI values. Returns True if all AQI values are either missing or valid,
-    else returns False.
+) -> AqiValidationReport:
+    """Validates sampled AQI values at once. Returns a validation report of the numbers of valid,
+    missing and invalid AQI values (by AqiValidity). Logs a warning if invalid values are found.
     """
+    report = aqi_validation.validate_aqis(aqi_samples)
 
-    sample_count = len(aqi_samples)
-    aqi_validities = [validate_aqi_exp(aqi) for aqi in aqi_samples]
-    aqi_ok_count = len(
-        [aqi_v for aqi_v in aqi_validities if aqi_v.value <= AqiValidity.Missing.value]
-    )
+    if report.invalid_count and log:
+        invalid_ratio = round(100 * report.get_ratio(report.invalid_count), 2)
+        log.warning(
+            f'AQI sample count: {report.count} of which has invalid AQI: '
+            f'{report.invalid_count} = {invalid_ratio}  %'
+        )
+        log.warning(f'AQI validities: {report.validity_counts}')
 
-    invalid_count = sample_count - aqi_ok_count
-    if invalid_count:
-        invalid_ratio = round(100 * invalid_count/sample_count, 2)
-        error_counts = Counter(aqi_validities)
-        if log:
-            log.warning(
-                f'AQI sample count: {sample_count} of which has invvalid AQI: '
-                f'{invalid_count} = {invalid_ratio}  %'
-            )
-            log.warning(f'AQI validities: {error_counts}')
-        return False
-
-    return True
+    return report
@@ -1,26 +1,35 @@
+import io
 import logging
 import os
 import boto3
 from datetime import datetime
-from typing import Tuple
+from typing import Dict, Sequence, Tuple, Union
 import aqi_updater.aq_processing as aq_processing
+from aqi_updater.aq_processing import AqRaster
 
 
-def get_current_aqi_tif_name() -> str:
-    return fr"aqi_{datetime.utcnow().strftime('%Y-%m-%dT%H')}.tif"
+def get_aqi_tif_name(dt: datetime) -> str:
+    return fr"aqi_{dt.strftime('%Y-%m-%dT%H')}.tif"
 
 
-def get_current_enfuser_key_filename() -> Tuple[str, str]:
-    """Returns a key pointing to the current (expected) enfuser zip file in AWS S3
+def get_enfuser_key_filename(dt: datetime) -> Tuple[str, str]:
+    """Returns a key pointing to the enfuser zip file of the given (UTC) hour in AWS S3
     bucket. Also returns a name for the zip file for exporting the file. The names of the key
-    and the zip are based on the current UTC time string (e.g. 2019-11-08T11).
+    and the zip are based on the UTC time string (e.g. 2019-11-08T11).
     """
-    curdt = datetime.utcnow().strftime('%Y-%m-%dT%H')
-    enfuser_data_key = fr'Finland/pks/allPollutants_{curdt}.zip'
-    aqi_zip_name = fr'allPollutants_{curdt}.zip'
+    dt_str = dt.strftime('%Y-%m-%dT%H')
+    enfuser_data_key = fr'Finland/pks/allPollutants_{dt_str}.zip'
+    aqi_zip_name = fr'allPollutants_{dt_str}.zip'
     return (enfuser_data_key, aqi_zip_name)
 
 
+def get_current_enfuser_key_filename() -> Tuple[str, str]:
+    """Returns a key pointing to the current (expected) enfuser zip file in AWS S3
+    bucket. Also returns a name for the zip file for exporting the file.
+    """
+    return get_enfuser_key_filename(datetime.utcnow())
+
+
 class AqiFetcher:
     """AqiFetcher handles download, extraction and post processing of air quality index (AQI) data
     from FMI's Enfuser modeling system.
@@ -29,140 +38,151 @@ class AqiFetcher:
         The required Python environment for using the class can be installed with:
         conda env create -f conda-env.yml.
 
-        Essentially, AQI download workflow is composed of the following steps
-        (executed by fetch_process_current_aqi_data()):
-            1)	Create a key for fetching Enfuser data based on current UTC time
+        Essentially, AQI download workflow is composed of the following steps for an hour of AQI
+        data (run by the stages of aqi_pipeline.AqiUpdatePipeline):
+            1)	Create a key for fetching Enfuser data based on the UTC time of the hour
                 (e.g. “allPollutants_2019-11-08T11.zip”).
             2)  Fetch a zip archive that contains Enfuser netCDF data from Amazon S3 bucket using
-                the key, aws_access_key_id and aws_secret_access_key.
-            3)  Extract Enfuser netCDF data (e.g. allPollutants_2019-09-11T15.nc) from the
+                the key, aws_access_key_id and aws_secret_access_key (to memory)
+                (fetch_enfuser_zip()).
+            3)  Read Enfuser netCDF data (e.g. allPollutants_2019-09-11T15.nc) from the
                 downloaded zip archive.
-            4)  Extract AQI layer from the allPollutants*.nc file and export it as GeoTiff (WGS84).
-            5)  Open the exported raster and fill nodata values with interpolated values.
-                Value 1 is considered nodata in the data. This is an optional step.
+            4)  Read AQI layer from the allPollutants*.nc file to an in-memory raster (WGS84),
+                scaled to real AQI values. Layers of other pollutants (e.g. NO2, PM25) are read
+                from the same file at once, if they are set (pollutants).
+            5)  Fill nodata values of the raster with interpolated values.
+                Value 1 is considered nodata in the data. As the nodata areas stay the same from
+                hour to hour, the interpolation is done with a cached nodata fill plan (see
+                aq_processing.AqiNodataFiller).
+            Steps 3-5 are done by process_enfuser_zip().
+
+        The AQI rasters are returned in memory for the AQI updater, so that no files are written
+        in the process. With write_tifs, the AQI rasters are also exported as GeoTiff files (e.g.
+        for debugging), of which the ones of past AQI updates are removed by finish_aqi_fetch().
 
     Attributes:
         log: An instance of Logger class for writing log messages.
-        wip_aqi_tif: The name of an aqi tif file that is currently being produced
-            (wip = work in progress).
-        latest_aqi_tif: The name of the latest AQI tif file that was processed.
+        __nodata_filler (AqiNodataFiller): Fills nodata in the AQI rasters (with a cached plan).
+        __write_tifs (bool): Whether to export the processed AQI rasters also as GeoTiff files.
+        __pollutants (list): The names of the variables (layers) of pollutants to read in addition
+            to AQI from the enfuser data (e.g. NO2, PM25, PM10, O3).
         __aqi_dir: A filepath pointing to a directory where all AQI files will be downloaded
             to and processed.
         __s3_bucketname: The name of the AWS s3 bucket from where the enfuser data will be
             fetched from.
         __s3_region: The name of the AWS s3 bucket from where the enfuser data will be fetched from.
+        __s3_endpoint_url: The URL of a (local) S3 compatible service to use instead of AWS S3.
+        __s3_client: A boto3 S3 client (or a stand-in with method download_fileobj), created
+            when needed if not given at init.
         __AWS_ACCESS_KEY_ID: A secret AWS access key id to enfuser s3 bucket.
         __AWS_SECRET_ACCESS_KEY: A secret AWS access key to enfuser s3 bucket.
-        __temp_files_to_rm (list): A list where names of created temporary files will be collected
-            during processing.
-        __status: The status of the aqi processor - has latest AQI data been processed or not.
 
     """
 
-    def __init__(self, aqi_dir: str):
+    def __init__(
+        self,
+        aqi_dir: str,
+        write_tifs: bool = False,
+        s3_client=None,
+        pollutants: Sequence[str] = ()
+    ):
         self.log = logging.getLogger('aqi_fetcher')
-        self.wip_aqi_tif: str = ''
-        self.latest_aqi_tif: str = ''
+        self.__nodata_filler = aq_processing.AqiNodataFiller(self.log)
+        self.__pollutants = list(pollutants)
+        self.__write_tifs = write_tifs
         self.__aqi_dir = aqi_dir
         self.__s3_bucketname: str = 'enfusernow2'
         self.__s3_region: str = 'eu-central-1'
+        self.__s3_endpoint_url: Union[str, None] = os.getenv('ENFUSER_S3_ENDPOINT_URL', None)
+        self.__s3_client = s3_client
         self.__AWS_ACCESS_KEY_ID: str = os.getenv('ENFUSER_S3_ACCESS_KEY_ID', None)
         self.__AWS_SECRET_ACCESS_KEY: str = os.getenv('ENFUSER_S3_SECRET_ACCESS_KEY', None)
-        self.__temp_files_to_rm: list = []
-        self.__status: str = ''
 
-    def new_aqi_available(self) -> bool:
-        """Returns False if the expected latest aqi file is either already processed or being
-        processed at the moment, else returns True.
+    def fetch_enfuser_zip(self, dt: datetime) -> bytes:
+        """Fetches the enfuser zip file of the given (UTC) hour from S3 (to memory). Raises an
+        exception if the file is not (yet) available.
         """
-        b_available = True
-        status = ''
-        current_aqi_tif = get_current_aqi_tif_name()
-        if self.latest_aqi_tif == current_aqi_tif:
-            status = 'latest AQI data already fetched'
-            b_available = False
-        else:
-            status = f'new AQI data available: {current_aqi_tif}'
-            b_available = True
-
-        if self.__status != status:
-            self.log.info(f'AQI processor status changed to: {status}')
-            self.__status = status
-
-        return b_available
-
-    def fetch_process_current_aqi_data(self) -> None:
-        self.wip_aqi_tif = get_current_aqi_tif_name()
-        enfuser_data_key, aqi_zip_name = get_current_enfuser_key_filename()
-        self.log.info(f'Created key for current AQI: {enfuser_data_key}')
-        self.log.info('Fetching enfuser data...')
-        aqi_zip_name = self.__fetch_enfuser_data(enfuser_data_key, aqi_zip_name)
+        enfuser_data_key, aqi_zip_name = get_enfuser_key_filename(dt)
+        self.log.info(f'Fetching enfuser data: {enfuser_data_key}')
+        aqi_zip = self.__fetch_enfuser_data(enfuser_data_key)
         self.log.info(f'Got aqi_zip: {aqi_zip_name}')
-        aqi_nc_name = aq_processing.extract_zipped_aq_file(
-            self.__aqi_dir, aqi_zip_name, 'allPollutants'
-        )
-        self.__temp_files_to_rm.append(aqi_nc_name)
-        self.log.info(f'Extracted aqi_nc: {aqi_nc_name}')
-        aqi_tif_name = aq_processing.convert_aq_nc_to_tif(self.__aqi_dir, aqi_nc_name)
-        self.log.info(f'Extracted aqi_tif: {aqi_tif_name}')
-        scaled = aq_processing.fix_aqi_tiff_scale_offset(self.__aqi_dir + aqi_tif_name)
-        if scaled:
-            self.log.info(f'Scaled AQI values to real AQI range')
-        na_fill_success = aq_processing.fillna_in_raster(self.__aqi_dir, aqi_tif_name, na_val=1.0)
-        if na_fill_success:
-            self.latest_aqi_tif = aqi_tif_name
-
-    def finish_aqi_fetch(self) -> None:
-        self.__remove_temp_files()
-        self.__remove_old_aqi_tif_files()
-        self.wip_aqi_tif = ''
-
-    def __fetch_enfuser_data(self, enfuser_data_key: str, aqi_zip_name: str) -> str:
-        """Downloads the current enfuser data as a zip file containing multiple netcdf files to the
-        aqi_cache directory.
-
-        Returns:
-            The name of the downloaded zip file (e.g. allPollutants_2019-11-08T14.zip).
+        return aqi_zip
+
+    def process_enfuser_zip(
+        self,
+        dt: datetime,
+        aqi_zip: bytes
+    ) -> Union[Dict[str, AqRaster], None]:
+        """Processes the AQI layer (and the layers of the set pollutants) of an enfuser zip file of
+        the given (UTC) hour to in-memory AQ rasters by the names of the layers, e.g. AQI and NO2.
+        The AQI raster is also exported to a GeoTiff file if write_tifs is set. Returns None if no
+        AQI data was found in the zip file.
         """
-        # connect to S3
-        s3 = boto3.client(
-            's3',
-            region_name=self.__s3_region,
-            aws_access_key_id=self.__AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=self.__AWS_SECRET_ACCESS_KEY
+        aqi_tif_name = get_aqi_tif_name(dt)
+        aqi_nc = aq_processing.read_zipped_aq_nc(aqi_zip, 'allPollutants')
+        if not aqi_nc:
+            self.log.error(f'No AQ data found in the enfuser data for {aqi_tif_name}')
+            return None
+        aqi_nc_name, aqi_nc_bytes = aqi_nc
+        self.log.info(f'Read aqi_nc: {aqi_nc_name}')
+        aq_rasters = aq_processing.read_aq_nc_rasters(
+            aqi_nc_name, aqi_nc_bytes, ['AQI', *self.__pollutants]
         )
+        if 'AQI' not in aq_rasters:
+            self.log.error(f'No AQI layer found in the enfuser data for {aqi_tif_name}')
+            return None
+        missing_pollutants = [name for name in self.__pollutants if name not in aq_rasters]
+        if missing_pollutants:
+            self.log.warning(f'Pollutants missing from {aqi_nc_name}: {missing_pollutants}')
+        aq_rasters['AQI'] = aq_processing.fill_aqi_raster_nodata(
+            aq_rasters['AQI'], na_val=1.0, nodata_filler=self.__nodata_filler
+        )
+        self.log.info(f'Processed AQI raster: {aqi_tif_name}')
+        if self.__write_tifs:
+            aq_processing.write_aq_raster_tif(aq_rasters['AQI'], self.__aqi_dir + aqi_tif_name)
+            self.log.info(f'Exported aqi_tif: {aqi_tif_name}')
+        return aq_rasters
+
+    def finish_aqi_fetch(self, aqi_tif_names: Sequence[str]) -> None:
+        """Removes the exported AQI tif files (if write_tifs is set) other than the ones of the
+        given AQI tif names (i.e. of the hours of the latest AQI update).
+        """
+        if self.__write_tifs:
+            self.__remove_old_aqi_tif_files(aqi_tif_names)
 
-        # download the netcdf file to a specified location
-        file_out = fr'{self.__aqi_dir}/{aqi_zip_name}'
-        s3.download_file(self.__s3_bucketname, enfuser_data_key, file_out)
-        self.__temp_files_to_rm.append(aqi_zip_name)
-        return aqi_zip_name
+    def __fetch_enfuser_data(self, enfuser_data_key: str) -> bytes:
+        """Downloads the current enfuser data as a zip file containing multiple netcdf files
+        (to memory).
 
-    def __remove_temp_files(self) -> None:
-        """Removes temporary files created during AQI processing to aqi_cache, i.e. files in
-        attribute self.__temp_files_to_rm.
+        Returns:
+            The contents of the zip file (e.g. allPollutants_2019-11-08T14.zip).
         """
-        rm_count = 0
-        not_removed = []
-        for rm_filename in self.__temp_files_to_rm:
-            try:
-                os.remove(self.__aqi_dir + rm_filename)
-                rm_count += 1
-            except Exception:
-                not_removed.append(rm_filename)
-                pass
-        self.log.info(f'Removed {rm_count} temp files')
-        if len(not_removed) > 0:
-            self.log.warning(f'Could not remove {len(not_removed)} files')
-        self.__temp_files_to_rm = not_removed
-
-    def __remove_old_aqi_tif_files(self) -> None:
-        """Removes old aqi tif files from aqi_cache.
+        # download the zip file to memory
+        aqi_zip = io.BytesIO()
+        self.__get_s3_client().download_fileobj(self.__s3_bucketname, enfuser_data_key, aqi_zip)
+        return aqi_zip.getvalue()
+
+    def __get_s3_client(self):
+        """Returns the S3 client given at init or a client connected to the enfuser S3 bucket
+        (or to a local S3 compatible service if ENFUSER_S3_ENDPOINT_URL is set).
+        """
+        if not self.__s3_client:
+            self.__s3_client = boto3.client(
+                's3',
+                region_name=self.__s3_region,
+                endpoint_url=self.__s3_endpoint_url,
+                aws_access_key_id=self.__AWS_ACCESS_KEY_ID,
+                aws_secret_access_key=self.__AWS_SECRET_ACCESS_KEY
+            )
+        return self.__s3_client
+
+    def __remove_old_aqi_tif_files(self, keep_tifs: Sequence[str]) -> None:
+        """Removes old aqi tif files from aqi_cache (i.e. other than keep_tifs).
         """
         rm_count = 0
         error_count = 0
         for file_n in os.listdir(self.__aqi_dir):
-            if file_n.endswith('.tif') and file_n != self.latest_aqi_tif:
+            if file_n.endswith('.tif') and file_n not in keep_tifs:
                 try:
                     os.remove(self.__aqi_dir + file_n)
                     rm_count += 1
@@ -0,0 +1,290 @@
+"""
+This module provides a staged pipeline for fetching, processing and sampling AQI data to AQI
+updates. The stages run in their own threads and are connected by queues:
+    1)  Download: fetches the enfuser zip files of the current hour and the forecast hours from S3.
+    2)  Processing: processes the zip files to in-memory AQI rasters (and rasters of other
+        pollutants, if set) (see AqiFetcher).
+    3)  Sampling & export: samples the AQI rasters (and the pollutant rasters of the current hour)
+        to an edge AQI update (see AqiUpdater). After each job, AQI tif files of other hours than
+        the ones of the job are removed (if the fetcher exports them).
+
+Thus, downloading the forecast hours overlaps with processing the current hour and processing
+the last hours overlaps with sampling. Each stage retries failed steps with exponential backoff.
+Fetching the current hour is retried until the data is published (or the next hour begins), but
+fetching and processing forecast hours only a few times, after which the AQI update is created
+with the consecutive forecast hours that were available.
+
+"""
+
+import time
+import queue
+import threading
+import traceback
+from datetime import datetime, timedelta
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, TypeVar, Union
+from aqi_updater.aq_processing import AqRaster
+from aqi_updater.aqi_fetcher import AqiFetcher, get_aqi_tif_name
+from aqi_updater.aqi_updater import AqiUpdater, get_aqi_update_name
+
+
+T = TypeVar('T')
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    max_attempts: Union[int, None]  # None for retrying until stopped
+    initial_delay: float = 5.0  # seconds
+    max_delay: float = 60.0  # seconds
+
+    def get_delay(self, attempt: int) -> float:
+        """Returns the delay (s) after the given failed attempt (1, 2...), doubled after each."""
+        return min(self.initial_delay * 2 ** (attempt - 1), self.max_delay)
+
+
+def retry_with_backoff(
+    log,
+    name: str,
+    fn: Callable[[], T],
+    policy: RetryPolicy,
+    should_stop: Callable[[], bool],
+    wait: Callable[[float], bool]
+) -> Union[T, None]:
+    """Calls fn until it succeeds and returns its result. Failed attempts are retried after
+    exponentially increasing delays until the maximum number of attempts is reached or should_stop
+    returns True, in which case None is returned. Wait(delay) should sleep for the delay and return
+    True if the waiting was interrupted (e.g. the pipeline was stopped).
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return fn()
+        except Exception as e:
+            if policy.max_attempts is not None and attempt >= policy.max_attempts:
+                log.error(f'{name} failed after {attempt} attempts: {e}')
+                return None
+            delay = policy.get_delay(attempt)
+            log.warning(f'{name} failed (attempt {attempt}), retrying in {delay} s: {e}')
+        if wait(delay) or should_stop():
+            return None
+
+
+@dataclass(frozen=True)
+class AqiUpdateJob:
+    dt: datetime  # the (current) UTC hour of the AQI update
+    forecast_hours: int
+    start_time: float = field(default_factory=time.time)
+
+    @property
+    def aqi_tif_name(self) -> str:
+        return get_aqi_tif_name(self.dt)
+
+    def get_hour_dts(self) -> List[datetime]:
+        return [self.dt + timedelta(hours=hour) for hour in range(self.forecast_hours + 1)]
+
+
+@dataclass(frozen=True)
+class AqiHourData:
+    """Data of an hour of an AQI update job passed between the stages of the pipeline. Data
+    without dt marks the end of the hours of the job.
+    """
+    job: AqiUpdateJob
+    dt: Union[datetime, None] = None
+    aqi_zip: Union[bytes, None] = None
+    aq_rasters: Union[Dict[str, AqRaster], None] = None  # by layer name (e.g. AQI, NO2)
+
+
+class AqiUpdatePipeline:
+    """AqiUpdatePipeline creates AQI updates of scheduled hours with staged (threaded) download,
+    processing and sampling of AQI data (see the module docstring).
+
+    Attributes:
+        __fetcher (AqiFetcher): Fetches and processes enfuser data.
+        __updater (AqiUpdater): Samples AQI rasters to edge AQI updates.
+        __forecast_hours (int): The number of forecast hours to include in AQI updates.
+        __current_retry (RetryPolicy): Retry policy for fetching the current hour.
+        __forecast_retry (RetryPolicy): Retry policy for fetching the forecast hours and for
+            processing & sampling.
+        __latest_job (AqiUpdateJob): The latest scheduled job.
+    """
+
+    def __init__(
+        self,
+        log,
+        fetcher: AqiFetcher,
+        updater: AqiUpdater,
+        forecast_hours: int = 0,
+        current_retry: RetryPolicy = RetryPolicy(None, 5.0, 60.0),
+        forecast_retry: RetryPolicy = RetryPolicy(3, 5.0, 60.0)
+    ):
+        self.log = log
+        self.__fetcher = fetcher
+        self.__updater = updater
+        self.__forecast_hours = forecast_hours
+        self.__current_retry = current_retry
+        self.__forecast_retry = forecast_retry
+        self.__latest_job: Union[AqiUpdateJob, None] = None
+        self.__jobs = queue.Queue()
+        self.__zips = queue.Queue()
+        self.__rasters = queue.Queue()
+        self.__stopped = threading.Event()
+        self.__threads = [
+            threading.Thread(target=self.__run_stage, args=(name, stage), daemon=True)
+            for name, stage in (
+                ('download', self.__download),
+                ('processing', self.__process),
+                ('sampling', self.__sample_export)
+            )
+        ]
+
+    def start(self) -> None:
+        for thread in self.__threads:
+            thread.start()
+
+    def stop(self) -> None:
+        self.__stopped.set()
+        for stage_queue in (self.__jobs, self.__zips, self.__rasters):
+            stage_queue.put(None)
+
+    def schedule(self, dt: datetime) -> bool:
+        """Schedules an AQI update of the (UTC) hour of dt, unless it is already scheduled or
+        done. Returns True if a new AQI update job was scheduled.
+        """
+        dt = dt.replace(minute=0, second=0, microsecond=0)
+        if self.__latest_job and self.__latest_job.dt == dt:
+            return False
+        if self.__updater.latest_aqi_update == get_aqi_update_name(get_aqi_tif_name(dt)):
+            return False
+        self.__latest_job = AqiUpdateJob(dt, self.__forecast_hours)
+        self.__jobs.put(self.__latest_job)
+        self.log.info(f'Scheduled AQI update: {self.__latest_job.aqi_tif_name}')
+        return True
+
+    def __run_stage(self, name: str, stage: Callable[[], bool]) -> None:
+        """Runs a stage until the pipeline is stopped. Unexpected errors are logged, so that a
+        failing job does not stop the pipeline.
+        """
+        while not self.__stopped.is_set():
+            try:
+                if not stage():
+                    return
+            except Exception:
+                self.log.error(f'Error in AQI {name} stage: {traceback.format_exc()}')
+
+    def __unschedule(self, job: AqiUpdateJob) -> None:
+        """Allows scheduling the hour of a failed job again (if no newer job is scheduled)."""
+        if self.__latest_job is job:
+            self.__latest_job = None
+
+    def __is_outdated(self, job: AqiUpdateJob) -> bool:
+        return self.__stopped.is_set() or self.__latest_job is not job
+
+    def __download(self) -> bool:
+        job: AqiUpdateJob = self.__jobs.get()
+        if job is None:
+            return False
+        try:
+            for hour, dt in enumerate(job.get_hour_dts()):
+                if hour > 0 and self.__is_outdated(job):
+                    break
+                aqi_zip = retry_with_backoff(
+                    self.log,
+                    f'Fetching AQI data for {get_aqi_tif_name(dt)}',
+                    lambda: self.__fetcher.fetch_enfuser_zip(dt),
+                    self.__current_retry if hour == 0 else self.__forecast_retry,
+                    # retry fetching the current hour only until the next hour is scheduled
+                    lambda: self.__is_outdated(job) if hour == 0 else self.__stopped.is_set(),
+                    self.__stopped.wait
+                )
+                if aqi_zip is None:
+                    break
+                self.__zips.put(AqiHourData(job, dt, aqi_zip=aqi_zip))
+        finally:
+            self.__zips.put(AqiHourData(job))
+        return True
+
+    def __process(self) -> bool:
+        data: AqiHourData = self.__zips.get()
+        if data is None:
+            return False
+        if data.dt is None:
+            self.__rasters.put(data)
+            return True
+        aq_rasters = retry_with_backoff(
+            self.log,
+            f'Processing AQI data for {get_aqi_tif_name(data.dt)}',
+            lambda: self.__fetcher.process_enfuser_zip(data.dt, data.aqi_zip),
+            self.__forecast_retry,
+            self.__stopped.is_set,
+            self.__stopped.wait
+        )
+        if aq_rasters is not None:
+            self.__rasters.put(AqiHourData(data.job, data.dt, aq_rasters=aq_rasters))
+        return True
+
+    def __sample_export(self) -> bool:
+        aq_rasters: Dict[datetime, Dict[str, AqRaster]] = {}
+        while True:
+            data: AqiHourData = self.__rasters.get()
+            if data is None:
+                return False
+            if data.dt is None:
+                break
+            aq_rasters[data.dt] = data.aq_rasters
+
+        job = data.job
+        try:
+            self.__create_aqi_update(job, aq_rasters)
+        finally:
+            # remove AQI tif files (if exported) of the hours of previous jobs
+            self.__fetcher.finish_aqi_fetch([get_aqi_tif_name(dt) for dt in job.get_hour_dts()])
+        return True
+
+    def __create_aqi_update(
+        self,
+        job: AqiUpdateJob,
+        aq_rasters: Dict[datetime, Dict[str, AqRaster]]
+    ) -> None:
+        if job.dt not in aq_rasters:
+            self.log.error(f'No AQI data for {job.aqi_tif_name}, skipping AQI update')
+            self.__unschedule(job)
+            return
+
+        # include forecast hours until the first missing hour
+        forecast_aqi_tifs = []
+        for dt in job.get_hour_dts()[1:]:
+            if dt not in aq_rasters:
+                break
+            forecast_aqi_tifs.append(get_aqi_tif_name(dt))
+        aqi_rasters_by_tif = {
+            get_aqi_tif_name(dt): rasters['AQI'] for dt, rasters in aq_rasters.items()
+        }
+        # other pollutants are sampled only for the current hour
+        pollutant_rasters = {
+            name: raster for name, raster in aq_rasters[job.dt].items() if name != 'AQI'
+        }
+
+        def create_aqi_update():
+            try:
+                self.__updater.create_aqi_update(
+                    job.aqi_tif_name, forecast_aqi_tifs, aqi_rasters_by_tif, pollutant_rasters
+                )
+            finally:
+                self.__updater.finish_aqi_update()
+
+        done = retry_with_backoff(
+            self.log,
+            f'Creating AQI update from {job.aqi_tif_name}',
+            lambda: create_aqi_update() or True,
+            self.__forecast_retry,
+            self.__stopped.is_set,
+            self.__stopped.wait
+        )
+        if done:
+            self.log.info(
+                f'AQI update from {job.aqi_tif_name} succeeded in '
+                f'{round(time.time() - job.start_time, 1)} s'
+            )
+        else:
+            self.__unschedule(job)
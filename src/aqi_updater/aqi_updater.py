@@ -1,104 +1,284 @@
 import logging
 from common.igraph import Edge as E
-from math import floor
+from datetime import datetime, timezone
 import os
 import numpy as np
-import json
 import geopandas as gpd
+import igraph as ig
+from typing import Dict, Sequence, Tuple, Union
+import common.edge_array_file as edge_array_file
+import common.aqi_update_manifest as aqi_manifest
+import common.aqi_map_data as aqi_map_data
+import common.sampling_manifest as sampling_manifest
+from common.aqi_coeffs import get_aqi_coeffs
+from common.sampling_manifest import SamplingManifest
 import aqi_updater.aq_sampling as aq_sampling
+from aqi_updater.aq_processing import AqRaster
 
 
-def get_aqi_csv_name(aqi_tif_name: str) -> str:
-    return aqi_tif_name.replace('.tif', '.csv')
+def get_aqi_update_name(aqi_tif_name: str) -> str:
+    return aqi_tif_name.replace('.tif', '.bin')
 
 
-def get_aqi_class(aqi: float):
-    """Returns AQI class identifier, that is in the range from 1 to 9. Returns 0 if the given AQI
-    is invalid. AQI classes represent (9 x) 0.5 intervals in the original AQI scale from 1.0 to 5.0.
-    Class ranges are 1: 1.0-1.5, 2: 1.5-2.0, 3: 2.0-2.5 etc.
+def get_aqi_map_name(aqi_update_name: str) -> str:
+    """Returns the name of the AQI map data file of an AQI update, e.g. aqi_map_2020-10-10T08.json
+    for aqi_2020-10-10T08.bin. As the map data files are named by the AQI updates, the map data of
+    the AQI update of the manifest is never overwritten by an unfinished AQI update.
     """
-    return floor(aqi * 2) - 1 if np.isfinite(aqi) else 0
+    return aqi_update_name.replace('aqi_', 'aqi_map_', 1).replace('.bin', '.json')
+
+
+def get_aqi_map_delta_name(aqi_update_name: str) -> str:
+    """Returns the name of the AQI map delta file of an AQI update, e.g.
+    aqi_map_delta_2020-10-10T08.json for aqi_2020-10-10T08.bin.
+    """
+    return aqi_update_name.replace('aqi_', 'aqi_map_delta_', 1).replace('.bin', '.json')
+
+
+def get_aqi_data_time(aqi_tif_name: str) -> int:
+    """Returns the UTC time of AQI data as unix time (s) from the name of the AQI file
+    (e.g. aqi_2020-10-10T08.tif).
+    """
+    dt = datetime.strptime(aqi_tif_name.split('aqi_', 1)[1].split('.')[0], '%Y-%m-%dT%H')
+    return int(dt.replace(tzinfo=timezone.utc).timestamp())
+
+
+def get_forecast_aqi_coeff_band_name(hour: int) -> str:
+    """Returns the name of the band of AQ cost coefficients of a forecast hour (i.e. hours after
+    the time of the AQI update) in edge AQI update files, e.g. aqi_coeff_1h.
+    """
+    return f'aqi_coeff_{hour}h'
+
+
+def get_pollutant_band_name(pollutant: str) -> str:
+    """Returns the name of the band of sampled pollutant values (e.g. of NO2) in edge AQI update
+    files, e.g. no2.
+    """
+    return pollutant.lower()
 
 
 class AqiUpdater():
+    """AqiUpdater samples AQI to the edges of a graph and exports the sampled AQI as edge AQI
+    updates. The edges to sample are given either as the graph or as a sampling manifest of it
+    (see common.sampling_manifest), with which the graph does not need to be read at all.
+    """
 
-    def __init__(self, graph, aqi_cache: str, aqi_updates_dir: str):
+    def __init__(
+        self,
+        graph: Union[ig.Graph, SamplingManifest],
+        aqi_cache: str,
+        aqi_updates_dir: str,
+        sampling_interval_m: float = 0
+    ):
         self.log = logging.getLogger('aqi_updater')
-        self.latest_aqi_csv: str = ''
-        self.__wip_aqi_csv: str = ''
-        self.__edge_gdf = aq_sampling.get_sampling_point_gdf_from_graph(graph)
+        self.latest_aqi_update: str = ''
+        self.__wip_aqi_update: str = ''
+        manifest = (
+            graph if isinstance(graph, SamplingManifest)
+            else sampling_manifest.get_sampling_manifest(graph)
+        )
+        self.__graph_fingerprint = manifest.graph_fingerprint
+        self.__edge_count = manifest.edge_count
+        self.__edge_gdf = aq_sampling.get_sampling_point_gdf_from_manifest(manifest)
         self.__sampling_gdf = self.__edge_gdf.drop_duplicates(E.id_way.name)
+        # pixel indices of the sampling points are reused for all AQI rasters (of the same grid);
+        # with sampling interval, AQI of the edges is sampled at multiple points along the edges
+        self.__sampler = aq_sampling.get_raster_sampler(self.__sampling_gdf, sampling_interval_m)
+        self.__edge_sample_indices = aq_sampling.get_edge_sample_indices(
+            self.__edge_gdf, self.__sampling_gdf, self.__edge_count
+        )
         self.__aqi_cache = aqi_cache
         self.__aqi_updates_dir = aqi_updates_dir
-        self.__status = ''
+        # the version (name of the AQI update) and the AQI classes by id_way of the latest AQI map
+        self.__latest_aqi_map: Union[Tuple[str, np.ndarray], None] = None
+
+    def create_aqi_update(
+        self,
+        aqi_tif_name: str,
+        forecast_aqi_tif_names: Sequence[str] = (),
+        aqi_rasters: Union[Dict[str, AqRaster], None] = None,
+        pollutant_rasters: Union[Dict[str, AqRaster], None] = None
+    ) -> None:
+        """Samples AQI to the edges of the graph from the AQI raster and exports the AQI values
+        and AQ cost coefficients as binary edge AQI update (see common.edge_array_file) for the
+        graph, e.g. aqi_2020-10-10T08.bin. The update is written once to the shared aqi_updates
+        directory, from which all workers of the green path server map it.
 
-    def new_update_available(self, latest_aqi_tif_name: str) -> bool:
-        """Returns False if the expected latest aqi file is either already processed or being
-        processed at the moment, else returns True.
+        AQ cost coefficients of the following (forecast) hours are sampled from the forecast AQI
+        rasters (if given) and exported as additional bands (e.g. aqi_coeff_1h) of the update.
+
+        AQI rasters are sampled from memory if they are given in aqi_rasters (by the names of the
+        AQI tifs, see AqiFetcher), else from the AQI tif files in the aqi_cache directory.
+
+        Rasters of other pollutants of the hour (e.g. NO2 in pollutant_rasters by the names of the
+        enfuser layers) are sampled with the same sampler and exported as additional bands of
+        the update (e.g. no2), so that all AQ data of the edges is in one file.
+
+        Finally, the AQI update manifest is replaced with one pointing to the new update, which
+        notifies the green path server about the new AQI data.
         """
-        b_available = True
-        status = ''
-        if self.latest_aqi_csv == get_aqi_csv_name(latest_aqi_tif_name):
-            status = 'Latest AQI update already done'
-            b_available = False
-        else:
-            status = f'New AQI update available: {latest_aqi_tif_name}'
-            b_available = True
-
-        if self.__status != status:
-            self.log.info(f'AQI updater status changed to: {status}')
-            self.__status = status
-
-        return b_available
-
-    def create_aqi_update_csv(self, aqi_tif_name: str) -> None:
-        self.__wip_aqi_csv = get_aqi_csv_name(aqi_tif_name)
-        aqi_tif_file = fr'{self.__aqi_cache}{aqi_tif_name}'
-        aqi_sample_df = aq_sampling.sample_aq_to_point_gdf(
-            self.__sampling_gdf,
-            aqi_tif_file,
-            'aqi'
+        self.__wip_aqi_update = get_aqi_update_name(aqi_tif_name)
+        aqi_rasters = aqi_rasters or {}
+        aqi_sample_df = self.__sample_aqi(aqi_tif_name, aqi_rasters)
+        # export sampled AQI values to json for AQI map (and the changes since the previous map)
+        aqi_map, aqi_map_name, aqi_map_delta_name = self.__export_aqi_map_json(aqi_sample_df)
+        # export sampled AQI values as dense array by edge ID (NaN for edges without AQI)
+        edge_aqis = self.__get_edge_aqi_array(aqi_sample_df)
+        bands = {E.aqi.value: edge_aqis, 'aqi_coeff': get_aqi_coeffs(edge_aqis)}
+
+        data_time = get_aqi_data_time(aqi_tif_name)
+        for forecast_aqi_tif_name in forecast_aqi_tif_names:
+            hour = (get_aqi_data_time(forecast_aqi_tif_name) - data_time) // 3600
+            forecast_edge_aqis = self.__get_edge_aqi_array(
+                self.__sample_aqi(forecast_aqi_tif_name, aqi_rasters)
+            )
+            bands[get_forecast_aqi_coeff_band_name(hour)] = get_aqi_coeffs(forecast_edge_aqis)
+
+        for pollutant, raster in (pollutant_rasters or {}).items():
+            bands[get_pollutant_band_name(pollutant)] = self.__get_edge_sample_array(raster)
+
+        edge_array_file.write_edge_array_file(
+            fr'{self.__aqi_updates_dir}{self.__wip_aqi_update}',
+            bands,
+            graph_fingerprint=self.__graph_fingerprint,
+            data_time=data_time
+        )
+        self.log.info(
+            f'Exported edge AQI update: {self.__wip_aqi_update} '
+            f'(with {len(forecast_aqi_tif_names)} forecast hours and '
+            f'{len(pollutant_rasters or {})} pollutants)'
         )
-        aqi_sample_df = aq_sampling.validate_aqi_sample_df(aqi_sample_df, 'aqi', self.log)
-        # export sampled AQI values to json for AQI map
-        self.__export_aqi_map_json(aqi_sample_df)
-        # export sampled AQI values to csv
+        aqi_manifest.write_manifest(
+            self.__aqi_updates_dir,
+            aqi_manifest.AqiUpdateManifest(
+                aqi_update=self.__wip_aqi_update,
+                aqi_map=aqi_map_name,
+                data_time=data_time,
+                aqi_map_delta=aqi_map_delta_name
+            )
+        )
+        self.latest_aqi_update = self.__wip_aqi_update
+        self.__latest_aqi_map = aqi_map
+
+    def __sample_aqi(
+        self,
+        aqi_tif_name: str,
+        aqi_rasters: Dict[str, AqRaster]
+    ) -> gpd.GeoDataFrame:
+        if aqi_tif_name in aqi_rasters:
+            aqi_sample_df = aq_sampling.sample_aq_raster_to_point_gdf(
+                self.__sampling_gdf,
+                aqi_rasters[aqi_tif_name],
+                'aqi',
+                self.__sampler
+            )
+        else:
+            aqi_sample_df = aq_sampling.sample_aq_to_point_gdf(
+                self.__sampling_gdf,
+                fr'{self.__aqi_cache}{aqi_tif_name}',
+                'aqi',
+                self.__sampler
+            )
+        return aq_sampling.validate_aqi_sample_df(aqi_sample_df, 'aqi', self.log)
+
+    def __get_edge_aqi_array(self, aqi_sample_df: gpd.GeoDataFrame) -> np.ndarray:
+        """Returns sampled AQI values of all edges as an array by edge ID (NaN for edges without
+        AQI).
+        """
         final_edge_aqi_samples = aq_sampling.merge_edge_aq_samples(
             self.__edge_gdf,
             aqi_sample_df,
             'aqi',
             self.log
         )
-        final_edge_aqi_samples.to_csv(fr'{self.__aqi_updates_dir}{self.__wip_aqi_csv}', index=False)
-        self.log.info(f'Exported edge_aqi_csv: {self.__wip_aqi_csv}')
-        self.latest_aqi_csv = self.__wip_aqi_csv
+        edge_aqis = np.full(self.__edge_count, np.nan)
+        edge_aqis[final_edge_aqi_samples[E.id_ig.name].to_numpy()] = (
+            final_edge_aqi_samples['aqi'].to_numpy()
+        )
+        return edge_aqis
+
+    def __get_edge_sample_array(self, raster: AqRaster) -> np.ndarray:
+        """Returns values sampled from a raster of a pollutant as an array by edge ID (NaN for
+        edges without sampling point or value, as the nodata of the raster is NaN).
+        """
+        samples = self.__sampler.sample(raster).astype(np.float64)
+        return np.where(
+            self.__edge_sample_indices >= 0, samples[self.__edge_sample_indices], np.nan
+        )
 
     def finish_aqi_update(self) -> None:
-        self.__wip_aqi_csv = ''
+        self.__wip_aqi_update = ''
         self.__remove_old_update_files()
 
-    def __export_aqi_map_json(self, sample_gdf: gpd.GeoDataFrame):
-        gdf = sample_gdf[[E.id_way.name, 'aqi']].copy()
-        gdf = gdf[gdf['aqi'].notnull()]
-        gdf['aqi_class'] = [get_aqi_class(aqi) for aqi in gdf['aqi']]
-        id_aqi_pairs = list(zip(gdf[E.id_way.name].tolist(), gdf['aqi_class'].tolist()))
-        with open(self.__aqi_updates_dir + 'aqi_map.json', 'w') as json_file:
-            json.dump({'data': id_aqi_pairs}, json_file, separators=(',', ':'))
-        self.log.info(f'Exported current AQI for map: {self.__aqi_updates_dir}aqi_map.json')
+    def __export_aqi_map_json(
+        self,
+        sample_gdf: gpd.GeoDataFrame
+    ) -> Tuple[Tuple[str, np.ndarray], str, Union[str, None]]:
+        """Exports the AQI classes of the edges (by id_way) as AQI map data (see
+        common.aqi_map_data) and the changes in them since the previous AQI update as a delta file
+        (if the previous AQI map was created by this updater), named by the AQI update. Returns
+        the version and AQI classes by id_way of the new AQI map and the names of the map data
+        file and the delta file (or None).
+        """
+        aqis = sample_gdf['aqi'].to_numpy(dtype=np.float64)
+        has_aqi = ~np.isnan(aqis)
+        ids = sample_gdf[E.id_way.name].to_numpy()[has_aqi]
+        aqi_classes = aqi_map_data.get_aqi_classes(aqis[has_aqi])
+        version = self.__wip_aqi_update
+        aqi_map_name = get_aqi_map_name(version)
+        aqi_map_data.write_aqi_map_data(
+            self.__aqi_updates_dir + aqi_map_name, ids, aqi_classes, version
+        )
+        self.log.info(f'Exported current AQI for map: {self.__aqi_updates_dir}{aqi_map_name}')
+
+        aqi_classes_by_id = aqi_map_data.get_aqi_classes_by_id(
+            np.column_stack((ids, aqi_classes))
+        )
+        if not self.__latest_aqi_map:
+            return (version, aqi_classes_by_id), aqi_map_name, None
+
+        prev_version, prev_aqi_classes_by_id = self.__latest_aqi_map
+        changed, removed = aqi_map_data.get_aqi_class_changes(
+            prev_aqi_classes_by_id, aqi_classes_by_id
+        )
+        aqi_map_delta_name = get_aqi_map_delta_name(version)
+        aqi_map_data.write_aqi_map_delta(
+            self.__aqi_updates_dir + aqi_map_delta_name,
+            aqi_map_data.get_delta(changed, removed, prev_version, version)
+        )
+        self.log.info(
+            f'Exported AQI map changes since {prev_version}: {len(changed)} changed and '
+            f'{len(removed)} removed AQI classes'
+        )
+        return (version, aqi_classes_by_id), aqi_map_name, aqi_map_delta_name
 
     def __remove_old_update_files(self) -> None:
-        """Removes all edge_aqi_csv files older than the latest from from __aqi_updates_dir folder.
+        """Removes all edge AQI update files (and legacy csv files) and AQI map data files older
+        than the latest from __aqi_updates_dir folder. AQI map data files are removed only if there
+        is a latest AQI update (as the manifest of a previous run may still point to them).
         """
         rm_count = 0
         errors = 0
+        latest_aqi_map_files = None
+        if self.latest_aqi_update:
+            latest_aqi_map_files = [
+                get_aqi_map_name(self.latest_aqi_update),
+                get_aqi_map_delta_name(self.latest_aqi_update)
+            ]
         for file_n in os.listdir(self.__aqi_updates_dir):
-            if file_n.endswith('.csv') and file_n != self.latest_aqi_csv:
+            is_old_update = file_n.endswith(('.bin', '.csv')) and file_n != self.latest_aqi_update
+            is_old_aqi_map = (
+                latest_aqi_map_files is not None
+                and file_n.startswith('aqi_map_') and file_n.endswith('.json')
+                and file_n not in latest_aqi_map_files
+            )
+            if is_old_update or is_old_aqi_map:
                 try:
                     os.remove(self.__aqi_updates_dir + file_n)
                     rm_count += 1
                 except Exception:
                     errors += 1
                     pass
-        self.log.info(f'Removed {rm_count} old edge aqi csv files')
+        self.log.info(f'Removed {rm_count} old edge aqi update files')
         if errors:
-            self.log.warning(f'Could not remove {errors} old edge aqi csv files')
+            self.log.warning(f'Could not remove {errors} old edge aqi update files')
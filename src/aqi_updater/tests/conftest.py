@@ -13,8 +13,9 @@ aqi_updates_dir = r'aqi_updater/tests/test_aqi_updates/'
 def reset_test_files():
 
     temp_test_aqi_updates = [
-        'aqi_2020-10-10T08.csv',
-        'aqi_map.json'
+        'aqi_2020-10-10T08.bin',
+        'aqi_map.json',
+        'aqi_update_manifest.json'
     ]
 
     for fn in temp_test_aqi_updates:
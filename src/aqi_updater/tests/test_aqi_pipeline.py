@@ -0,0 +1,161 @@
+import os
+import time
+import logging
+import pytest
+from datetime import datetime
+from aqi_updater.aqi_fetcher import AqiFetcher, get_enfuser_key_filename
+from aqi_updater.aqi_pipeline import AqiUpdatePipeline, RetryPolicy, retry_with_backoff
+from aqi_updater.tests.conftest import test_data_dir
+
+
+log = logging.getLogger('test_aqi_pipeline')
+aqi_dt = datetime(2021, 2, 26, 14, 25)
+fast_retry = RetryPolicy(None, 0.01, 0.01)
+fast_forecast_retry = RetryPolicy(2, 0.01, 0.01)
+
+
+class FakeS3Client:
+    """A local stand-in for the enfuser S3 bucket (boto3 S3 client) serving objects by key."""
+
+    def __init__(self):
+        self.objects = {}
+        self.requested_keys = []
+
+    def download_fileobj(self, bucket: str, key: str, fileobj) -> None:
+        self.requested_keys.append(key)
+        if key not in self.objects:
+            raise FileNotFoundError(f'NoSuchKey: {key}')
+        fileobj.write(self.objects[key])
+
+
+class RecordingAqiUpdater:
+    """Records the AQI updates that the pipeline would create (instead of sampling AQI)."""
+
+    def __init__(self):
+        self.latest_aqi_update = ''
+        self.updates = []
+
+    def create_aqi_update(
+        self, aqi_tif_name, forecast_aqi_tif_names, aqi_rasters, pollutant_rasters=None
+    ) -> None:
+        self.updates.append(
+            (aqi_tif_name, list(forecast_aqi_tif_names), aqi_rasters, pollutant_rasters)
+        )
+
+    def finish_aqi_update(self) -> None:
+        pass
+
+
+@pytest.fixture
+def s3_client():
+    s3_client = FakeS3Client()
+    with open(f'{test_data_dir}allPollutants_2021-02-26T14.zip', 'rb') as f:
+        s3_client.objects[get_enfuser_key_filename(aqi_dt)[0]] = f.read()
+    return s3_client
+
+
+def run_pipeline(
+    s3_client,
+    forecast_hours: int,
+    on_started=None,
+    fetcher: AqiFetcher = None
+) -> RecordingAqiUpdater:
+    updater = RecordingAqiUpdater()
+    pipeline = AqiUpdatePipeline(
+        log,
+        fetcher or AqiFetcher(test_data_dir, s3_client=s3_client),
+        updater,
+        forecast_hours=forecast_hours,
+        current_retry=fast_retry,
+        forecast_retry=fast_forecast_retry
+    )
+    pipeline.start()
+    try:
+        assert pipeline.schedule(aqi_dt)
+        assert not pipeline.schedule(aqi_dt)
+        if on_started:
+            on_started()
+        for _ in range(200):
+            if updater.updates:
+                break
+            time.sleep(0.05)
+    finally:
+        pipeline.stop()
+    return updater
+
+
+def test_retries_with_backoff_until_success():
+    results = iter([ValueError('not yet'), ValueError('not yet'), 'ok'])
+    delays = []
+
+    def fn():
+        result = next(results)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def wait(delay):
+        delays.append(delay)
+        return False
+
+    result = retry_with_backoff(
+        log, 'test', fn, RetryPolicy(None, 1.0, 1.5), lambda: False, wait
+    )
+    assert result == 'ok'
+    assert delays == [1.0, 1.5]
+
+
+def test_stops_retrying_after_max_attempts():
+    def fn():
+        raise ValueError('never')
+
+    result = retry_with_backoff(
+        log, 'test', fn, RetryPolicy(3, 0.0, 0.0), lambda: False, lambda delay: False
+    )
+    assert result is None
+
+
+def test_creates_aqi_update_from_fake_s3(s3_client):
+    updater = run_pipeline(s3_client, forecast_hours=2)
+    assert len(updater.updates) == 1
+    aqi_tif_name, forecast_aqi_tif_names, aqi_rasters, pollutant_rasters = updater.updates[0]
+    assert aqi_tif_name == 'aqi_2021-02-26T14.tif'
+    # forecast hours are not available in the fake S3
+    assert forecast_aqi_tif_names == []
+    assert list(aqi_rasters.keys()) == ['aqi_2021-02-26T14.tif']
+    assert aqi_rasters[aqi_tif_name].band.max() > 1.0
+    assert pollutant_rasters == {}
+    # the first forecast hour is retried & the next one is not fetched
+    assert s3_client.requested_keys == [
+        'Finland/pks/allPollutants_2021-02-26T14.zip',
+        'Finland/pks/allPollutants_2021-02-26T15.zip',
+        'Finland/pks/allPollutants_2021-02-26T15.zip'
+    ]
+
+
+def test_retries_fetching_aqi_until_published(s3_client):
+    key = get_enfuser_key_filename(aqi_dt)[0]
+    aqi_zip = s3_client.objects.pop(key)
+
+    def publish_aqi():
+        time.sleep(0.2)
+        s3_client.objects[key] = aqi_zip
+
+    updater = run_pipeline(s3_client, forecast_hours=0, on_started=publish_aqi)
+    assert [update[0] for update in updater.updates] == ['aqi_2021-02-26T14.tif']
+    assert s3_client.requested_keys.count(key) > 2
+
+
+def test_removes_aqi_tifs_of_previous_updates(s3_client, tmp_path):
+    aqi_dir = str(tmp_path) + '/'
+    with open(f'{aqi_dir}aqi_2021-02-26T13.tif', 'wb'):
+        pass
+    fetcher = AqiFetcher(aqi_dir, write_tifs=True, s3_client=s3_client)
+    updater = run_pipeline(s3_client, forecast_hours=0, fetcher=fetcher)
+    assert [update[0] for update in updater.updates] == ['aqi_2021-02-26T14.tif']
+    # the cleanup runs after the update
+    for _ in range(100):
+        if os.listdir(aqi_dir) == ['aqi_2021-02-26T14.tif']:
+            break
+        time.sleep(0.02)
+    assert os.listdir(aqi_dir) == ['aqi_2021-02-26T14.tif']
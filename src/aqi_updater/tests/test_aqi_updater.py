@@ -1,12 +1,17 @@
+import os
+import shutil
 import pytest
 from aqi_updater import aq_processing
+from aqi_updater import aq_sampling
 from aqi_updater.aqi_updater import AqiUpdater
 from common.igraph import Edge as E
 from aqi_updater.tests.conftest import test_data_dir, aqi_updates_dir
 import common.igraph as ig_utils
+import common.edge_array_file as edge_array_file
+import common.aqi_update_manifest as aqi_manifest
+import common.sampling_manifest as sampling_manifest
 import rasterio
 import numpy as np
-import pandas as pd
 import json
 
 
@@ -19,7 +24,7 @@ def graph():
 @pytest.fixture(scope='module', autouse=True)
 def aqi_updater(graph):
     aqi_updater = AqiUpdater(graph, test_data_dir, aqi_updates_dir)
-    aqi_updater.create_aqi_update_csv('aqi_2020-10-10T08.tif')
+    aqi_updater.create_aqi_update('aqi_2020-10-10T08.tif')
     aqi_updater.finish_aqi_update()
     yield aqi_updater
 
@@ -82,29 +87,223 @@ def test_fills_na_values_in_aqi_raster():
     assert nodata_count == 0
 
 
-def test_creates_aqi_update_csv(aqi_updater):
-    assert aqi_updater.latest_aqi_csv == 'aqi_2020-10-10T08.csv'
-    aqi_update_df = pd.read_csv(fr'{aqi_updates_dir}aqi_2020-10-10T08.csv')
-    assert len(aqi_update_df) == 16469
+def test_reads_aqi_nc_from_zip_to_memory_as_processed_aqi_tif():
+    aq_nc = aq_processing.read_zipped_aq_nc(
+        f'{test_data_dir}allPollutants_2021-02-26T14.zip', 'allPollutants'
+    )
+    assert aq_nc[0] == 'allPollutants_2021-02-26T14.nc'
+    aqi_raster = aq_processing.fill_aqi_raster_nodata(
+        aq_processing.read_aqi_nc_raster(*aq_nc), na_val=1.0
+    )
+    assert np.sum(aqi_raster.band <= 1.0) == 0
+    # the same AQI as converted, scaled & filled to a tif by the previous tests
+    with rasterio.open(test_data_dir + 'aqi_2021-02-26T14.tif') as aqi_tif:
+        assert aqi_tif.transform == aqi_raster.transform
+        assert np.array_equal(aqi_tif.read(1), aqi_raster.read(1))
 
 
-def test_aqi_update_csv_aqi_values_are_valid():
-    aqi_update_df = pd.read_csv(fr'{aqi_updates_dir}aqi_2020-10-10T08.csv')
-    assert aqi_update_df[E.id_ig.name].nunique() == 16469
-    assert round(aqi_update_df[E.aqi.name].mean(), 3) == 1.684
-    assert aqi_update_df[E.aqi.name].median() == 1.67
-    assert aqi_update_df[E.aqi.name].min() == 1.63
-    assert aqi_update_df[E.aqi.name].max() == 2.04
-    assert aqi_update_df[E.id_ig.name].nunique() == 16469
-    not_null_aqis = aqi_update_df[aqi_update_df[E.aqi.name].notnull()]
-    assert len(not_null_aqis) == 16469
+def test_fills_aqi_nodata_by_fill_plan_as_fillnodata():
+    aqi_raster = aq_processing.read_aqi_nc_raster(*aq_processing.read_zipped_aq_nc(
+        f'{test_data_dir}allPollutants_2021-02-26T14.zip', 'allPollutants'
+    ))
+    nodata_mask = aq_processing.get_aqi_nodata_mask(aqi_raster.band, na_val=1.0)
+    fill_plan = aq_processing.get_nodata_fill_plan(nodata_mask)
+    # another hour with the same nodata mask
+    aqi_band = aqi_raster.band.copy()
+    aqi_band[~nodata_mask] = np.random.default_rng(1).uniform(1.5, 4.0, np.sum(~nodata_mask))
+    for band in (aqi_raster.band, aqi_band):
+        assert np.array_equal(
+            fill_plan.fill(band), aq_processing.fill_aqi_nodata(band.copy(), na_val=1.0)
+        )
+
+
+def test_refills_aqi_nodata_if_nodata_mask_changes():
+    rng = np.random.default_rng(1)
+    nodata_filler = aq_processing.AqiNodataFiller()
+    # two hours with a nodata area & two hours with another one
+    for nodata_cells in ((slice(0, 20), slice(0, 30)), (slice(40, 60), slice(50, 80))):
+        for _ in range(2):
+            aqi_band = rng.uniform(1.5, 4.0, (60, 80)).astype(np.float32)
+            aqi_band[nodata_cells] = 1.0
+            expected = aq_processing.fill_aqi_nodata(aqi_band.copy(), na_val=1.0)
+            assert np.array_equal(nodata_filler.fill(aqi_band, na_val=1.0), expected)
+
+
+def test_reads_multiple_aq_layers_from_nc_at_once():
+    aq_nc = aq_processing.read_zipped_aq_nc(
+        f'{test_data_dir}allPollutants_2021-02-26T14.zip', 'allPollutants'
+    )
+    aq_rasters = aq_processing.read_aq_nc_rasters(*aq_nc, ['AQI', 'NOT_A_POLLUTANT'])
+    assert list(aq_rasters.keys()) == ['AQI']
+    assert np.array_equal(aq_rasters['AQI'].band, aq_processing.read_aqi_nc_raster(*aq_nc).band)
+
+
+def test_samples_aqi_as_rasterio_sample(graph):
+    sampling_gdf = aq_sampling.get_sampling_point_gdf_from_graph(graph)
+    sampler = aq_sampling.get_point_raster_sampler(sampling_gdf)
+    aqi_tif = fr'{test_data_dir}aqi_2020-10-10T08.tif'
+    sample_gdf = aq_sampling.sample_aq_to_point_gdf(sampling_gdf, aqi_tif, 'aqi', sampler)
+    coords = aq_sampling.round_coordinates(
+        [(point.x, point.y) for point in sampling_gdf['point_geom']]
+    )
+    with rasterio.open(aqi_tif) as aqi_raster:
+        expected = [round(x.item(), 2) for x in aqi_raster.sample(coords)]
+    assert sample_gdf['aqi'].tolist() == expected
+
+
+def test_gets_length_weighted_means_of_samples():
+    samples = np.array([2.0, 4.0, 3.0, np.nan, 1.0, np.nan])
+    weights = np.array([0.5, 0.5, 1.0, 0.5, 0.5, 1.0])
+    offsets = np.array([0, 2, 3, 5])
+    means = aq_sampling.get_length_weighted_means(samples, weights, offsets)
+    np.testing.assert_array_equal(means, [3.0, 3.0, 1.0, np.nan])
+
+
+def test_places_sampling_points_along_edges(graph):
+    sampling_gdf = aq_sampling.get_sampling_point_gdf_from_graph(graph)
+    sampling = aq_sampling.get_multi_point_sampling(sampling_gdf, 20)
+    point_counts = np.diff(np.append(sampling.offsets, len(sampling.coords)))
+    lengths = sampling_gdf[E.length.name].to_numpy()
+    assert np.all(point_counts == np.maximum(np.ceil(lengths / 20), 1))
+    assert np.allclose(np.add.reduceat(sampling.weights, sampling.offsets), 1.0)
+
+
+def test_creates_aqi_update(aqi_updater, graph):
+    assert aqi_updater.latest_aqi_update == 'aqi_2020-10-10T08.bin'
+    edge_aqi = edge_array_file.read_edge_array_file(fr'{aqi_updates_dir}aqi_2020-10-10T08.bin')
+    assert edge_aqi.graph_fingerprint == edge_array_file.get_graph_fingerprint(graph)
+    assert edge_aqi.data_time == 1602316800
+    assert edge_aqi.edge_count == graph.ecount()
+    assert list(edge_aqi.arrays) == [E.aqi.value, 'aqi_coeff']
+
+
+def test_writes_aqi_update_manifest():
+    manifest = aqi_manifest.read_manifest(aqi_updates_dir)
+    assert manifest == aqi_manifest.AqiUpdateManifest(
+        aqi_update='aqi_2020-10-10T08.bin',
+        aqi_map='aqi_map_2020-10-10T08.json',
+        data_time=1602316800
+    )
+
+
+def test_aqi_update_aqi_values_are_valid():
+    edge_aqi = edge_array_file.read_edge_array_file(fr'{aqi_updates_dir}aqi_2020-10-10T08.bin')
+    aqis = np.round(edge_aqi.arrays[E.aqi.value].astype(np.float64), 2)
+    valid_aqis = aqis[~np.isnan(aqis)]
+    assert len(valid_aqis) == 16469
+    assert round(valid_aqis.mean(), 3) == 1.684
+    assert np.median(valid_aqis) == 1.67
+    assert valid_aqis.min() == 1.63
+    assert valid_aqis.max() == 2.04
+
+
+def test_aqi_update_has_aqi_coeffs():
+    edge_aqi = edge_array_file.read_edge_array_file(fr'{aqi_updates_dir}aqi_2020-10-10T08.bin')
+    aqis = np.round(edge_aqi.arrays[E.aqi.value].astype(np.float64), 2)
+    aqi_coeffs = np.round(edge_aqi.arrays['aqi_coeff'].astype(np.float64), 4)
+    assert np.array_equal(np.isnan(aqi_coeffs), np.isnan(aqis))
+    valid_aqis = ~np.isnan(aqis)
+    assert np.allclose(aqi_coeffs[valid_aqis], (aqis[valid_aqis] - 1) / 4)
 
 
 def test_creates_aqi_map_json():
-    with open(fr'{aqi_updates_dir}aqi_map.json') as f:
+    with open(fr'{aqi_updates_dir}aqi_map_2020-10-10T08.json') as f:
         aqi_map = json.load(f)
-        assert len(aqi_map) == 1
+        assert len(aqi_map) == 2
+        assert aqi_map['version'] == 'aqi_2020-10-10T08.bin'
         assert len(aqi_map['data']) == 8162
         for id_aqi_pair in aqi_map['data']:
             assert isinstance(id_aqi_pair[0], int) 
             assert isinstance(id_aqi_pair[1], int)
+
+
+def test_exports_sampled_pollutants_as_bands_of_aqi_update(graph, tmp_path):
+    updates_dir = str(tmp_path) + '/'
+    aqi_updater = AqiUpdater(graph, test_data_dir, updates_dir)
+    with rasterio.open(fr'{test_data_dir}aqi_2020-10-10T08.tif') as aqi_tif:
+        # a pollutant layer with the values of the AQI raster (x 10)
+        no2_raster = aq_processing.AqRaster(
+            aqi_tif.read(1) * 10, aqi_tif.transform, nodata=np.nan
+        )
+    aqi_updater.create_aqi_update('aqi_2020-10-10T08.tif', pollutant_rasters={'NO2': no2_raster})
+    aqi_updater.finish_aqi_update()
+    edge_aqi = edge_array_file.read_edge_array_file(f'{updates_dir}aqi_2020-10-10T08.bin')
+    assert list(edge_aqi.arrays) == [E.aqi.value, 'aqi_coeff', 'no2']
+    aqis = edge_aqi.arrays[E.aqi.value]
+    # sampled AQI is rounded to two decimals and clamped to 1.0-5.0
+    has_aqi = np.isfinite(aqis) & (aqis > 1.0) & (aqis < 5.0)
+    assert np.allclose(edge_aqi.arrays['no2'][has_aqi], aqis[has_aqi] * 10, atol=0.06)
+
+
+def test_exports_aqi_map_delta_since_previous_update(graph, tmp_path):
+    aqi_cache_dir = tmp_path / 'aqi_cache'
+    aqi_cache_dir.mkdir()
+    # the same AQI raster for two consecutive hours
+    for aqi_tif_name in ('aqi_2020-10-10T08.tif', 'aqi_2020-10-10T09.tif'):
+        shutil.copyfile(fr'{test_data_dir}aqi_2020-10-10T08.tif', aqi_cache_dir / aqi_tif_name)
+    updates_dir = str(tmp_path / 'aqi_updates') + '/'
+    os.makedirs(updates_dir)
+    aqi_updater = AqiUpdater(graph, str(aqi_cache_dir) + '/', updates_dir)
+    aqi_updater.create_aqi_update('aqi_2020-10-10T08.tif')
+    aqi_updater.finish_aqi_update()
+    aqi_updater.create_aqi_update('aqi_2020-10-10T09.tif')
+    aqi_updater.finish_aqi_update()
+    manifest = aqi_manifest.read_manifest(updates_dir)
+    assert manifest.aqi_map == 'aqi_map_2020-10-10T09.json'
+    assert manifest.aqi_map_delta == 'aqi_map_delta_2020-10-10T09.json'
+    with open(f'{updates_dir}aqi_map_delta_2020-10-10T09.json') as f:
+        # the same AQI as in the previous update
+        assert json.load(f) == {
+            'data': [],
+            'removed': [],
+            'since': 'aqi_2020-10-10T08.bin',
+            'version': 'aqi_2020-10-10T09.bin'
+        }
+    # AQI map data of the previous update is removed
+    assert sorted(name for name in os.listdir(updates_dir) if name.startswith('aqi_map')) == [
+        'aqi_map_2020-10-10T09.json', 'aqi_map_delta_2020-10-10T09.json'
+    ]
+
+
+def test_reads_sampling_manifest_written_from_graph(graph, tmp_path):
+    manifest_file = str(tmp_path / 'kumpula_sampling.npz')
+    sampling_manifest.write_sampling_manifest(
+        manifest_file, sampling_manifest.get_sampling_manifest(graph)
+    )
+    graph_fingerprint = edge_array_file.get_graph_fingerprint(graph)
+    manifest = sampling_manifest.read_sampling_manifest(
+        manifest_file, with_geometries=True, graph_fingerprint=graph_fingerprint
+    )
+    edge_gdf = aq_sampling.get_sampling_point_gdf_from_graph(graph)
+    assert manifest.edge_count == graph.ecount()
+    assert manifest.id_ig.tolist() == edge_gdf[E.id_ig.name].tolist()
+    assert manifest.id_way.tolist() == edge_gdf[E.id_way.name].tolist()
+    assert manifest.lon.tolist() == [point.x for point in edge_gdf['point_geom']]
+    assert manifest.lat.tolist() == [point.y for point in edge_gdf['point_geom']]
+    assert list(manifest.get_geometries()) == list(edge_gdf[E.geom_wgs.name])
+
+    manifest = sampling_manifest.read_sampling_manifest(manifest_file)
+    assert not manifest.has_geometries
+    with pytest.raises(sampling_manifest.SamplingManifestError):
+        sampling_manifest.read_sampling_manifest(manifest_file, graph_fingerprint='abc')
+
+
+def test_creates_same_aqi_update_from_sampling_manifest(graph, tmp_path):
+    manifest_file = str(tmp_path / 'kumpula_sampling.npz')
+    sampling_manifest.write_sampling_manifest(
+        manifest_file, sampling_manifest.get_sampling_manifest(graph)
+    )
+    updates_dir = str(tmp_path) + '/'
+    aqi_updater = AqiUpdater(
+        sampling_manifest.read_sampling_manifest(manifest_file), test_data_dir, updates_dir
+    )
+    aqi_updater.create_aqi_update('aqi_2020-10-10T08.tif')
+    aqi_updater.finish_aqi_update()
+    update = edge_array_file.read_edge_array_file(
+        f'{updates_dir}aqi_2020-10-10T08.bin',
+        graph_fingerprint=edge_array_file.get_graph_fingerprint(graph)
+    )
+    expected = edge_array_file.read_edge_array_file(f'{aqi_updates_dir}aqi_2020-10-10T08.bin')
+    assert update.arrays.keys() == expected.arrays.keys()
+    for band, values in expected.arrays.items():
+        np.testing.assert_array_equal(update.arrays[band], values)
@@ -1,52 +1,71 @@
 import logging
 import os
 import time
-import traceback
+from datetime import datetime
 from aqi_updater.aqi_fetcher import AqiFetcher
+from aqi_updater.aqi_pipeline import AqiUpdatePipeline
 from aqi_updater.aqi_updater import AqiUpdater
 import aqi_updater.configuration
 import common.igraph as ig_utils
+import common.sampling_manifest as sampling_manifest
+from common.sampling_manifest import SamplingManifest
 
 
 log = logging.getLogger('main')
 
 graph_subset = eval(os.getenv('GRAPH_SUBSET', 'False'))
-graph = ig_utils.read_graphml('graphs/kumpula.graphml' if graph_subset else 'graphs/hma.graphml')
+graph_file = 'graphs/kumpula.graphml' if graph_subset else 'graphs/hma.graphml'
+# the number of forecast hours to process after the current hour (for departure time routing)
+forecast_hours = int(os.getenv('AQI_FORECAST_HOURS', '0'))
+# interval (m) of sampling points along the edges, or 0 for sampling AQI at the midpoints of edges
+sampling_interval_m = float(os.getenv('AQI_SAMPLING_INTERVAL_M', '0'))
+# AQI data is processed in memory, but can also be exported as GeoTiff files (e.g. for debugging)
+write_aqi_tifs = eval(os.getenv('WRITE_AQI_TIFS', 'False'))
+# enfuser layers of other pollutants to sample to the edges with AQI, e.g. NO2,PM25,PM10,O3
+pollutants = [name for name in os.getenv('AQ_POLLUTANTS', '').split(',') if name]
 
-aqi_fetcher = AqiFetcher('aqi_cache/')
-aqi_updater = AqiUpdater(graph, 'aqi_cache/', 'aqi_updates/')
 
+def load_sampling_manifest() -> SamplingManifest:
+    """Reads the sampling manifest of the graph written by the graph export. If the manifest is
+    missing or older than the graph file, reads the graph and tries to write a new manifest for it
+    (a failed write is only logged).
+    """
+    manifest_file = sampling_manifest.get_sampling_manifest_file_path(graph_file)
+    if (
+        os.path.exists(manifest_file)
+        and os.path.getmtime(manifest_file) >= os.path.getmtime(graph_file)
+    ):
+        try:
+            manifest = sampling_manifest.read_sampling_manifest(
+                manifest_file, with_geometries=bool(sampling_interval_m)
+            )
+            log.info(f'Read sampling manifest: {manifest_file}')
+            return manifest
+        except sampling_manifest.SamplingManifestError as e:
+            log.warning(f'Could not read sampling manifest: {e}')
 
-def fetch_process_aqi_data():
+    log.warning(f'No valid sampling manifest for {graph_file}, reading the graph')
+    manifest = sampling_manifest.get_sampling_manifest(ig_utils.read_graphml(graph_file))
     try:
-        aqi_fetcher.fetch_process_current_aqi_data()
-        log.info('AQI fetch & processing succeeded')
-    except Exception:
-        log.error(traceback.format_exc())
-        log.error(f'Failed to process AQI data to {aqi_fetcher.wip_aqi_tif}, retrying in 30s')
-        time.sleep(30)
-    finally:
-        aqi_fetcher.finish_aqi_fetch()
+        sampling_manifest.write_sampling_manifest(manifest_file, manifest)
+        log.info(f'Wrote sampling manifest: {manifest_file}')
+    except OSError as e:
+        # e.g. graphs/ is mounted as read-only
+        log.warning(f'Could not write sampling manifest: {e}')
+    return manifest
 
 
-def create_aqi_update_csv():
-    try:
-        aqi_updater.create_aqi_update_csv(aqi_fetcher.latest_aqi_tif)
-        log.info('AQI update succeeded')
-    except Exception:
-        log.error(traceback.format_exc())
-        log.error(f'Failed to update AQI from {aqi_fetcher.latest_aqi_tif}, retrying in 30s')
-        time.sleep(30)
-    finally:
-        aqi_updater.finish_aqi_update()
+aqi_fetcher = AqiFetcher('aqi_cache/', write_tifs=write_aqi_tifs, pollutants=pollutants)
+aqi_updater = AqiUpdater(
+    load_sampling_manifest(), 'aqi_cache/', 'aqi_updates/', sampling_interval_m=sampling_interval_m
+)
 
 
 if __name__ == '__main__':
     log.info('Starting AQI updater app')
+    pipeline = AqiUpdatePipeline(log, aqi_fetcher, aqi_updater, forecast_hours=forecast_hours)
+    pipeline.start()
 
     while True:
-        if aqi_fetcher.new_aqi_available():
-            fetch_process_aqi_data()
-        if aqi_updater.new_update_available(aqi_fetcher.latest_aqi_tif):
-            create_aqi_update_csv()
+        pipeline.schedule(datetime.utcnow())
         time.sleep(10)
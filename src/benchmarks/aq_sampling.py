@@ -0,0 +1,129 @@
+"""
+This script compares sampling AQI to the edges of a graph at the midpoints of the edges with
+sampling at multiple points along the edges (with different intervals), i.e. the sampling modes of
+the AQI updater (AQI_SAMPLING_INTERVAL_M). For each mode, the script reports the number of sampling
+points, the time of creating the sampler (once at the start of the AQI updater), the time of
+sampling one AQI raster (every hour) and how much the sampled AQI differs from the midpoint AQI.
+
+This script is intended to be run from the root of the project (src/) with the command:
+python -m benchmarks.aq_sampling (running as a module allows the imports to work)
+
+The graph can be set with the environment variable GP_GRAPH and the AQI raster (GeoTiff) with
+AQI_TIF, e.g.:
+GP_GRAPH=graphs/kumpula.graphml AQI_TIF=aqi_cache/aqi_2020-10-10T08.tif python -m benchmarks.aq_sampling
+
+If AQI_TIF is not set, a random (spatially smooth) AQI raster covering the graph is used.
+
+"""
+
+import os
+import time
+import tempfile
+from typing import Union
+import numpy as np
+import rasterio
+from affine import Affine
+from geopandas import GeoDataFrame
+import common.igraph as ig_utils
+from common.igraph import Edge as E
+from gp_server.conf import conf
+import aqi_updater.aq_sampling as aq_sampling
+
+
+repeats = 5
+sampling_intervals_m = [0, 50, 20, 10]
+# cell size of the random AQI raster (degrees), about the size of the cells of Enfuser AQI data
+cell_size = 0.0003
+
+
+def write_random_aqi_tif(sampling_gdf: GeoDataFrame, file_path: str) -> None:
+    minx, miny, maxx, maxy = sampling_gdf[E.geom_wgs.name].total_bounds
+    width = int((maxx - minx) / cell_size) + 2
+    height = int((maxy - miny) / cell_size) + 2
+    # smooth random AQI field from bilinearly interpolated coarse noise
+    rng = np.random.default_rng(1)
+    coarse = rng.uniform(1.0, 4.0, (height // 20 + 2, width // 20 + 2))
+    rows = np.arange(height)[:, None] / 20
+    cols = np.arange(width)[None, :] / 20
+    r0, c0 = rows.astype(int), cols.astype(int)
+    dr, dc = rows - r0, cols - c0
+    aqi = (
+        coarse[r0, c0] * (1 - dr) * (1 - dc) + coarse[r0 + 1, c0] * dr * (1 - dc)
+        + coarse[r0, c0 + 1] * (1 - dr) * dc + coarse[r0 + 1, c0 + 1] * dr * dc
+    )
+    aqi += rng.normal(0, 0.2, aqi.shape)
+    with rasterio.open(
+        file_path, 'w', driver='GTiff', height=height, width=width, count=1, dtype='float32',
+        crs='EPSG:4326', transform=Affine(cell_size, 0, minx, 0, -cell_size, maxy)
+    ) as raster:
+        raster.write(aqi.astype(np.float32), 1)
+
+
+def get_aqi_classes(aqis: np.ndarray) -> np.ndarray:
+    return np.floor(aqis * 2) - 1
+
+
+def benchmark_sampling(
+    sampling_gdf: GeoDataFrame,
+    aqi_tif: str,
+    interval_m: float,
+    midpoint_aqis: Union[np.ndarray, None]
+) -> np.ndarray:
+    start_time = time.perf_counter()
+    sampler = aq_sampling.get_raster_sampler(sampling_gdf, interval_m)
+    init_s = round(time.perf_counter() - start_time, 2)
+
+    with rasterio.open(aqi_tif) as aqi_raster:
+        # the first sampling computes the pixel indices of the points
+        sampler.sample(aqi_raster)
+        start_time = time.perf_counter()
+        for _ in range(repeats):
+            sampler.sample(aqi_raster)
+        sampling_ms = round(1000 * (time.perf_counter() - start_time) / repeats, 1)
+
+    aqis = aq_sampling.sample_aq_to_point_gdf(sampling_gdf, aqi_tif, 'aqi', sampler)['aqi']
+    aqis = aqis.to_numpy()
+    point_count = (
+        len(sampling_gdf) if not interval_m
+        else len(aq_sampling.get_multi_point_sampling(sampling_gdf, interval_m).coords)
+    )
+    mode = f'interval {interval_m} m' if interval_m else 'midpoints'
+    print(
+        f'{mode}: {point_count} points, sampler created in {init_s} s, '
+        f'sampling {sampling_ms} ms / raster'
+    )
+    if midpoint_aqis is not None:
+        valid = np.isfinite(aqis) & np.isfinite(midpoint_aqis)
+        mean_diff = np.mean(np.abs(aqis[valid] - midpoint_aqis[valid]))
+        class_changed = np.mean(
+            get_aqi_classes(aqis[valid]) != get_aqi_classes(midpoint_aqis[valid])
+        )
+        print(
+            f'  mean AQI difference to midpoints: {round(mean_diff, 3)}, '
+            f'AQI class changed: {round(100 * class_changed, 1)} % of edges'
+        )
+    return aqis
+
+
+def main():
+    graph = ig_utils.read_graphml(conf.graph_file)
+    sampling_gdf = aq_sampling.get_sampling_point_gdf_from_graph(graph).drop_duplicates(
+        E.id_way.name
+    )
+    print(f'graph: {conf.graph_file}, edges to sample: {len(sampling_gdf)}')
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        aqi_tif = os.getenv('AQI_TIF')
+        if not aqi_tif:
+            aqi_tif = os.path.join(tmp_dir, 'random_aqi.tif')
+            write_random_aqi_tif(sampling_gdf, aqi_tif)
+
+        midpoint_aqis = None
+        for interval_m in sampling_intervals_m:
+            aqis = benchmark_sampling(sampling_gdf, aqi_tif, interval_m, midpoint_aqis)
+            if not interval_m:
+                midpoint_aqis = aqis
+
+
+if __name__ == '__main__':
+    main()
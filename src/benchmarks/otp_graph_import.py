@@ -0,0 +1,76 @@
+"""
+This script measures the time of importing OTP graph data (nodes & edges CSV) to an igraph graph
+with otp_graph_import.convert_otp_graph_to_igraph. By default, the test data and the kumpula data
+of the repository are imported, and the number of edges and nodes of the created graphs and the
+mean import times are reported. Each data set is imported both by reading the CSV files at once
+and in chunks (csv_chunk_size).
+
+This script is intended to be run from the root of the project (src/) with the command:
+python -m benchmarks.otp_graph_import (running as a module allows the imports to work)
+
+Other OTP graph data (e.g. of the whole HMA) can be imported by setting the CSV files with the
+environment variables OTP_NODES and OTP_EDGES, e.g.:
+OTP_NODES=graph_build/otp_graph_import/otp_nodes.csv OTP_EDGES=graph_build/otp_graph_import/otp_edges.csv python -m benchmarks.otp_graph_import
+
+"""
+
+import os
+import time
+import logging
+from typing import List, Tuple, Union
+from graph_build.otp_graph_import.otp_graph_import import convert_otp_graph_to_igraph
+
+
+repeats = 3
+csv_chunk_sizes = [None, 10000]
+hma_poly_file = 'graph_build/otp_graph_import/extent_data/HMA.geojson'
+otp_data = [
+    (
+        'test',
+        'graph_build/tests/otp_graph_import/data/test_nodes.csv',
+        'graph_build/tests/otp_graph_import/data/test_edges.csv'
+    ),
+    (
+        'kumpula',
+        'graph_build/otp_graph_import/otp_graph_data/kumpula_nodes.csv',
+        'graph_build/otp_graph_import/otp_graph_data/kumpula_edges.csv'
+    )
+]
+
+
+def get_otp_data() -> List[Tuple[str, str, str]]:
+    if os.getenv('OTP_NODES') and os.getenv('OTP_EDGES'):
+        return [('custom', os.getenv('OTP_NODES'), os.getenv('OTP_EDGES'))]
+    return otp_data
+
+
+def benchmark_import(
+    name: str,
+    node_csv_file: str,
+    edge_csv_file: str,
+    csv_chunk_size: Union[int, None]
+) -> None:
+    times = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        graph = convert_otp_graph_to_igraph(
+            node_csv_file, edge_csv_file, hma_poly_file, None, csv_chunk_size=csv_chunk_size
+        )
+        times.append(time.perf_counter() - start_time)
+    mode = f'chunks of {csv_chunk_size} rows' if csv_chunk_size else 'at once'
+    print(
+        f'{name} ({mode}): {graph.ecount()} edges, {graph.vcount()} nodes, '
+        f'imported in {round(sum(times) / repeats, 2)} s (min {round(min(times), 2)} s)'
+    )
+
+
+def main():
+    # the import logs its progress (and missing attributes) at info level
+    logging.getLogger('otp_graph_import').setLevel(logging.ERROR)
+    for name, node_csv_file, edge_csv_file in get_otp_data():
+        for csv_chunk_size in csv_chunk_sizes:
+            benchmark_import(name, node_csv_file, edge_csv_file, csv_chunk_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+This script compares the sizes and encoding times of the path response formats of the routing API:
+    1) GeoJSON (application/json)
+    2) Encoded polylines (application/vnd.greenpaths.polyline+json)
+
+Sizes are reported both as raw and gzip compressed bytes, since clients typically receive
+compressed responses. The same fixed OD set is used as in the benchmark of response serialization.
+
+This script is intended to be run from the root of the project (src/) with the command:
+python -m benchmarks.response_formats (running as a module allows the imports to work)
+
+The graph can be set with the environment variable GP_GRAPH, e.g.:
+GP_GRAPH=graphs/kumpula.graphml python -m benchmarks.response_formats
+"""
+
+import gzip
+import time
+from typing import List
+from gp_server.app.graph_handler import GraphHandler
+from gp_server.app.constants import ResponseFormat, RoutingMode
+from gp_server.app.logger import Logger
+from gp_server.app.path_set import PathSet
+from gp_server.conf import conf
+from benchmarks.response_serialization import get_path_set, od_list, repeats
+import gp_server.app.routing as routing
+
+
+def encode_response(path_set: PathSet, response_format: ResponseFormat) -> bytes:
+    path_FC = path_set.get_paths_as_feature_collection_json(response_format)
+    edge_FC = path_set.get_edges_as_feature_collection_json(response_format)
+    return b''.join((b'{"path_FC":', path_FC, b',"edge_FC":', edge_FC, b'}'))
+
+
+def compare_format(path_sets: List[PathSet], response_format: ResponseFormat) -> None:
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        for path_set in path_sets:
+            encode_response(path_set, response_format)
+    duration_ms = 1000 * (time.perf_counter() - start_time) / (repeats * len(path_sets))
+
+    responses = [encode_response(path_set, response_format) for path_set in path_sets]
+    size = sum(len(response) for response in responses) / len(responses)
+    gzip_size = sum(len(gzip.compress(response)) for response in responses) / len(responses)
+    print(
+        f'{response_format.name}: {round(duration_ms, 2)} ms, {round(size / 1000, 1)} kB, '
+        f'{round(gzip_size / 1000, 1)} kB gzipped / response'
+    )
+
+
+def main():
+    log = Logger(b_printing=False)
+    routing_conf = routing.get_routing_conf()
+    G = GraphHandler(log, conf.graph_file, routing_conf)
+
+    path_sets = [
+        get_path_set(log, G, routing_conf, od_coords, routing_mode)
+        for od_coords in od_list
+        for routing_mode in (RoutingMode.QUIET, RoutingMode.GREEN)
+    ]
+    print(f'path sets: {len(path_sets)}')
+
+    for response_format in ResponseFormat:
+        compare_format(path_sets, response_format)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+This script compares the two ways of serializing path responses of the routing API:
+    1) Paths and edge groups as GeoJSON FeatureCollections (python dicts) serialized with json
+    2) JSON composed from the pre-encoded edge coordinates of the graph (orjson)
+
+Long bike routes are used as they have the most coordinates and edge groups to serialize.
+The script also checks that both ways produce the same response.
+
+This script is intended to be run from the root of the project (src/) with the command:
+python -m benchmarks.response_serialization (running as a module allows the imports to work)
+
+The graph can be set with the environment variable GP_GRAPH, e.g.:
+GP_GRAPH=graphs/kumpula.graphml python -m benchmarks.response_serialization
+
+"""
+
+import json
+import time
+from typing import Callable, List, Tuple
+from gp_server.app.graph_handler import GraphHandler
+from gp_server.app.constants import RoutingMode, TravelMode
+from gp_server.app.logger import Logger
+from gp_server.app.path_set import PathSet
+from gp_server.conf import conf
+import gp_server.app.routing as routing
+
+
+repeats = 20
+
+# long bike routes across the Kumpula area
+od_list = [
+    ((60.215175, 24.980636), (60.200423, 24.961936)),
+    ((60.21495, 24.97971), (60.20166, 24.968)),
+    ((60.21743, 24.96996), (60.2012, 24.97652)),
+    ((60.20151, 24.96206), (60.21602, 24.98133))
+]
+
+
+def serialize_as_dicts(path_set: PathSet) -> bytes:
+    path_FC = path_set.get_paths_as_feature_collection()
+    edge_FC = path_set.get_edges_as_feature_collection()
+    # Flask's jsonify sorts keys by default
+    return json.dumps({'path_FC': path_FC, 'edge_FC': edge_FC}, sort_keys=True).encode()
+
+
+def serialize_as_json(path_set: PathSet) -> bytes:
+    path_FC = path_set.get_paths_as_feature_collection_json()
+    edge_FC = path_set.get_edges_as_feature_collection_json()
+    return b''.join((b'{"path_FC":', path_FC, b',"edge_FC":', edge_FC, b'}'))
+
+
+def get_path_set(
+    log: Logger,
+    G: GraphHandler,
+    routing_conf,
+    od_coords: Tuple[Tuple[float, float]],
+    routing_mode: RoutingMode
+) -> PathSet:
+    od_settings = routing.parse_od_settings(
+        TravelMode.BIKE.value,
+        routing_mode.value,
+        routing_conf,
+        *od_coords[0],
+        *od_coords[1],
+        aqi_updater=None
+    )
+    od_nodes = routing.find_or_create_od_nodes(log, G, od_settings)
+    try:
+        path_set = routing.find_least_cost_paths(log, G, routing_conf, od_settings, od_nodes)
+        routing.process_paths(log, G, routing_conf, od_settings, path_set)
+        return path_set
+    finally:
+        routing.delete_added_graph_features(G, od_nodes)
+        G.reset_edge_cache()
+
+
+def time_serializer(serializer: Callable[[PathSet], bytes], path_sets: List[PathSet]) -> float:
+    """Returns the mean duration of serializing a path set (ms).
+    """
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        for path_set in path_sets:
+            serializer(path_set)
+    return round(1000 * (time.perf_counter() - start_time) / (repeats * len(path_sets)), 2)
+
+
+def main():
+    log = Logger(b_printing=False)
+    routing_conf = routing.get_routing_conf()
+    G = GraphHandler(log, conf.graph_file, routing_conf)
+
+    path_sets = [
+        get_path_set(log, G, routing_conf, od_coords, routing_mode)
+        for od_coords in od_list
+        for routing_mode in (RoutingMode.QUIET, RoutingMode.GREEN)
+    ]
+
+    for path_set in path_sets:
+        assert json.loads(serialize_as_dicts(path_set)) == json.loads(serialize_as_json(path_set))
+
+    coord_count = sum(len(edge.coords_wgs) for ps in path_sets for p in ps.paths for edge in p.edges)
+    response_size = sum(len(serialize_as_json(path_set)) for path_set in path_sets)
+    print(f'path sets: {len(path_sets)}, coordinates: {coord_count}, bytes: {response_size}')
+    print(f'dicts + json: {time_serializer(serialize_as_dicts, path_sets)} ms / response')
+    print(f'pre-encoded coordinates + orjson: {time_serializer(serialize_as_json, path_sets)} ms / response')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,17 @@
+"""
+This module provides the calculation of AQ cost coefficients from AQI values as arrays at once.
+The coefficients are calculated both by the AQI updater (published in the edge AQI updates) and by
+the green path server (e.g. from legacy CSV AQI updates), so they must always be calculated with
+this function.
+
+"""
+
+import numpy as np
+
+
+def get_aqi_coeffs(aqis: np.ndarray) -> np.ndarray:
+    """Returns AQ cost coefficients for an array of AQI values (see
+    gp_server.app.aq_exposures.get_aqi_coeff), i.e. 10 for missing or invalid AQI (< 0.95), 0 for
+    AQI below 1.0 and (AQI - 1) / 4 for the rest. Coefficients of edges without AQI (NaN) are NaN.
+    """
+    return np.where(aqis < 0.95, 10.0, np.where(aqis < 1.0, 0.0, (aqis - 1) / 4))
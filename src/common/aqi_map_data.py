@@ -0,0 +1,129 @@
+"""
+This module provides functions for AQI map data, i.e. the AQI classes of the edges (by id_way) for
+drawing the AQI map, and for the changes in the AQI classes between AQI updates (deltas).
+
+The AQI updater writes the map data and the delta since the previous AQI update as JSON files in
+the format that the AQI map data API serves them, versioned by the name of the AQI update:
+    - map data: {"version":"aqi_2020-10-25T14.bin","data":[[id_way,aqi_class],...]}
+    - delta: {"data":[[id_way,aqi_class],...],"removed":[id_way,...],"since":...,"version":...}
+
+As the version is written first in the map data, the green path server can check that the file is
+of the expected AQI update and serve it as it is, without parsing the data.
+
+"""
+
+import os
+import json
+from typing import Any, BinaryIO, Callable, Dict, List, Tuple, Union
+import numpy as np
+
+
+# the number of pairs of id_way and AQI class to serialize at a time when writing map data
+write_chunk_size = 10000
+
+
+def get_aqi_classes(aqis: np.ndarray) -> np.ndarray:
+    """Returns AQI class identifiers (1-9) for an array of AQI values, or 0 for invalid (not finite)
+    AQI. AQI classes represent (9 x) 0.5 intervals in the original AQI scale from 1.0 to 5.0, i.e.
+    1: 1.0-1.5, 2: 1.5-2.0, 3: 2.0-2.5 etc.
+    """
+    aqis = np.asarray(aqis, dtype=np.float64)
+    finite = np.isfinite(aqis)
+    return np.where(finite, np.floor(np.where(finite, aqis, 0.0) * 2) - 1, 0).astype(np.int8)
+
+
+def get_aqi_classes_by_id(id_aqi_pairs: Union[np.ndarray, List[List[int]]]) -> np.ndarray:
+    """Returns the AQI classes of AQI map data as an array indexed by id_way (-1 for ids without
+    AQI class).
+    """
+    pairs = np.array(id_aqi_pairs, dtype=np.int64).reshape(-1, 2)
+    aqi_classes = np.full(pairs[:, 0].max() + 1 if len(pairs) else 0, -1, dtype=np.int8)
+    aqi_classes[pairs[:, 0]] = pairs[:, 1]
+    return aqi_classes
+
+
+def get_aqi_class_changes(
+    prev_aqi_classes: np.ndarray,
+    aqi_classes: np.ndarray
+) -> Tuple[List[List[int]], List[int]]:
+    """Returns the changed (or added) pairs of id_way and AQI class and the ids of the edges that
+    no longer have AQI class between two arrays of AQI classes by id_way.
+    """
+    size = max(len(prev_aqi_classes), len(aqi_classes))
+    prev = np.full(size, -1, dtype=np.int8)
+    prev[:len(prev_aqi_classes)] = prev_aqi_classes
+    latest = np.full(size, -1, dtype=np.int8)
+    latest[:len(aqi_classes)] = aqi_classes
+
+    changed_ids = np.flatnonzero((prev != latest) & (latest != -1))
+    removed_ids = np.flatnonzero((prev != latest) & (latest == -1))
+    changed = np.column_stack((changed_ids, latest[changed_ids])).tolist()
+    return changed, removed_ids.tolist()
+
+
+def get_delta(
+    changed: List[List[int]],
+    removed: List[int],
+    since: str,
+    version: str
+) -> Dict[str, Any]:
+    return {'data': changed, 'removed': removed, 'since': since, 'version': version}
+
+
+def __to_json_bytes(data: Any) -> bytes:
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+
+def __get_map_data_prefix(version: str) -> bytes:
+    return b'{"version":' + __to_json_bytes(version) + b',"data":['
+
+
+def __write_file(file_path: str, write: Callable[[BinaryIO], Any]) -> None:
+    """Writes a file with the given function to a temporary file first and then renames it, as the
+    previous file may still be read.
+    """
+    tmp_file_path = f'{file_path}.tmp'
+    with open(tmp_file_path, 'wb') as f:
+        write(f)
+    os.replace(tmp_file_path, file_path)
+
+
+def __write_map_data(f: BinaryIO, version: str, id_aqi_pairs: np.ndarray) -> None:
+    f.write(__get_map_data_prefix(version))
+    for start in range(0, len(id_aqi_pairs), write_chunk_size):
+        if start:
+            f.write(b',')
+        # serialize the pairs of a chunk at once and leave out the brackets of the list
+        f.write(__to_json_bytes(id_aqi_pairs[start:start + write_chunk_size].tolist())[1:-1])
+    f.write(b']}')
+
+
+def write_aqi_map_data(
+    file_path: str,
+    ids: np.ndarray,
+    aqi_classes: np.ndarray,
+    version: str
+) -> None:
+    """Writes AQI map data of the edges with the given ids (id_way) and AQI classes as JSON, so that
+    the pairs are streamed to the file in chunks (without creating a list of pairs of all edges).
+    """
+    id_aqi_pairs = np.column_stack(
+        (np.asarray(ids, dtype=np.int64), np.asarray(aqi_classes, dtype=np.int64))
+    )
+    __write_file(file_path, lambda f: __write_map_data(f, version, id_aqi_pairs))
+
+
+def write_aqi_map_delta(file_path: str, delta: Dict[str, Any]) -> None:
+    __write_file(file_path, lambda f: f.write(__to_json_bytes(delta)))
+
+
+def is_versioned_aqi_map_data(map_data: bytes) -> bool:
+    """Returns True if the map data (JSON) was written by write_aqi_map_data (for any version).
+    """
+    return map_data.startswith(b'{"version":')
+
+
+def is_aqi_map_data_of_version(map_data: bytes, version: str) -> bool:
+    """Returns True if the map data (JSON) was written by write_aqi_map_data for the given version.
+    """
+    return map_data.startswith(__get_map_data_prefix(version))
@@ -0,0 +1,46 @@
+"""
+This module provides functions for writing and reading the AQI update manifest, i.e. a small JSON
+file that the AQI updater writes to the AQI updates directory after each complete AQI update. The
+manifest points to the files of the latest AQI update, so that the green path server can react to
+a single (atomically replaced) file instead of polling for the expected AQI update files.
+
+"""
+
+import os
+import json
+from dataclasses import dataclass, asdict
+from typing import Union
+
+
+manifest_file_name = 'aqi_update_manifest.json'
+
+
+@dataclass(frozen=True)
+class AqiUpdateManifest:
+    aqi_update: str  # the name of the edge AQI update file (e.g. aqi_2020-10-10T08.bin)
+    aqi_map: str  # the name of the AQI map data file (e.g. aqi_map_2020-10-10T08.json)
+    data_time: int  # UTC time of the AQI data as unix time (s)
+    # the name of the file of changes in AQI map data since the previous AQI update (if any)
+    aqi_map_delta: Union[str, None] = None
+
+
+def write_manifest(aqi_updates_dir: str, manifest: AqiUpdateManifest) -> None:
+    """Writes the manifest to the AQI updates directory. The manifest is written to a temporary
+    file first and then renamed, so that readers never see a partially written manifest.
+    """
+    file_path = aqi_updates_dir + manifest_file_name
+    tmp_file_path = f'{file_path}.tmp'
+    with open(tmp_file_path, 'w') as f:
+        json.dump(asdict(manifest), f)
+    os.replace(tmp_file_path, file_path)
+
+
+def read_manifest(aqi_updates_dir: str) -> Union[AqiUpdateManifest, None]:
+    """Returns the manifest of the latest AQI update, or None if there is no (valid) manifest in
+    the AQI updates directory.
+    """
+    try:
+        with open(aqi_updates_dir + manifest_file_name) as f:
+            return AqiUpdateManifest(**json.load(f))
+    except Exception:
+        return None
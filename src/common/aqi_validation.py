@@ -0,0 +1,99 @@
+"""
+This module provides functions for validating AQI values (e.g. sampled AQI or AQI updates of the
+edges of a graph) as arrays at once.
+
+"""
+
+from enum import Enum
+from dataclasses import dataclass
+from typing import Any, Dict, Sequence, Union
+import numpy as np
+
+
+class AqiValidity(Enum):
+    OK = 0
+    Missing = 1
+    UnderOne = 2
+    UnderZero = 3
+    HigherThan5 = 4
+    WrongType = 5
+
+
+@dataclass(frozen=True)
+class AqiValidationReport:
+    count: int
+    validity_counts: Dict[AqiValidity, int]
+
+    @property
+    def ok_count(self) -> int:
+        return self.validity_counts[AqiValidity.OK]
+
+    @property
+    def missing_count(self) -> int:
+        return self.validity_counts[AqiValidity.Missing]
+
+    @property
+    def invalid_count(self) -> int:
+        """Returns the number of AQI values that are neither valid nor missing.
+        """
+        return self.count - self.ok_count - self.missing_count
+
+    def get_ratio(self, count: int) -> float:
+        return count / self.count if self.count else 0.0
+
+
+def __as_float_array(aqis: Union[np.ndarray, Sequence[Any]]):
+    """Returns the AQI values as a float array and a mask of the values that are not floats (as
+    NaN in the array).
+    """
+    aqi_arr = np.asarray(aqis)
+    if aqi_arr.dtype.kind == 'f':
+        return aqi_arr.astype(np.float64, copy=False), np.zeros(len(aqi_arr), dtype=bool)
+    wrong_type = np.fromiter(
+        (not isinstance(aqi, float) for aqi in aqis), dtype=bool, count=len(aqi_arr)
+    )
+    aqi_arr = np.array(
+        [np.nan if wrong else aqi for aqi, wrong in zip(aqis, wrong_type)], dtype=np.float64
+    )
+    return aqi_arr, wrong_type
+
+
+def get_aqi_validities(aqis: Union[np.ndarray, Sequence[Any]]) -> np.ndarray:
+    """Returns the validities of AQI values as an array of AqiValidity values. AQI is missing if
+    it is 0 or not finite (e.g. NaN) and valid if it is in the range 0.95-5.05.
+    """
+    aqi_arr, wrong_type = __as_float_array(aqis)
+    validities = np.full(len(aqi_arr), AqiValidity.OK.value, dtype=np.int8)
+    # assign in the reverse order of precedence, so that e.g. negative infinity is UnderZero
+    with np.errstate(invalid='ignore'):
+        validities[aqi_arr > 5.05] = AqiValidity.HigherThan5.value
+        validities[aqi_arr < 0.95] = AqiValidity.UnderOne.value
+        validities[(aqi_arr == 0.0) | ~np.isfinite(aqi_arr)] = AqiValidity.Missing.value
+        validities[aqi_arr < 0] = AqiValidity.UnderZero.value
+    validities[wrong_type] = AqiValidity.WrongType.value
+    return validities
+
+
+def get_validation_report(validities: np.ndarray) -> AqiValidationReport:
+    counts = np.bincount(validities, minlength=len(AqiValidity))
+    return AqiValidationReport(
+        count=len(validities),
+        validity_counts={validity: int(counts[validity.value]) for validity in AqiValidity}
+    )
+
+
+def validate_aqis(aqis: Union[np.ndarray, Sequence[Any]]) -> AqiValidationReport:
+    """Returns a validation report with the numbers of valid, missing and invalid AQI values
+    (by AqiValidity).
+    """
+    return get_validation_report(get_aqi_validities(aqis))
+
+
+def get_valid_aqis_or_nan(aqis: Union[np.ndarray, Sequence[Any]]) -> np.ndarray:
+    """Returns the AQI values with NaN for invalid or missing AQI. Valid values are clamped to the
+    range 1.0-5.0.
+    """
+    aqi_arr, _ = __as_float_array(aqis)
+    return np.where(
+        get_aqi_validities(aqis) == AqiValidity.OK.value, np.clip(aqi_arr, 1.0, 5.0), np.nan
+    )
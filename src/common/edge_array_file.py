@@ -0,0 +1,131 @@
+"""
+This module provides functions for writing and reading edge array files, i.e. binary files of dense
+float32 arrays of edge attributes (e.g. AQI) indexed by edge ID (id_ig).
+
+An edge array file has a small JSON header and the arrays (bands) as raw float32 data after it:
+    - magic bytes GPEA and the length of the JSON header (uint32, little-endian)
+    - JSON header: format version, graph fingerprint, data time (UTC seconds), edge count and
+      band names
+    - the bands one after another, each edge count long (missing values as NaN)
+
+The arrays can be read as memory-mapped (i.e. without parsing or copying the data). The graph
+fingerprint of the header is used to detect if the file was written for another graph than the
+one it is applied to.
+
+"""
+
+import os
+import json
+import hashlib
+import struct
+from dataclasses import dataclass
+from typing import Dict, Union
+import igraph as ig
+import numpy as np
+
+
+class EdgeArrayFileError(Exception):
+    pass
+
+
+magic = b'GPEA'
+format_version = 1
+dtype = np.dtype('<f4')
+# the data is aligned to 64 bytes after the header
+data_alignment = 64
+
+
+@dataclass(frozen=True)
+class EdgeArrayFile:
+    graph_fingerprint: str
+    data_time: int  # UTC time of the data as unix time (s)
+    edge_count: int
+    arrays: Dict[str, np.ndarray]  # memory-mapped float32 arrays by band name (e.g. aqi)
+
+
+def get_graph_fingerprint(graph: ig.Graph) -> str:
+    """Returns a fingerprint (SHA-1) of the structure of the graph, i.e. of the numbers of nodes &
+    edges and the nodes of the edges (by edge ID). Edge attributes are not included as they are
+    (partly) recalculated when the graph is loaded.
+    """
+    sha1 = hashlib.sha1(struct.pack('<qq', graph.vcount(), graph.ecount()))
+    sha1.update(np.array(graph.get_edgelist(), dtype='<i8').tobytes())
+    return sha1.hexdigest()
+
+
+def __get_header_bytes(header: dict) -> bytes:
+    header_json = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    header_size = len(magic) + 4 + len(header_json)
+    padding = -header_size % data_alignment
+    header_json += b' ' * padding
+    return magic + struct.pack('<I', len(header_json)) + header_json
+
+
+def write_edge_array_file(
+    file_path: str,
+    arrays: Dict[str, np.ndarray],
+    graph_fingerprint: str,
+    data_time: int
+) -> None:
+    """Writes arrays of edge attributes (by band name) to an edge array file. The file is written
+    to a temporary file first and then renamed, so that readers never see a partially written file.
+    """
+    edge_counts = {len(array) for array in arrays.values()}
+    if len(edge_counts) != 1:
+        raise EdgeArrayFileError(f'Arrays have different lengths: {edge_counts}')
+
+    header = {
+        'format_version': format_version,
+        'graph_fingerprint': graph_fingerprint,
+        'data_time': int(data_time),
+        'edge_count': edge_counts.pop(),
+        'bands': list(arrays.keys())
+    }
+    tmp_file_path = f'{file_path}.tmp'
+    with open(tmp_file_path, 'wb') as f:
+        f.write(__get_header_bytes(header))
+        for array in arrays.values():
+            f.write(np.asarray(array, dtype=dtype).tobytes())
+    os.replace(tmp_file_path, file_path)
+
+
+def read_edge_array_file(
+    file_path: str,
+    graph_fingerprint: Union[str, None] = None
+) -> EdgeArrayFile:
+    """Reads an edge array file with memory-mapped arrays. Raises EdgeArrayFileError if the file
+    is not a valid edge array file or if it was written for another graph than the one with the
+    given graph fingerprint.
+    """
+    with open(file_path, 'rb') as f:
+        prefix = f.read(len(magic) + 4)
+        if len(prefix) != len(magic) + 4 or prefix[:len(magic)] != magic:
+            raise EdgeArrayFileError(f'Not an edge array file: {file_path}')
+        header_length = struct.unpack('<I', prefix[len(magic):])[0]
+        header = json.loads(f.read(header_length))
+
+    if header['format_version'] != format_version:
+        raise EdgeArrayFileError(
+            f'Unsupported edge array file version: {header["format_version"]}'
+        )
+    if graph_fingerprint and header['graph_fingerprint'] != graph_fingerprint:
+        raise EdgeArrayFileError(
+            f'Edge array file {file_path} does not match the graph '
+            f'(graph fingerprint {header["graph_fingerprint"]} is not {graph_fingerprint})'
+        )
+
+    edge_count = header['edge_count']
+    bands = header['bands']
+    data = np.memmap(
+        file_path,
+        dtype=dtype,
+        mode='r',
+        offset=len(magic) + 4 + header_length,
+        shape=(len(bands), edge_count)
+    )
+    return EdgeArrayFile(
+        graph_fingerprint=header['graph_fingerprint'],
+        data_time=header['data_time'],
+        edge_count=edge_count,
+        arrays={band: data[idx] for idx, band in enumerate(bands)}
+    )
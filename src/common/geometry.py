@@ -7,6 +7,7 @@ geometries.
 
 from typing import List, Dict
 from conf import gp_conf
+import numpy as np
 import pyproj
 from pyproj import CRS
 from shapely.geometry import Point, LineString
@@ -25,6 +26,74 @@ def round_coordinates(coords_list: List[tuple], digits=6) -> List[tuple]:
     return [(round(coords[0], digits), round(coords[1], digits)) for coords in coords_list]
 
 
+def encode_polylines(coords_lists: List[List[tuple]], precision: int = 6) -> List[str]:
+    """Encodes lines of (lon, lat) coordinates with the encoded polyline algorithm (as used by e.g.
+    Google Maps, OSRM and Valhalla). As in the algorithm, latitudes are encoded before longitudes.
+    The encoding is vectorized over all lines: all coordinate deltas are split to 5-bit chunks at
+    once and the resulting string is sliced to polylines by line.
+    """
+    line_lengths = np.array([len(coords) for coords in coords_lists], dtype=np.int64)
+    if not line_lengths.sum():
+        return ['' for _ in coords_lists]
+    lat_lons = np.concatenate([
+        np.asarray(coords, dtype=np.float64).reshape(-1, 2) for coords in coords_lists
+    ])[:, ::-1]
+    values = np.round(lat_lons * 10 ** precision).astype(np.int64)
+    deltas = np.diff(values, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+    # the first coordinates of each line are encoded as such
+    line_starts = np.cumsum(line_lengths) - line_lengths
+    non_empty_starts = line_starts[line_lengths > 0]
+    deltas[non_empty_starts] = values[non_empty_starts]
+    deltas = deltas.ravel()
+    # zigzag encode signed deltas
+    values = (deltas << 1) ^ (deltas >> 63)
+    shifts = 5 * np.arange(7, dtype=np.int64)
+    chunks = (values[:, None] >> shifts) & 0x1f
+    # every value has at least one chunk, the rest are needed only if there are bits left
+    needed = (values[:, None] >> shifts) > 0
+    needed[:, 0] = True
+    continues = np.zeros_like(needed)
+    continues[:, :-1] = needed[:, 1:]
+    chars = (chunks | (continues * 0x20)) + 63
+    encoded = chars[needed].astype(np.uint8).tobytes().decode('ascii')
+
+    # slice the encoded string by lines (two values per coordinate pair)
+    chars_per_coords = needed.sum(axis=1).reshape(-1, 2).sum(axis=1)
+    coords_ends = np.concatenate(([0], np.cumsum(chars_per_coords)))
+    line_ends = coords_ends[line_starts + line_lengths]
+    line_starts = coords_ends[line_starts]
+    return [encoded[start:end] for start, end in zip(line_starts, line_ends)]
+
+
+def encode_polyline(coords_list: List[tuple], precision: int = 6) -> str:
+    """Encodes (lon, lat) coordinates with the encoded polyline algorithm (see encode_polylines).
+    """
+    return encode_polylines([coords_list], precision=precision)[0]
+
+
+def decode_polyline(polyline: str, precision: int = 6) -> List[tuple]:
+    """Decodes an encoded polyline to a list of (lon, lat) coordinates.
+    """
+    coords = []
+    index, lat, lon = 0, 0, 0
+    while index < len(polyline):
+        deltas = []
+        for _ in range(2):
+            shift, value = 0, 0
+            while True:
+                chunk = ord(polyline[index]) - 63
+                index += 1
+                value |= (chunk & 0x1f) << shift
+                shift += 5
+                if chunk < 0x20:
+                    break
+            deltas.append(~(value >> 1) if value & 1 else value >> 1)
+        lat += deltas[0]
+        lon += deltas[1]
+        coords.append((round(lon / 10 ** precision, precision), round(lat / 10 ** precision, precision)))
+    return coords
+
+
 __projections = {
     (4326, gp_conf.proj_crs_epsg): pyproj.Transformer.from_crs(
         crs_from=CRS('epsg:4326'),
@@ -0,0 +1,152 @@
+"""
+This module provides functions for writing and reading sampling manifests, i.e. compact files of
+the edge data that the AQI updater needs for sampling AQI to the edges of a graph. With the
+sampling manifest, the AQI updater can start without reading the whole graph (GraphML).
+
+A sampling manifest is written by the graph export next to the exported graph (e.g.
+graphs/hma_sampling.npz for graphs/hma.graphml) as an uncompressed NumPy archive (npz) of typed
+arrays of the edges with (WGS) geometry:
+    - id_ig, id_way (int64) and length (float64) of the edges
+    - lon & lat (float64) of the midpoints of the edges (i.e. the default sampling points)
+    - geom_coords (float64, n x 2) & geom_offsets (int64) of the WGS geometries of the edges, i.e.
+      the coordinates of the i:th edge are at geom_offsets[i]:geom_offsets[i + 1] (read only if
+      needed, e.g. for sampling at multiple points along the edges)
+    - graph_fingerprint (see common.edge_array_file) and the edge count of the graph
+
+The graph fingerprint of the manifest is written to the edge AQI updates created from it, so that
+the green path server rejects the updates if the manifest was not created for its graph.
+
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Union
+import igraph as ig
+import numpy as np
+import shapely
+from shapely.geometry import LineString
+import common.edge_array_file as edge_array_file
+from common.igraph import Edge as E
+
+
+class SamplingManifestError(Exception):
+    pass
+
+
+format_version = 1
+
+
+@dataclass(frozen=True)
+class SamplingManifest:
+    graph_fingerprint: str
+    edge_count: int  # the number of all edges of the graph
+    id_ig: np.ndarray
+    id_way: np.ndarray
+    length: np.ndarray
+    lon: np.ndarray
+    lat: np.ndarray
+    geom_coords: Union[np.ndarray, None] = None
+    geom_offsets: Union[np.ndarray, None] = None
+
+    @property
+    def has_geometries(self) -> bool:
+        return self.geom_coords is not None
+
+    def get_geometries(self) -> np.ndarray:
+        """Returns the WGS geometries of the edges as an array of LineStrings."""
+        if not self.has_geometries:
+            raise SamplingManifestError('Sampling manifest was read without edge geometries')
+        point_counts = np.diff(self.geom_offsets)
+        return shapely.linestrings(
+            self.geom_coords, indices=np.repeat(np.arange(len(point_counts)), point_counts)
+        )
+
+
+def get_sampling_manifest_file_path(graph_file: str) -> str:
+    """Returns the path of the sampling manifest of a graph file, e.g. graphs/hma_sampling.npz for
+    graphs/hma.graphml.
+    """
+    return f'{os.path.splitext(graph_file)[0]}_sampling.npz'
+
+
+def get_sampling_manifest(graph: ig.Graph) -> SamplingManifest:
+    """Creates a sampling manifest of the edges of the graph that have (WGS) LineString geometry.
+    """
+    geoms = np.array(graph.es[E.geom_wgs.value], dtype=object)
+    has_geom = np.array([isinstance(geom, LineString) for geom in geoms], dtype=bool)
+    geoms = geoms[has_geom]
+    midpoints = shapely.line_interpolate_point(geoms, 0.5, normalized=True)
+    geom_coords, geom_indices = shapely.get_coordinates(geoms, return_index=True)
+    geom_offsets = np.zeros(len(geoms) + 1, dtype=np.int64)
+    geom_offsets[1:] = np.cumsum(np.bincount(geom_indices, minlength=len(geoms)))
+    return SamplingManifest(
+        graph_fingerprint=edge_array_file.get_graph_fingerprint(graph),
+        edge_count=graph.ecount(),
+        id_ig=np.array(graph.es[E.id_ig.value], dtype=np.int64)[has_geom],
+        id_way=np.array(graph.es[E.id_way.value], dtype=np.int64)[has_geom],
+        length=np.array(graph.es[E.length.value], dtype=np.float64)[has_geom],
+        lon=shapely.get_x(midpoints),
+        lat=shapely.get_y(midpoints),
+        geom_coords=geom_coords,
+        geom_offsets=geom_offsets
+    )
+
+
+def write_sampling_manifest(file_path: str, manifest: SamplingManifest) -> None:
+    """Writes a sampling manifest (with edge geometries) to a file. The file is written to a
+    temporary file first and then renamed, so that readers never see a partially written file.
+    """
+    if not manifest.has_geometries:
+        raise SamplingManifestError('Cannot write sampling manifest without edge geometries')
+    tmp_file_path = f'{file_path}.tmp'
+    with open(tmp_file_path, 'wb') as f:
+        np.savez(
+            f,
+            format_version=np.array(format_version),
+            graph_fingerprint=np.array(manifest.graph_fingerprint),
+            edge_count=np.array(manifest.edge_count, dtype=np.int64),
+            id_ig=manifest.id_ig,
+            id_way=manifest.id_way,
+            length=manifest.length,
+            lon=manifest.lon,
+            lat=manifest.lat,
+            geom_coords=manifest.geom_coords,
+            geom_offsets=manifest.geom_offsets
+        )
+    os.replace(tmp_file_path, file_path)
+
+
+def read_sampling_manifest(
+    file_path: str,
+    with_geometries: bool = False,
+    graph_fingerprint: Union[str, None] = None
+) -> SamplingManifest:
+    """Reads a sampling manifest. Edge geometries are read only if with_geometries is True. Raises
+    SamplingManifestError if the file is not a valid sampling manifest or if it was created for
+    another graph than the one with the given graph fingerprint.
+    """
+    try:
+        data = np.load(file_path, allow_pickle=False)
+    except (OSError, ValueError) as e:
+        raise SamplingManifestError(f'Not a sampling manifest: {file_path} ({e})')
+
+    with data:
+        if 'format_version' not in data or int(data['format_version']) != format_version:
+            raise SamplingManifestError(f'Unsupported sampling manifest: {file_path}')
+        manifest_graph_fingerprint = str(data['graph_fingerprint'])
+        if graph_fingerprint and manifest_graph_fingerprint != graph_fingerprint:
+            raise SamplingManifestError(
+                f'Sampling manifest {file_path} does not match the graph '
+                f'(graph fingerprint {manifest_graph_fingerprint} is not {graph_fingerprint})'
+            )
+        return SamplingManifest(
+            graph_fingerprint=manifest_graph_fingerprint,
+            edge_count=int(data['edge_count']),
+            id_ig=data['id_ig'],
+            id_way=data['id_way'],
+            length=data['length'],
+            lon=data['lon'],
+            lat=data['lat'],
+            geom_coords=data['geom_coords'] if with_geometries else None,
+            geom_offsets=data['geom_offsets'] if with_geometries else None
+        )
@@ -7,9 +7,10 @@ comparing exposures to air pollution between paths.
 
 from collections import defaultdict
 from gp_server.app.constants import RoutingMode, TravelMode, cost_prefix_dict
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Union
 from math import floor
 import numpy as np
+from common.aqi_coeffs import get_aqi_coeffs
 
 
 class InvalidAqiException(Exception):
@@ -78,6 +79,82 @@ def get_aqi_costs(
     return aq_costs
 
 
+def get_aqi_cost_arrays(
+    aqis: np.ndarray,
+    lengths: np.ndarray,
+    sensitivities: List[float],
+    bike_time_costs: np.ndarray = None,
+    travel_mode: TravelMode = TravelMode.WALK
+) -> Dict[str, np.ndarray]:
+    """Returns AQI based costs (see get_aqi_costs) for arrays of edges at once as a dictionary of
+    cost arrays by cost attribute names (e.g. c_aq_5).
+    """
+    return get_aqi_coeff_cost_arrays(
+        get_aqi_coeffs(aqis),
+        lengths,
+        sensitivities,
+        bike_time_costs=bike_time_costs,
+        travel_mode=travel_mode
+    )
+
+
+def get_aqi_coeff_cost_arrays(
+    aqi_coeffs: np.ndarray,
+    lengths: np.ndarray,
+    sensitivities: List[float],
+    bike_time_costs: np.ndarray = None,
+    travel_mode: TravelMode = TravelMode.WALK
+) -> Dict[str, np.ndarray]:
+    """Returns AQI based costs for arrays of edges from precalculated AQI cost coefficients
+    (e.g. published by the AQI updater) as a dictionary of cost arrays by cost attribute names.
+    """
+    base_costs = lengths if bike_time_costs is None else np.where(
+        bike_time_costs != 0, bike_time_costs, lengths
+    )
+    cost_prefix = cost_prefix_dict[travel_mode][RoutingMode.CLEAN]
+    return {
+        f'{cost_prefix}{sen}': np.round(base_costs + base_costs * aqi_coeffs * sen, 2)
+        for sen in sensitivities
+    }
+
+
+def get_missing_aqi_cost_array(lengths: np.ndarray) -> np.ndarray:
+    """Returns high AQ costs (aqi_coeff=40 with sensitivity 5) for edges without AQI, so that they
+    are avoided in AQI based routing. Edges without geometry (length 0) get cost 0.
+    """
+    return np.where(lengths == 0.0, 0.0, np.round(lengths + lengths * 200, 2))
+
+
+def interpolate_aqi_coeffs(aqi_coeff_hours: List[np.ndarray], hours: np.ndarray) -> np.ndarray:
+    """Returns AQ cost coefficients of edges at the given times by linear interpolation between
+    hourly coefficient arrays. Times outside the hours are clamped to the first or the last hour.
+    Coefficients that are missing (NaN) in the forecast hours are taken from the first hour.
+
+    Args:
+        aqi_coeff_hours: AQ cost coefficient arrays (by edge ID) of consecutive hours.
+        hours: The times at which the coefficients of the edges are needed, as hours from the
+            time of the first coefficient array (by edge ID).
+    """
+    first_hour_coeffs = aqi_coeff_hours[0]
+    last_hour = len(aqi_coeff_hours) - 1
+    hours = np.clip(hours, 0, last_hour)
+    hour_idxs = np.minimum(hours.astype(np.int64), max(last_hour - 1, 0))
+    weights = hours - hour_idxs
+    aqi_coeffs = np.array(first_hour_coeffs, dtype=np.float64)
+
+    def get_coeffs(hour: int, idxs: np.ndarray) -> np.ndarray:
+        coeffs = aqi_coeff_hours[hour][idxs]
+        return np.where(np.isnan(coeffs), first_hour_coeffs[idxs], coeffs)
+
+    for hour in range(last_hour):
+        idxs = np.flatnonzero(hour_idxs == hour)
+        if not len(idxs):
+            continue
+        w = weights[idxs]
+        aqi_coeffs[idxs] = get_coeffs(hour, idxs) * (1 - w) + get_coeffs(hour + 1, idxs) * w
+    return aqi_coeffs
+
+
 def get_aqi_cost_from_exp(
     aqi_exp: Tuple[float, float],
     sensitivity: float = 1.0
@@ -107,6 +184,21 @@ def get_aqi_class(aqi: float) -> int:
     return floor(aqi * 2) - 1 if np.isfinite(aqi) else 0
 
 
+def get_aqi_classes(aqis: List[Union[float, None]]) -> List[Union[int, None]]:
+    """Returns AQI classes (see get_aqi_class) for a list of AQI values at once. The AQI class is
+    None for missing AQI values (None or 0).
+    """
+    aqi_arr = np.array(aqis, dtype=np.float64)
+    missing = np.fromiter((aqi is None for aqi in aqis), dtype=bool, count=len(aqis))
+    missing |= aqi_arr == 0
+    finite = np.isfinite(aqi_arr)
+    classes = np.zeros(len(aqis), dtype=np.int64)
+    classes[finite] = np.floor(aqi_arr[finite] * 2) - 1
+    aqi_classes = classes.astype(object)
+    aqi_classes[missing] = None
+    return aqi_classes.tolist()
+
+
 def aggregate_aqi_class_exps(aqi_exp_list: List[Tuple[float, float]]) -> Dict[int, float]:
     """Returns a dictionary of aggregated exposures to different AQI classes
     (e.g. { 1: 305, 2: 205, 3: 50.4 }).
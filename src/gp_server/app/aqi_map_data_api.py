@@ -1,12 +1,27 @@
-from typing import Union, Callable
-from dataclasses import dataclass
-import os
+"""
+This module provides the AQI map data API, i.e. the latest AQI classes of the edges (by id_way) as
+JSON for drawing the AQI map. The data is versioned by the name of the AQI update, so that clients
+can revalidate cached data (ETag) and request only the changes since the previous AQI update.
+
+Map data and deltas written by the AQI updater (see common.aqi_map_data) are served as they are,
+i.e. the full map data is not parsed in the workers. Older map data files (without version) are
+parsed and the deltas are computed from the AQI classes of the previous map data.
+
+"""
+
+import json
+from typing import Dict, List, Tuple, Union, Callable
+from dataclasses import dataclass, field
+import numpy as np
 from gp_server.conf import conf
-import random
 from functools import partial
-from datetime import datetime, timezone
-from apscheduler.schedulers.background import BackgroundScheduler
 from gp_server.app.logger import Logger
+from gp_server.app.file_watcher import FileWatcher
+import gp_server.app.compression as compression
+import common.aqi_update_manifest as aqi_manifest
+import common.aqi_map_data as aqi_map_data
+from common.aqi_map_data import get_aqi_classes_by_id, get_aqi_class_changes
+from common.aqi_update_manifest import AqiUpdateManifest
 
 
 @dataclass(frozen=True)
@@ -16,44 +31,106 @@ class AqiMapDataApi:
     get_status: Callable
 
 
+@dataclass(frozen=True)
+class AqiMapDataSnapshot:
+    """AQI map data of one AQI update. A new snapshot is created for each AQI update and it
+    replaces the previous one as a whole, so that the data and the version of a response are
+    always of the same AQI update.
+    """
+    version: str = ''
+    data_time: int = None
+    # AQI map data by content encoding (compressed once per update), e.g.
+    # {'identity': b'{"data":[[0,3],[1,3],...],"version":"aqi_2020-10-25T14.bin"}', 'gzip': b'...'}
+    map_data: Dict[str, bytes] = field(default_factory=dict)
+    # changes in AQI classes since the previous (and the latest) AQI update by version & encoding, e.g.
+    # {'aqi_2020-10-25T13.bin': {'identity': b'{"data":[[5,4]],"removed":[],...}', 'gzip': ...}}
+    map_deltas: Dict[str, Dict[str, bytes]] = field(default_factory=dict)
+    # AQI classes by id_way (-1 for edges without AQI class) of the AQI update (only if the map
+    # data had to be parsed, i.e. it was not written with version by the AQI updater)
+    aqi_classes: np.ndarray = None
+
+
 @dataclass(frozen=False)
 class AqiMapDataState:
-    latest_aqi_data_name: str = ''
-    latest_aqi_map_data: str = ''  # {"data":[[0,3],[1,3],[2,3],...]}
-    latest_aqi_map_data_utc_time_secs: str = None
+    latest: AqiMapDataSnapshot = field(default_factory=AqiMapDataSnapshot)
+
+
+def __to_json_payloads(data: dict) -> Dict[str, bytes]:
+    return compression.get_compressed_payloads(
+        json.dumps(data, separators=(',', ':')).encode('utf-8')
+    )
 
 
-def __get_expected_aqi_data_name() -> str:
-    """Returns the name of the expected latest aqi data csv file based on the current time,
-    e.g. aqi_2019-11-11T17.csv.
+def __get_latest_aqi_update(aqi_dir: str) -> Union[AqiUpdateManifest, None]:
+    """Returns the manifest of the latest AQI update (see common.aqi_update_manifest) or None if
+    no AQI update is available. In test mode, the manifest of the test AQI data is returned.
     """
     if conf.test_mode:
-        return 'aqi_2020-10-25T14.csv'
-    curdt = datetime.utcnow().strftime('%Y-%m-%dT%H')
-    return f'aqi_{curdt}.csv'
-
-
-def __get_aqi_data_utc_time_secs(log: Logger, aqi_data_name: str) -> Union[int, None]:
-    try:
-        aqi_data_time = aqi_data_name.split('aqi_', 1)[1].split('.')[0]
-        dt = datetime.strptime(aqi_data_time, '%Y-%m-%dT%H')
-        return int(dt.replace(tzinfo=timezone.utc).timestamp())
-    except Exception:
-        log.error(f'Could not parse UTC time from {aqi_data_name}')
-        return None
+        return AqiUpdateManifest('aqi_2020-10-25T14.csv', 'aqi_map.json', 1603634400)
+    return aqi_manifest.read_manifest(aqi_dir)
+
 
+def __get_delta_payloads(
+    changed: List[List[int]],
+    removed: List[int],
+    since: str,
+    version: str
+) -> Dict[str, bytes]:
+    return __to_json_payloads(aqi_map_data.get_delta(changed, removed, since, version))
 
-def __aqi_data_available(expected_aqi_data_name: str, aqi_dir: str) -> bool:
-    """Returns true if new AQI update file is both expected and available, else returns False.
+
+def __read_delta_payloads(
+    aqi_dir: str,
+    aqi_update: AqiUpdateManifest
+) -> Union[Tuple[str, Dict[str, bytes]], None]:
+    """Returns the version that the delta file of the AQI update is since and the delta as
+    compressed payloads, or None if the AQI update has no (matching) delta file.
     """
-    return (os.path.exists(aqi_dir + expected_aqi_data_name) and
-            os.path.exists(aqi_dir + 'aqi_map.json'))
+    if not aqi_update.aqi_map_delta:
+        return None
+    with open(aqi_dir + aqi_update.aqi_map_delta, 'rb') as f:
+        delta = f.read()
+    delta_json = json.loads(delta)
+    if delta_json['version'] != aqi_update.aqi_update:
+        return None
+    return delta_json['since'], compression.get_compressed_payloads(delta)
 
 
-def __update_state(log: Logger, f, new_aqi_data_name: str, state: AqiMapDataState) -> None:
-    state.latest_aqi_map_data = f.read()
-    state.latest_aqi_data_name = new_aqi_data_name
-    state.latest_aqi_map_data_utc_time_secs = __get_aqi_data_utc_time_secs(log, new_aqi_data_name)
+def __get_snapshot(
+    map_data: bytes,
+    aqi_dir: str,
+    aqi_update: AqiUpdateManifest,
+    prev_snapshot: AqiMapDataSnapshot
+) -> AqiMapDataSnapshot:
+    version = aqi_update.aqi_update
+    deltas = {version: __get_delta_payloads([], [], version, version)}
+
+    if aqi_map_data.is_aqi_map_data_of_version(map_data, version):
+        latest_aqi_map_data = compression.get_compressed_payloads(map_data)
+        aqi_classes = None
+        delta = __read_delta_payloads(aqi_dir, aqi_update)
+        if delta:
+            deltas[delta[0]] = delta[1]
+    elif aqi_map_data.is_versioned_aqi_map_data(map_data):
+        # the map data of the next AQI update was written before its manifest
+        raise ValueError(f'AQI map data is not of the AQI update {version}')
+    else:
+        id_aqi_pairs = json.loads(map_data)['data']
+        latest_aqi_map_data = __to_json_payloads({'data': id_aqi_pairs, 'version': version})
+        aqi_classes = get_aqi_classes_by_id(id_aqi_pairs)
+        if prev_snapshot.aqi_classes is not None:
+            changed, removed = get_aqi_class_changes(prev_snapshot.aqi_classes, aqi_classes)
+            deltas[prev_snapshot.version] = __get_delta_payloads(
+                changed, removed, prev_snapshot.version, version
+            )
+
+    return AqiMapDataSnapshot(
+        version=version,
+        data_time=aqi_update.data_time,
+        map_data=latest_aqi_map_data,
+        map_deltas=deltas,
+        aqi_classes=aqi_classes
+    )
 
 
 def __maybe_load_updated_aqi_data(
@@ -61,43 +138,57 @@ def __maybe_load_updated_aqi_data(
     aqi_dir: str,
     state: AqiMapDataState
 ) -> Union[None, str]:
-    expected_aqi_data_name = __get_expected_aqi_data_name()
-
-    if state.latest_aqi_data_name != expected_aqi_data_name:
-        if __aqi_data_available(expected_aqi_data_name, aqi_dir):
-            try:
-                with open(aqi_dir + 'aqi_map.json', 'r') as f:
-                    __update_state(log, f, expected_aqi_data_name, state)
-                    log.info('Loaded new AQI data for map API')
-            except Exception:
-                log.error(
-                    f'Could not load new AQI data for map API from "{expected_aqi_data_name}"'
-                )
-
-
-def __start_aqi_map_data_api(log: Logger, aqi_data_loader: Callable):
-    check_interval = 5 + random.randint(1, 10)
-
-    log.info(f'Starting AQI map data API with {check_interval} s check interval')
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(
-        aqi_data_loader,
-        'interval',
-        seconds=5,
-        max_instances=1,
-        next_run_time=datetime.now()
-    )
-    scheduler.start()
+    aqi_update = __get_latest_aqi_update(aqi_dir)
+
+    if aqi_update and state.latest.version != aqi_update.aqi_update:
+        try:
+            with open(aqi_dir + aqi_update.aqi_map, 'rb') as f:
+                map_data = f.read()
+            # replace the snapshot as a whole (by a single assignment) for concurrent requests
+            state.latest = __get_snapshot(map_data, aqi_dir, aqi_update, state.latest)
+            log.info('Loaded new AQI data for map API')
+        except Exception:
+            log.error(
+                f'Could not load new AQI data for map API from "{aqi_update.aqi_map}"'
+            )
+
 
+def __start_aqi_map_data_api(log: Logger, watcher: FileWatcher):
+    log.info('Starting AQI map data API')
+    watcher.start()
 
-def __get_aqi_map_data(log: Logger, state: AqiMapDataState):
-    return state.latest_aqi_map_data
+
+def __get_aqi_map_data(
+    log: Logger,
+    state: AqiMapDataState,
+    encoding: str = compression.IDENTITY,
+    since: Union[str, None] = None
+) -> Tuple[bytes, str, Union[int, None]]:
+    """Returns the latest AQI map data (JSON) as compressed with the given content encoding
+    (or as uncompressed if the encoding is 'identity') together with its version (i.e. the name of
+    the AQI update) and UTC time (unix time, s). Returns empty bytes and an empty version if no data
+    is available.
+
+    If since is the version of the previous (or the latest) AQI update, only the changes in AQI
+    classes since it are returned. For any other version (e.g. older than the previous one), all
+    data is returned.
+    """
+    snapshot = state.latest
+    if not snapshot.map_data:
+        return b'', '', None
+    if since in snapshot.map_deltas:
+        data = snapshot.map_deltas[since].get(encoding, b'')
+    else:
+        data = snapshot.map_data.get(encoding, b'')
+    return data, snapshot.version, snapshot.data_time
 
 
 def __get_aqi_map_data_status(state: AqiMapDataState):
+    snapshot = state.latest
     return {
-        'aqi_map_data_available': state.latest_aqi_map_data != '',
-        'aqi_map_data_utc_time_secs': state.latest_aqi_map_data_utc_time_secs
+        'aqi_map_data_available': bool(snapshot.map_data),
+        'aqi_map_data_utc_time_secs': snapshot.data_time,
+        'aqi_map_data_version': snapshot.version
     }
 
 
@@ -106,7 +197,8 @@ def get_aqi_map_data_api(log: Logger, aqi_dir: str = 'aqi_updates/') -> AqiMapDa
 
     state = AqiMapDataState()
     aqi_data_loader = partial(__maybe_load_updated_aqi_data, log, use_aqi_dir, state)
-    start = partial(__start_aqi_map_data_api, log, aqi_data_loader)
+    watcher = FileWatcher(log, use_aqi_dir, aqi_manifest.manifest_file_name, aqi_data_loader)
+    start = partial(__start_aqi_map_data_api, log, watcher)
     get_aqi_map_data = partial(__get_aqi_map_data, log, state)
     get_aqi_map_data_status = partial(__get_aqi_map_data_status, state)
     return AqiMapDataApi(start, get_aqi_map_data, get_aqi_map_data_status)
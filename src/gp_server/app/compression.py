@@ -0,0 +1,95 @@
+"""
+This module provides functions for compressing API responses with gzip or brotli (if the optional
+brotli package is installed). The content encoding of a response is negotiated from the
+Accept-Encoding header of the request.
+
+Static payloads (e.g. AQI map data) can be compressed once with get_compressed_payloads and served
+as such, whereas dynamic payloads (e.g. paths) can be compressed in chunks while sending the
+response with iter_compressed.
+
+"""
+
+from typing import Dict, Iterator, List, Union
+import zlib
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+GZIP = 'gzip'
+BROTLI = 'br'
+IDENTITY = 'identity'
+
+# dynamic payloads smaller than this (bytes) are not worth compressing
+min_compress_size = 1400
+chunk_size = 64 * 1024
+
+# compression levels for payloads that are compressed once and for payloads compressed per request
+static_gzip_level = 9
+static_brotli_quality = 9
+dynamic_gzip_level = 5
+dynamic_brotli_quality = 4
+
+
+def get_supported_encodings() -> List[str]:
+    """Returns supported content encodings in the order of preference.
+    """
+    return [BROTLI, GZIP] if brotli else [GZIP]
+
+
+def get_accepted_encoding(accept_encodings) -> str:
+    """Returns the preferred supported content encoding accepted by the client, or 'identity' if no
+    supported encoding is accepted. Accept_encodings is the parsed Accept-Encoding header of the
+    request (e.g. flask.request.accept_encodings).
+    """
+    return accept_encodings.best_match(get_supported_encodings(), default=IDENTITY)
+
+
+def __get_gzip_compressor(level: int):
+    # wbits 16 + 15 writes gzip header & trailer
+    return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+def compress(data: bytes, encoding: str, static: bool = False) -> bytes:
+    if encoding == BROTLI:
+        return brotli.compress(
+            data, quality=static_brotli_quality if static else dynamic_brotli_quality
+        )
+    if encoding == GZIP:
+        compressor = __get_gzip_compressor(static_gzip_level if static else dynamic_gzip_level)
+        return compressor.compress(data) + compressor.flush()
+    return data
+
+
+def get_compressed_payloads(data: bytes) -> Dict[str, bytes]:
+    """Returns the data compressed with all supported content encodings (including the original
+    data as 'identity'). Compressing is slow, so this should only be used for static payloads.
+    """
+    payloads = {IDENTITY: data}
+    for encoding in get_supported_encodings():
+        payloads[encoding] = compress(data, encoding, static=True)
+    return payloads
+
+
+def iter_compressed(data: bytes, encoding: str) -> Iterator[bytes]:
+    """Compresses the data in chunks, so that the compressed response can be sent while the rest of
+    the data is still being compressed.
+    """
+    if encoding == BROTLI:
+        compressor = brotli.Compressor(quality=dynamic_brotli_quality)
+        compress_chunk, finish = compressor.process, compressor.finish
+    else:
+        compressor = __get_gzip_compressor(dynamic_gzip_level)
+        compress_chunk, finish = compressor.compress, compressor.flush
+
+    view = memoryview(data)
+    for start in range(0, len(data), chunk_size):
+        compressed = compress_chunk(view[start:start + chunk_size])
+        if compressed:
+            yield compressed
+    yield finish()
+
+
+def should_compress(data: Union[bytes, str], encoding: str) -> bool:
+    return encoding != IDENTITY and len(data) >= min_compress_size
@@ -1,5 +1,5 @@
 from enum import Enum
-from typing import Dict
+from typing import Dict, FrozenSet
 
 
 class TravelMode(Enum):
@@ -21,6 +21,27 @@ class PathType(Enum):
     CLEAN = RoutingMode.CLEAN.value
     FASTEST = RoutingMode.FAST.value
     SAFEST = RoutingMode.SAFE.value
+    SHORTEST = 'short'  # only for labeling the fastest path in research mode
+
+
+class ResponseFormat(Enum):
+    """Media types of the path responses (negotiated with the Accept header)."""
+    GEOJSON = 'application/json'
+    POLYLINE = 'application/vnd.greenpaths.polyline+json'  # geometries as encoded polylines
+
+
+class ResponseField(Enum):
+    """Optional parts of the path responses (selected with the include query parameter)."""
+    EDGE_FC = 'edge_FC'  # edge groups of the paths
+    EXPOSURES = 'exposures'  # exposures to noise levels & AQI and GVI classes
+    COMPARISON = 'comparison'  # differences to the fastest path
+
+
+all_response_fields: FrozenSet[ResponseField] = frozenset(ResponseField)
+
+# the id of the graph edge that a linking edge was created on (kept in the attributes of linking
+# edges, but not added to the graph, see GraphHandler.add_new_edges_to_graph())
+link_base_edge_id_key = 'base_edge_id'
 
 
 cost_prefix_dict: Dict[TravelMode, Dict[RoutingMode, str]] = {
@@ -65,6 +86,8 @@ class ErrorKey(Enum):
     NO_REAL_TIME_AQI_AVAILABLE = 'no_real_time_aqi_available'
     INVALID_TRAVEL_MODE_PARAM = 'invalid_travel_mode_in_request_params'
     INVALID_ROUTING_MODE_PARAM = 'invalid_routing_mode_in_request_params'
+    INVALID_INCLUDE_PARAM = 'invalid_include_in_request_params'
+    INVALID_DEPART_AT_PARAM = 'invalid_depart_at_in_request_params'
     SAFE_PATHS_ONLY_AVAILABLE_FOR_BIKE = 'routing_mode_safe_is_only_for_bike'
     AQI_ROUTING_NOT_AVAILABLE = 'air_quality_routing_not_available'
     UNKNOWN_ERROR = 'unknown_error'
@@ -85,6 +108,8 @@ status_code_by_error: Dict[ErrorKey, int] = {
     ErrorKey.NO_REAL_TIME_AQI_AVAILABLE.value: 503,
     ErrorKey.INVALID_TRAVEL_MODE_PARAM.value: 400,
     ErrorKey.INVALID_ROUTING_MODE_PARAM.value: 400,
+    ErrorKey.INVALID_INCLUDE_PARAM.value: 400,
+    ErrorKey.INVALID_DEPART_AT_PARAM.value: 400,
     ErrorKey.SAFE_PATHS_ONLY_AVAILABLE_FOR_BIKE.value: 400,
     ErrorKey.AQI_ROUTING_NOT_AVAILABLE.value: 503,
     ErrorKey.UNKNOWN_ERROR.value: 500
@@ -0,0 +1,165 @@
+"""
+This module provides a file watcher that calls a function when a file is created or replaced in a
+directory (e.g. when the AQI updater writes a new AQI update manifest).
+
+On Linux, changes are detected with inotify (via libc, without additional dependencies), so that
+the function is called immediately after the change without polling the file system. Elsewhere, or
+if inotify is not available, the modification time of the file is polled with a fixed interval.
+
+"""
+
+import os
+import time
+import errno
+import select
+import struct
+import threading
+import traceback
+import ctypes
+import ctypes.util
+from typing import Callable, Tuple, Union
+from gp_server.app.logger import Logger
+
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+# header of struct inotify_event: wd (int), mask, cookie & len (uint32), followed by the name
+inotify_event_header = struct.Struct('iIII')
+
+
+def __get_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        return libc if hasattr(libc, 'inotify_init1') else None
+    except Exception:
+        return None
+
+
+def _init_inotify(dir: str) -> Union[int, None]:
+    """Returns a non-blocking inotify file descriptor watching the directory for created, written
+    and moved (renamed) files, or None if inotify is not available.
+    """
+    libc = __get_libc()
+    if not libc:
+        return None
+    fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    if fd < 0:
+        return None
+    wd = libc.inotify_add_watch(
+        fd, os.fsencode(dir), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+    )
+    if wd < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+def _read_inotify_file_names(fd: int) -> Tuple[str, ...]:
+    """Reads all pending inotify events and returns the names of the changed files.
+    """
+    names = []
+    while True:
+        try:
+            data = os.read(fd, 64 * 1024)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                break
+            raise
+        offset = 0
+        while offset < len(data):
+            _, _, _, name_len = inotify_event_header.unpack_from(data, offset)
+            offset += inotify_event_header.size
+            names.append(os.fsdecode(data[offset:offset + name_len].rstrip(b'\0')))
+            offset += name_len
+    return tuple(names)
+
+
+class FileWatcher:
+    """FileWatcher calls on_change (in a background thread) when the watched file is created,
+    written or replaced, and once when the watcher is started.
+
+    Attributes:
+        __dir (str): The directory of the watched file (e.g. 'aqi_updates/').
+        __file_name (str): The name of the watched file.
+        __on_change: A function to call when the file has changed.
+        __poll_interval (int): The number of seconds between checks of the file if inotify is not
+            available.
+        __check_interval (int): The number of seconds between checks of the file even if inotify
+            is available (in case an event is missed).
+        __file_signature: The modification time, inode and size of the file when on_change was
+            last called.
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        dir: str,
+        file_name: str,
+        on_change: Callable[[], None],
+        poll_interval: int = 10,
+        check_interval: int = 300
+    ):
+        self.log = logger
+        self.__dir = dir
+        self.__file_name = file_name
+        self.__on_change = on_change
+        self.__poll_interval = poll_interval
+        self.__check_interval = check_interval
+        self.__file_signature = None
+        self.__stopped = threading.Event()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+
+    def start(self) -> None:
+        self.__thread.start()
+
+    def stop(self) -> None:
+        self.__stopped.set()
+
+    def __get_file_signature(self) -> Union[Tuple[int, int, int], None]:
+        try:
+            stat = os.stat(self.__dir + self.__file_name)
+            return (stat.st_mtime_ns, stat.st_ino, stat.st_size)
+        except OSError:
+            return None
+
+    def __call_on_change(self) -> None:
+        try:
+            self.__on_change()
+        except Exception:
+            self.log.error(traceback.format_exc())
+
+    def __maybe_call_on_change(self) -> None:
+        file_signature = self.__get_file_signature()
+        if file_signature and file_signature != self.__file_signature:
+            self.__file_signature = file_signature
+            self.__call_on_change()
+
+    def __run(self) -> None:
+        # start watching before the initial call so that changes during it are not missed
+        fd = _init_inotify(self.__dir)
+        self.__file_signature = self.__get_file_signature()
+        self.__call_on_change()
+
+        if fd is None:
+            self.log.info(
+                f'Watching {self.__dir}{self.__file_name} by polling every '
+                f'{self.__poll_interval} s (inotify not available)'
+            )
+            while not self.__stopped.wait(self.__poll_interval):
+                self.__maybe_call_on_change()
+            return
+
+        self.log.info(f'Watching {self.__dir}{self.__file_name} with inotify')
+        try:
+            last_check = time.time()
+            while not self.__stopped.is_set():
+                readable, _, _ = select.select([fd], [], [], 1.0)
+                if readable and self.__file_name in _read_inotify_file_names(fd):
+                    self.__maybe_call_on_change()
+                    last_check = time.time()
+                elif time.time() - last_check > self.__check_interval:
+                    self.__maybe_call_on_change()
+                    last_check = time.time()
+        finally:
+            os.close(fd)
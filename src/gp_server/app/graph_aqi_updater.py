@@ -1,38 +1,48 @@
 from gp_server.app.types import RoutingConf
+import os
 import time
 import gc
-import random
 import traceback
+import numpy as np
 import pandas as pd
-from os import listdir
 from datetime import datetime, timezone
-from apscheduler.schedulers.background import BackgroundScheduler
 from gp_server.conf import conf
 from gp_server.app.graph_handler import GraphHandler
 import gp_server.app.aq_exposures as aq_exps
 from gp_server.app.logger import Logger
-import common.igraph as ig_utils
+import common.edge_array_file as edge_array_file
+import common.aqi_update_manifest as aqi_manifest
+import common.aqi_validation as aqi_validation
+from common.aqi_validation import AqiValidationReport
+from common.aqi_coeffs import get_aqi_coeffs
+from gp_server.app.file_watcher import FileWatcher
 from common.igraph import Edge as E
-from typing import Union
-from gp_server.app.constants import cost_prefix_dict, RoutingMode, TravelMode
+from typing import Dict, List, Tuple, Union
+from gp_server.app.constants import TravelMode
 
 
 class GraphAqiUpdater:
     """GraphAqiUpdater updates new AQI to graph if new AQI data is available in aqi_updates/.
+    AQI and AQ costs are published to the graph handler as AQ snapshots, so that routing
+    requests are not affected by an update in progress.
+
+    AQI updates are sampled only once per host by the AQI updater, which publishes the AQI values
+    and AQ cost coefficients of the edges as a binary file to the shared aqi_updates/ directory.
+    Each worker then only maps the new file and derives its AQ costs from the coefficients.
+    New AQI updates are detected by watching the AQI update manifest that the AQI updater writes
+    after each complete update (see common.aqi_update_manifest).
 
     Attributes:
         __aqi_update_status (str): A message describing the current state of the AQI updater.
-        __aqi_data_wip (str): The name of an aqi data csv file that is currently being updated
+        __aqi_data_wip (str): The name of an aqi data file that is currently being updated
             to a graph.
-        __aqi_data_latest (str): The name of the aqi data csv file that was last updated to a graph.
+        __aqi_data_latest (str): The name of the aqi data file that was last updated to a graph.
         __G: A GraphHandler object via which aqi values are updated to a graph.
-        __edge_df: A pandas DataFrame object containing edges to be updated
-            (as by __create_updater_edge_df()).
+        __graph_fingerprint (str): A fingerprint of the graph for validating binary AQI updates.
         __sens (List[float]): A list of air quality sensitivity coefficients.
         __aqi_dir (str): A path to an aqi_cache -directory (e.g. 'aqi_cache/').
-        __scheduler: A BackgroundScheduler instance that will periodically check for new aqi data
-            and update it to a graph if available.
-        __check_interval (int): The number of seconds between AQI update attempts.
+        __watcher: A FileWatcher instance that triggers an AQI update when the AQI update
+            manifest changes (and once at start).
     """
 
     def __init__(self, logger: Logger, G: GraphHandler, aqi_dir: str, routing_conf: RoutingConf):
@@ -42,31 +52,20 @@ class GraphAqiUpdater:
         self.__aqi_data_wip = ''
         self.__aqi_data_latest = ''
         self.__G = G
-        self.__edge_df = self.__create_updater_edge_df(G)
+        self.__graph_fingerprint = edge_array_file.get_graph_fingerprint(G.graph)
         self.__sens = routing_conf.aq_sensitivities
         self.__aqi_dir = aqi_dir if not conf.test_mode else 'aqi_updates/test_data/'
-        self.__scheduler = BackgroundScheduler()
-        self.__check_interval = 5 + random.randint(1, 15)
-        self.__scheduler.add_job(
-            self.__maybe_read_update_aqi_to_graph,
-            'interval',
-            seconds=self.__check_interval,
-            max_instances=2,
-            next_run_time=datetime.now()
+        self.__watcher = FileWatcher(
+            self.log,
+            self.__aqi_dir,
+            aqi_manifest.manifest_file_name,
+            self.__maybe_read_update_aqi_to_graph
         )
         self.__start()
 
-    def __create_updater_edge_df(self, G: GraphHandler):
-        attrs = [E.length, E.bike_time_cost] if conf.cycling_enabled else [E.length]
-        edge_df = ig_utils.get_edge_gdf(G.graph, attrs=attrs)
-        edge_df[E.id_ig.name] = edge_df.index
-        return edge_df[[E.id_ig.name] + [attr.name for attr in attrs]]
-
     def __start(self):
-        self.log.info(
-            f'Starting graph aqi updater with check interval (s): {self.__check_interval}'
-        )
-        self.__scheduler.start()
+        self.log.info('Starting graph aqi updater')
+        self.__watcher.start()
 
     def __get_latest_aqi_data_utc_time_secs(self) -> Union[int, None]:
         if self.__aqi_data_latest and not self.__aqi_update_error:
@@ -90,12 +89,11 @@ class GraphAqiUpdater:
         """Triggers an AQI to graph update if new AQI data is available and not yet updated or
         being updated.
         """
-        new_aqi_data_csv = self.__new_aqi_data_available()
-        if new_aqi_data_csv:
+        new_aqi_data_file = self.__new_aqi_data_available()
+        if new_aqi_data_file:
             for attempt in range(3):
                 try:
-                    aqi_data_name = self.__read_update_aqi_to_graph(new_aqi_data_csv)
-                    self.__validate_graph_aqi()
+                    aqi_data_name = self.__read_update_aqi_to_graph(new_aqi_data_file)
                     self.__aqi_data_latest = aqi_data_name
                     self.__aqi_update_error = ''
                     self.__aqi_data_wip = ''
@@ -104,7 +102,7 @@ class GraphAqiUpdater:
                 except Exception:
                     self.__aqi_update_error = (
                         f'AQI update attempt no. {attempt+1}/3 failed '
-                        f'from AQI update file: {new_aqi_data_csv}'
+                        f'from AQI update file: {new_aqi_data_file}'
                     )
                     self.log.error(self.__aqi_update_error)
                     self.log.error(traceback.format_exc())
@@ -116,170 +114,224 @@ class GraphAqiUpdater:
                         time.sleep(wait_for_s)
                     gc.collect()
 
-    def __get_expected_aqi_data_name(self) -> str:
-        """Returns the name of the expected latest aqi data csv file based on the current time,
-        e.g. aqi_2019-11-11T17.csv.
+    def __get_expected_aqi_data_name(self) -> Union[str, None]:
+        """Returns the name of the latest aqi data file from the AQI update manifest, e.g.
+        aqi_2019-11-11T17.bin (binary edge AQI update written by the AQI updater). Returns None if
+        there is no manifest (yet).
         """
         if conf.use_mean_aqi and conf.mean_aqi_file_name:
             return conf.mean_aqi_file_name
         elif conf.test_mode:
             return 'aqi_2020-10-25T14.csv'
         else:
-            curdt = datetime.utcnow().strftime('%Y-%m-%dT%H')
-            return f'aqi_{curdt}.csv'
+            manifest = aqi_manifest.read_manifest(self.__aqi_dir)
+            return manifest.aqi_update if manifest else None
 
     def __new_aqi_data_available(self) -> str:
-        """Returns the name of a new AQI csv file if it's not yet updated or being updated to
+        """Returns the name of a new AQI data file if it's not yet updated or being updated to
         a graph and it exists in aqi_dir. Else returns None.
         """
-        new_aqi_csv = None
+        new_aqi_file = None
         aqi_update_status = ''
 
         aqi_data_expected = self.__get_expected_aqi_data_name()
-        if self.__aqi_update_error:
+        if not aqi_data_expected:
+            aqi_update_status = 'AQI update manifest is not available'
+        elif self.__aqi_update_error and aqi_data_expected == self.__aqi_data_wip:
+            # do not retry failed AQI update before a new one is published
             aqi_update_status = self.__aqi_update_error
         elif aqi_data_expected == self.__aqi_data_latest:
             aqi_update_status = 'Latest AQI was updated to graph'
         elif aqi_data_expected == self.__aqi_data_wip:
             aqi_update_status = 'AQI update already in progress'
-        elif aqi_data_expected in listdir(self.__aqi_dir):
+        elif os.path.exists(self.__aqi_dir + aqi_data_expected):
             aqi_update_status = f'AQI update will be done from: {aqi_data_expected}'
-            new_aqi_csv = aqi_data_expected
+            new_aqi_file = aqi_data_expected
         else:
             aqi_update_status = f'Expected AQI data is not available ({aqi_data_expected})'
 
         if aqi_update_status != self.__aqi_update_status:
             self.log.info(aqi_update_status)
             self.__aqi_update_status = aqi_update_status
-        return new_aqi_csv
+        return new_aqi_file
+
+    def __get_aq_cost_columns(
+        self,
+        aqi_coeffs: np.ndarray,
+        has_aqi: np.ndarray
+    ) -> Dict[str, list]:
+        """Returns AQ costs of all edges as columns by cost attribute names. Edges that did not
+        receive AQI update get high AQ costs if they have geometry (aqi_coeff=40) and 0 if not.
+        """
+        lengths = self.__G.get_edge_lengths()
+        missing_aq_costs = aq_exps.get_missing_aqi_cost_array(lengths)
 
-    def __get_aq_update_attrs(self, aqi: float, length: float, bike_time_cost: Union[float, None]):
-        aq_costs = aq_exps.get_aqi_costs(
-            aqi, length, self.__sens
+        aq_costs = aq_exps.get_aqi_coeff_cost_arrays(
+            aqi_coeffs, lengths, self.__sens
         ) if conf.walking_enabled else {}
 
-        aq_costs_b = aq_exps.get_aqi_costs(
-            aqi, length, self.__sens, bike_time_cost=bike_time_cost, travel_mode=TravelMode.BIKE
+        aq_costs_b = aq_exps.get_aqi_coeff_cost_arrays(
+            aqi_coeffs,
+            lengths,
+            self.__sens,
+            bike_time_costs=self.__G.get_edge_bike_time_costs(),
+            travel_mode=TravelMode.BIKE
         ) if conf.cycling_enabled else {}
 
         return {
-            'aqi': aqi,
-            **aq_costs,
-            **aq_costs_b
+            cost_attr: np.where(has_aqi, costs, missing_aq_costs).tolist()
+            for cost_attr, costs in {**aq_costs, **aq_costs_b}.items()
         }
 
-    def __get_missing_aq_update_attrs(self, length: float):
-        """Set AQI to None to all edges that did not receive AQI update. Set high AQ costs to
-        edges with geometry and 0 to edges without.
+    def __read_aqi_update_csv(
+        self,
+        aqi_update_csv: str
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Reads AQI updates from a csv file of id_ig & aqi rows (legacy format, e.g. mean AQI
+        data) to an array of AQI values by edge ID. AQ cost coefficients are calculated from the
+        AQI values. Also returns a mask of edges that got AQI.
         """
-        aq_costs = {}
-        cost_prefix = cost_prefix_dict[TravelMode.WALK][RoutingMode.CLEAN]
-        cost_prefix_bike = cost_prefix_dict[TravelMode.BIKE][RoutingMode.CLEAN]
-
-        if (length == 0.0):
-            # set zero costs to edges with null geometry
-            aq_costs = {cost_prefix + str(sen): 0.0 for sen in self.__sens}
-            aq_costs_b = {cost_prefix_bike + str(sen): 0.0 for sen in self.__sens}
-        else:
-            # set high AQ costs to edges outside the AQI data extent (aqi_coeff=40)
-            aq_costs = {
-                cost_prefix + str(sen): round(length + length * 200, 2) for sen in self.__sens
-            }
-            aq_costs_b = {
-                cost_prefix_bike + str(sen): round(length + length * 200, 2) for sen in self.__sens
-            }
-
-        aq_costs = aq_costs if conf.walking_enabled else {}
-        aq_costs_b = aq_costs_b if conf.cycling_enabled else {}
-
-        return {E.aqi.value: None, **aq_costs, **aq_costs_b}
-
-    def __read_update_aqi_to_graph(self, aqi_updates_csv: str):
-        """Updates new AQI values and AQ costs to edges and AQI=None to edges that do not get
-        AQI update.
-        """
-        self.log.info(f'Starting AQI update from: {aqi_updates_csv}')
-        self.__aqi_data_wip = aqi_updates_csv
-
-        # read aqi update csv
-        edge_aqi_updates = pd.read_csv(self.__aqi_dir + aqi_updates_csv)
+        edge_aqi_updates = pd.read_csv(self.__aqi_dir + aqi_update_csv)
 
         # inspect how many edges will get AQI
+        edge_count = self.__G.ecount
         aqi_update_count = len(edge_aqi_updates)
-        if len(self.__edge_df) != aqi_update_count:
-            missing_ratio = round(
-                100 * (len(self.__edge_df)-len(edge_aqi_updates)) / len(self.__edge_df), 1
-            )
+        if edge_count != aqi_update_count:
+            missing_ratio = round(100 * (edge_count - aqi_update_count) / edge_count, 1)
             self.log.info(f'AQI updates missing for {missing_ratio} % edges')
 
-        # update AQI and AQ costs to graph
-        aqi_update_df = pd.merge(self.__edge_df, edge_aqi_updates, on=E.id_ig.name, how='inner')
-        if len(aqi_update_df) != aqi_update_count:
+        # map AQI updates to an array by edge ID
+        edge_ids = edge_aqi_updates[E.id_ig.name].to_numpy()
+        valid_ids = (edge_ids >= 0) & (edge_ids < edge_count)
+        if not valid_ids.all():
             self.log.info(
-                f'Failed to merge AQI updates to edge gdf, missing '
-                f'{aqi_update_count - len(aqi_update_df)} edges'
+                f'Failed to merge AQI updates to edges, missing '
+                f'{np.count_nonzero(~valid_ids)} edges'
             )
-
-        aqi_update_df['aq_updates'] = aqi_update_df.apply(
-            lambda x: self.__get_aq_update_attrs(
-                x['aqi'], x[E.length.name], x.get(E.bike_time_cost.name, None)
-            ), axis=1
-        )
-        self.__G.update_edge_attrs_from_df_to_graph(aqi_update_df, df_attr='aq_updates')
-
-        # update missing AQI and AQ costs to edges outside AQI data extent (AQI -> None)
-        missing_aqi_update_df = pd.merge(
-            self.__edge_df,
-            edge_aqi_updates,
-            on=E.id_ig.name,
-            how='outer',
-            suffixes=['', '_'],
-            indicator=True
+        edge_ids = edge_ids[valid_ids]
+        aqis = np.full(edge_count, np.nan)
+        aqis[edge_ids] = edge_aqi_updates[E.aqi.value].to_numpy(dtype=np.float64)[valid_ids]
+        has_aqi = np.zeros(edge_count, dtype=bool)
+        has_aqi[edge_ids] = True
+        return aqis, get_aqi_coeffs(aqis), has_aqi
+
+    def __read_aqi_update_file(self, aqi_update_file: str) -> edge_array_file.EdgeArrayFile:
+        """Reads a binary edge AQI update file (see common.edge_array_file) as memory mapped.
+        The AQI updater publishes one file per AQI update to the shared aqi_updates directory, so
+        workers only need to map the file (which is shared in the page cache of the host) instead
+        of processing AQI data by themselves.
+
+        Raises:
+            EdgeArrayFileError: If the update was not created for the graph.
+        """
+        return edge_array_file.read_edge_array_file(
+            self.__aqi_dir + aqi_update_file, graph_fingerprint=self.__graph_fingerprint
         )
-        missing_aqi_update_df = missing_aqi_update_df[
-            missing_aqi_update_df['_merge'] == 'left_only'
-        ]
-        missing_aqi_update_df['aq_updates'] = [
-            self.__get_missing_aq_update_attrs(len) for len in missing_aqi_update_df[E.length.name]
-        ]
-        self.__G.update_edge_attrs_from_df_to_graph(missing_aqi_update_df, df_attr='aq_updates')
 
-        # check that all edges got either AQI value or AQI=None
-        if len(self.__edge_df) != (len(missing_aqi_update_df) + len(aqi_update_df)):
-            self.log.error(
-                f'Edge count: {len(self.__edge_df)} != all AQI updates:'
-                f'{len(missing_aqi_update_df) + len(aqi_update_df)}'
-            )
+    def __get_aqi_arrays(
+        self,
+        edge_aqi: edge_array_file.EdgeArrayFile
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns arrays of AQI values and AQ cost coefficients by edge ID from an edge AQI
+        update. Also returns a mask of edges that got AQI (i.e. AQI is not NaN).
+        """
+        # AQI values are sampled with two decimals, thus rounding restores them exactly
+        aqis = np.round(edge_aqi.arrays[E.aqi.value].astype(np.float64), 2)
+        missing_ratio = round(100 * np.count_nonzero(np.isnan(aqis)) / len(aqis), 1)
+        self.log.info(f'AQI updates missing for {missing_ratio} % edges')
+        if 'aqi_coeff' in edge_aqi.arrays:
+            # coefficients of AQI with two decimals have at most four decimals
+            aqi_coeffs = np.round(edge_aqi.arrays['aqi_coeff'].astype(np.float64), 4)
         else:
-            self.log.info('AQI update done')
+            aqi_coeffs = get_aqi_coeffs(aqis)
+        return aqis, aqi_coeffs, ~np.isnan(aqis)
+
+    def __get_aqi_coeff_hours(
+        self,
+        edge_aqi: edge_array_file.EdgeArrayFile,
+        aqi_coeffs: np.ndarray
+    ) -> List[np.ndarray]:
+        """Returns AQ cost coefficient arrays of the hour of the AQI update and the following
+        forecast hours (bands aqi_coeff_1h, aqi_coeff_2h etc. written by the AQI updater) for
+        departure time dependent routing. Forecast arrays are kept memory-mapped. Returns an empty
+        list if the update has no forecast hours.
+        """
+        aqi_coeff_hours = [aqi_coeffs]
+        while f'aqi_coeff_{len(aqi_coeff_hours)}h' in edge_aqi.arrays:
+            aqi_coeff_hours.append(edge_aqi.arrays[f'aqi_coeff_{len(aqi_coeff_hours)}h'])
+        if len(aqi_coeff_hours) == 1:
+            return []
+        self.log.info(f'AQI update has {len(aqi_coeff_hours) - 1} forecast hours')
+        return aqi_coeff_hours
+
+    def __read_update_aqi_to_graph(self, aqi_update_file: str):
+        """Updates new AQI values and AQ costs to edges and AQI=None to edges that do not get
+        AQI update. AQI values are read to an array by edge ID, from which AQI and AQ cost
+        columns are calculated and published to the graph handler at once (as AQ snapshot).
+        """
+        self.log.info(f'Starting AQI update from: {aqi_update_file}')
+        self.__aqi_data_wip = aqi_update_file
+        start_time = time.time()
+
+        data_time, aqi_coeff_hours = None, []
+        if aqi_update_file.endswith('.csv'):
+            aqis, aqi_coeffs, has_aqi = self.__read_aqi_update_csv(aqi_update_file)
+        else:
+            edge_aqi = self.__read_aqi_update_file(aqi_update_file)
+            aqis, aqi_coeffs, has_aqi = self.__get_aqi_arrays(edge_aqi)
+            data_time = edge_aqi.data_time
+            aqi_coeff_hours = self.__get_aqi_coeff_hours(edge_aqi, aqi_coeffs)
+
+        # build AQI and AQ cost columns (AQI -> None to edges outside AQI data extent)
+        aq_costs = self.__get_aq_cost_columns(aqi_coeffs, has_aqi)
+        self.__validate_aqi_update(np.where(has_aqi, aqis, np.nan))
+        aqi_column = [
+            aqi if updated else None for aqi, updated in zip(aqis.tolist(), has_aqi.tolist())
+        ]
+
+        # publish the new AQI and AQ costs for routing at once
+        self.__G.publish_aq_snapshot(
+            aqi_update_file,
+            aqi_column,
+            aq_costs,
+            data_time=data_time,
+            aqi_coeff_hours=aqi_coeff_hours
+        )
+
+        self.log.duration(
+            start_time,
+            f'AQI update done ({np.count_nonzero(has_aqi)} edges got AQI)',
+            log_level='info'
+        )
 
         # TODO see if these help to release some memory (remove if not)
-        del edge_aqi_updates
-        del aqi_update_df
-        del missing_aqi_update_df
+        del aqis
+        del aqi_coeffs
+        del aq_costs
+        del aqi_column
 
-        return aqi_updates_csv
+        return aqi_update_file
 
-    def __validate_graph_aqi(self):
-        edge_count = self.__G.graph.ecount()
-        has_aqi_count = 0
-        missing_aqi_count = 0
-        for edge in self.__G.graph.es:
-            if not edge[E.aqi.value]:
-                missing_aqi_count += 1
-            else:
-                has_aqi_count += 1
+    def __validate_aqi_update(self, aqis: np.ndarray) -> AqiValidationReport:
+        """Validates AQI values of the edges (NaN for edges without AQI) and raises an exception
+        if too many edges are missing valid AQI, so that an incomplete AQI update is never
+        published for routing. Returns a validation report of the numbers of edges by validity.
+        """
+        report = aqi_validation.validate_aqis(aqis)
 
-        aqi_ok_ratio = has_aqi_count/edge_count
-        missing_ratio = missing_aqi_count/edge_count
+        aqi_ok_ratio = report.get_ratio(report.ok_count)
+        missing_ratio = report.get_ratio(report.missing_count)
 
         if aqi_ok_ratio < 0.7 or missing_ratio > 0.3:
             raise Exception(
                 f'Graph got incomplete AQI update (aqi_ok_ratio: {round(aqi_ok_ratio, 4)},'
-                f'missing_ratio: {round(missing_ratio, 4)})'
+                f'missing_ratio: {round(missing_ratio, 4)}, validities: {report.validity_counts})'
             )
         else:
             self.log.info(
                 f'Graph AQI update resulted aqi_ok_ratio: {round(aqi_ok_ratio, 4)} '
                 f'& missing_ratio: {round(missing_ratio, 4)}'
             )
+        if report.invalid_count:
+            self.log.warning(f'AQI update has invalid AQI: {report.validity_counts}')
+        return report
@@ -1,16 +1,21 @@
+import copy
 import time
+import numpy as np
+from collections import OrderedDict
 from typing import List, Dict, Tuple, Union
 from shapely.ops import nearest_points
 from shapely.geometry import Point, LineString
 from gp_server.conf import conf
-from gp_server.app.types import NearestEdge, PathEdge, RoutingConf
+from gp_server.app.types import AqSnapshot, NearestEdge, PathEdge, RoutingConf, missing_edge_class
 from common.igraph import Edge as E, Node as N
 import common.igraph as ig_utils
 import gp_server.app.aq_exposures as aq_exps
 import gp_server.app.greenery_exposures as gvi_exps
+import gp_server.app.noise_exposures as noise_exps
 import gp_server.app.edge_cost_factory as edge_cost_factory
+import gp_server.app.json_encoding as json_enc
 from gp_server.app.logger import Logger
-from gp_server.app.constants import RoutingException, ErrorKey
+from gp_server.app.constants import RoutingException, ErrorKey, TravelMode, link_base_edge_id_key
 
 
 class GraphHandler:
@@ -24,15 +29,48 @@ class GraphHandler:
         __edges_sind: Spatial index of the edges GeoDataFrame.
         __node_gdf: The nodes of the graph as a GeoDataFrame.
         __nodes_sind: Spatial index of the nodes GeoDataFrame.
-        __path_edge_cache: A cache of path edges for current routing request.
+        __edge_coords_wgs_json: Rounded WGS coordinates of the edges as JSON fragments (by edge id).
+        __edge_mdB: Mean dB of the edges (by edge id).
+        __edge_db_range: Noise level ranges (of mean dB) of the edges (by edge id).
+        __edge_gvi_cl: GVI classes of the edges (by edge id).
+        __edge_class_arrays: Noise level ranges and GVI classes of the edges as numpy arrays
+            (by PathEdge attribute name and edge id) for grouping path edges by class.
+        __edge_lengths: Lengths of the edges as a read-only numpy array (by edge id).
+        __edge_bike_time_costs: Bike time costs of the edges as a read-only numpy array (by edge
+            id), or None if cycling is not enabled.
+        __edge_missing_aq_costs: AQ costs of the edges for when they have no AQI (by edge id).
+        __edge_is_path_edge: A boolean numpy array indicating which edges can be path edges, i.e.
+            have length and geometry (by edge id).
+        __path_edge_cache: A bounded LRU cache of path edges (by edge id) shared by routing
+            requests, each path edge is stored with the version of the AQ snapshot it was
+            created with.
+        __path_edge_cache_size: The maximum number of path edges in __path_edge_cache.
+        __link_path_edge_cache: A cache of path edges of the linking edges of current routing
+            request.
+        __link_edge_base_ids: Ids of the graph edges on which the linking edges (of the current
+            routing request) were created, by the ids of the linking edges.
+        __aq_snapshot: The latest AQ snapshot (AQI & AQ costs of the edges), replaced as a whole
+            when new AQI data is published (see publish_aq_snapshot()).
+        __request_aq_snapshot: The AQ snapshot pinned for the current routing request (if any).
+        __request_aq_costs: AQ costs of the current routing request by the departure time (if
+            set with set_departure_time_aq_costs()) as numpy arrays of all edges (including the
+            linking edges), by cost attribute name.
+        __edge_center_coords: Projected coordinates of the centers of the edges between their
+            nodes (by edge id), created when first needed in departure time dependent routing.
     """
 
-    def __init__(self, logger: Logger, graph_file: str, routing_conf: RoutingConf):
+    def __init__(
+        self,
+        logger: Logger,
+        graph_file: str,
+        routing_conf: RoutingConf,
+        path_edge_cache_size: int = 50000
+    ):
         """Initializes a graph (and related features) used by green_paths_app and aqi_processor_app.
 
         Args:
-            subset: A boolean variable indicating whether a subset of the graph should be loaded
-            (subset is for testing / developing).
+            path_edge_cache_size: The maximum number of path edges to cache between routing
+            requests.
         """
         self.log = logger
         self.log.info(f'Loading graph from file: {graph_file}')
@@ -46,6 +84,7 @@ class GraphHandler:
         self.__edge_sindex = self.__edge_gdf.sindex
         self.__node_gdf = ig_utils.get_node_gdf(self.graph, drop_na_geoms=True)
         self.__nodes_sind = self.__node_gdf.sindex
+        self.__edge_coords_wgs_json = self.__get_edge_coords_wgs_json()
         if conf.cycling_enabled:
             edge_cost_factory.set_biking_costs(self.graph, self.log)
         if conf.quiet_paths_enabled:
@@ -55,8 +94,30 @@ class GraphHandler:
             edge_cost_factory.set_gvi_costs_to_graph(self.graph, routing_conf)
         self.log.info('GVI costs set')
         self.graph.es[E.aqi.value] = None  # set default AQI value to None
+        self.__edge_mdB, self.__edge_db_range = self.__get_edge_noise_columns()
+        self.__edge_gvi_cl = [_get_gvi_cl(gvi) for gvi in self.graph.es[E.gvi.value]]
+        self.__edge_class_arrays: Dict[str, np.ndarray] = {
+            'db_range': _get_class_array(self.__edge_db_range),
+            'gvi_cl': _get_class_array(self.__edge_gvi_cl)
+        }
+        self.__edge_lengths = self.__get_edge_attr_array(E.length)
+        self.__edge_bike_time_costs = (
+            self.__get_edge_attr_array(E.bike_time_cost) if conf.cycling_enabled else None
+        )
+        self.__edge_missing_aq_costs = aq_exps.get_missing_aqi_cost_array(self.__edge_lengths)
+        self.__edge_is_path_edge = np.array([
+            length != 0.0 and isinstance(geom, LineString) for length, geom
+            in zip(self.graph.es[E.length.value], self.graph.es[E.geometry.value])
+        ], dtype=bool)
         self.log.duration(start_time, 'Graph initialized', log_level='info')
-        self.__path_edge_cache: Dict[int, PathEdge] = {}
+        self.__path_edge_cache: 'OrderedDict[int, Tuple[int, PathEdge]]' = OrderedDict()
+        self.__path_edge_cache_size = path_edge_cache_size
+        self.__link_path_edge_cache: Dict[int, PathEdge] = {}
+        self.__link_edge_base_ids: Dict[int, int] = {}
+        self.__aq_snapshot = self.__create_aq_snapshot(0, None, [None] * self.ecount, {})
+        self.__request_aq_snapshot: Union[AqSnapshot, None] = None
+        self.__request_aq_costs: Dict[str, np.ndarray] = {}
+        self.__edge_center_coords: Union[np.ndarray, None] = None
 
     def __get_edge_gdf(self):
         edge_gdf = ig_utils.get_edge_gdf(self.graph, attrs=[E.id_way], drop_na_geoms=True)
@@ -66,14 +127,42 @@ class GraphHandler:
         self.log.info(f'Added {len(edge_gdf)} edges to edge_gdf')
         return edge_gdf
 
-    def update_edge_attrs_from_df_to_graph(self, edge_gdf, df_attr: str):
-        """Updates the given edge attribute(s) from a DataFrame to a graph. The attribute(s) to
-        update are given as series of dictionaries (df_attr): keys will be used ass attribute names
-        and values as values in the graph.
+    def __get_edge_attr_array(self, attr: E) -> np.ndarray:
+        edge_attr_array = np.array(self.graph.es[:self.ecount][attr.value], dtype=np.float64)
+        edge_attr_array.flags.writeable = False
+        return edge_attr_array
+
+    def get_edge_lengths(self) -> np.ndarray:
+        """Returns the lengths of the edges of the graph (by edge id) as a read-only array.
+        """
+        return self.__edge_lengths
+
+    def get_edge_bike_time_costs(self) -> Union[np.ndarray, None]:
+        """Returns the bike time costs of the edges of the graph (by edge id) as a read-only
+        array, or None if cycling is not enabled.
+        """
+        return self.__edge_bike_time_costs
+
+    def __get_edge_coords_wgs_json(self) -> List[Union[bytes, None]]:
+        """Encodes the WGS coordinates of all edges to JSON fragments for composing path
+        geometries of routing responses.
+        """
+        start_time = time.time()
+        coords_json = [
+            json_enc.get_coords_json_fragment(geom.coords) if isinstance(geom, LineString) else None
+            for geom in self.graph.es[E.geom_wgs.value]
+        ]
+        self.log.duration(start_time, 'Encoded edge coordinates to JSON', log_level='info')
+        return coords_json
+
+    def __get_edge_noise_columns(self) -> Tuple[List[float], List[int]]:
+        """Returns mean dB and noise level ranges of all edges (by edge id).
         """
-        for edge in edge_gdf.itertuples():
-            updates: dict = getattr(edge, df_attr)
-            self.graph.es[getattr(edge, E.id_ig.name)].update_attributes(updates)
+        edge_mdB = [
+            _get_mdB(noises, length) for noises, length
+            in zip(self.graph.es[E.noises.value], self.graph.es[E.length.value])
+        ]
+        return edge_mdB, [noise_exps.get_noise_range(mdB) for mdB in edge_mdB]
 
     def find_nearest_node(self, point: Point) -> Union[int, None]:
         """Finds the nearest node to a given point from the graph.
@@ -110,12 +199,20 @@ class GraphHandler:
             return None
 
     def get_edge_attrs_by_id(self, edge_id: int) -> Union[dict, None]:
-        """Returns edge by given ID as dictionary of attribute names and values."""
+        """Returns edge by given ID as dictionary of attribute names and values. AQI and AQ costs
+        of the edge are read from the current AQ snapshot.
+        """
         try:
-            return self.graph.es[edge_id].attributes()
+            attrs = self.graph.es[edge_id].attributes()
         except Exception:
             self.log.warning(f'Could not find edge by id: {edge_id}')
             return None
+        if edge_id < self.ecount:
+            aq_snapshot = self.get_aq_snapshot()
+            attrs[E.aqi.value] = aq_snapshot.aqi[edge_id]
+            for cost_attr, costs in aq_snapshot.aq_costs.items():
+                attrs[cost_attr] = costs[edge_id]
+        return attrs
 
     def get_edge_object_by_id(self, edge_id: int) -> Union[PathEdge, None]:
         """Returns PathEdge object by the given edge ID. Returns None if the edge is
@@ -127,6 +224,21 @@ class GraphHandler:
                 or not isinstance(edge[E.geometry.value], LineString)):
             return None
 
+        if edge_id < self.ecount:
+            # use precomputed attributes of the edge
+            mdB = self.__edge_mdB[edge_id]
+            db_range = self.__edge_db_range[edge_id]
+            gvi_cl = self.__edge_gvi_cl[edge_id]
+            aqi_cl = self.get_aq_snapshot().aqi_cl[edge_id]
+            coords_wgs_json = self.__edge_coords_wgs_json[edge_id]
+        else:
+            # new (linking) edges are not known at graph load
+            mdB = _get_mdB(edge[E.noises.value], edge[E.length.value])
+            db_range = noise_exps.get_noise_range(mdB)
+            gvi_cl = _get_gvi_cl(edge[E.gvi.value])
+            aqi_cl = _get_aqi_cl(edge[E.aqi.value])
+            coords_wgs_json = json_enc.get_coords_json_fragment(edge[E.geom_wgs.value].coords)
+
         return PathEdge(
             id=edge[E.id_ig.value],
             length=edge[E.length.value],
@@ -134,14 +246,15 @@ class GraphHandler:
             bike_safety_cost=edge.get(E.bike_safety_cost.value, None),
             allows_biking=edge[E.allows_biking.value],
             aqi=edge[E.aqi.value],
-            aqi_cl=aq_exps.get_aqi_class(edge[E.aqi.value]) if edge[E.aqi.value] else None,
+            aqi_cl=aqi_cl,
             noises=edge[E.noises.value],
+            mdB=mdB,
+            db_range=db_range,
             gvi=edge[E.gvi.value],
-            gvi_cl=gvi_exps.get_gvi_class(
-                edge[E.gvi.value]
-            ) if edge[E.gvi.value] is not None else None,
+            gvi_cl=gvi_cl,
             coords=edge[E.geometry.value].coords,
-            coords_wgs=edge[E.geom_wgs.value].coords
+            coords_wgs=edge[E.geom_wgs.value].coords,
+            coords_wgs_json=coords_wgs_json
         )
 
     def get_node_point_geom(self, node_id: int) -> Union[Point, None]:
@@ -178,25 +291,149 @@ class GraphHandler:
         edge_d[E.geom_wgs.name] = str(edge_d[E.geom_wgs.name])
         return edge_d
 
+    def __create_aq_snapshot(
+        self,
+        version: int,
+        aqi_data_name: Union[str, None],
+        aqi: List[Union[float, None]],
+        aq_costs: Dict[str, List[float]],
+        data_time: Union[int, None] = None,
+        aqi_coeff_hours: List[np.ndarray] = None
+    ) -> AqSnapshot:
+        aqi_cl = aq_exps.get_aqi_classes(aqi)
+        return AqSnapshot(
+            version=version,
+            aqi_data_name=aqi_data_name,
+            aqi=aqi,
+            aqi_cl=aqi_cl,
+            aqi_cl_array=_get_class_array(aqi_cl),
+            aq_costs=aq_costs,
+            data_time=data_time,
+            aqi_coeff_hours=aqi_coeff_hours or []
+        )
+
+    def publish_aq_snapshot(
+        self,
+        aqi_data_name: str,
+        aqi: List[Union[float, None]],
+        aq_costs: Dict[str, List[float]],
+        data_time: Union[int, None] = None,
+        aqi_coeff_hours: List[np.ndarray] = None
+    ) -> None:
+        """Publishes new AQI and AQ costs of the edges (by edge id) for routing. The new snapshot
+        is built completely before it replaces the previous one with a single reference swap, so
+        routing requests never see partially updated AQ costs. Requests that have pinned the
+        previous snapshot keep using it until they are done.
+
+        Args:
+            data_time: The UTC time of the AQI data as unix time (s).
+            aqi_coeff_hours: AQ cost coefficients of the hour of the AQI data and the following
+                forecast hours (by edge id) for departure time dependent routing.
+        """
+        aq_snapshot = self.__create_aq_snapshot(
+            self.__aq_snapshot.version + 1,
+            aqi_data_name,
+            aqi,
+            aq_costs,
+            data_time=data_time,
+            aqi_coeff_hours=aqi_coeff_hours
+        )
+        self.__aq_snapshot = aq_snapshot
+        self.log.info(f'Published AQ snapshot {aq_snapshot.version} ({aqi_data_name})')
+
+    def pin_aq_snapshot(self) -> AqSnapshot:
+        """Pins the latest AQ snapshot for the current routing request, so that all AQI and AQ
+        costs of the request are from the same AQI update. The pin is released with
+        reset_edge_cache().
+        """
+        self.__request_aq_snapshot = self.__aq_snapshot
+        return self.__request_aq_snapshot
+
+    def get_aq_snapshot(self) -> AqSnapshot:
+        """Returns the AQ snapshot pinned for the current request or the latest one if no
+        snapshot is pinned.
+        """
+        return self.__request_aq_snapshot or self.__aq_snapshot
+
+    def __get_path_edge_with_current_aqi(
+        self,
+        edge_id: int,
+        path_edge: PathEdge,
+        aq_snapshot: AqSnapshot
+    ) -> PathEdge:
+        # copy instead of update in place, as the cached object may still be used elsewhere
+        updated_path_edge = copy.copy(path_edge)
+        updated_path_edge.aqi = aq_snapshot.aqi[edge_id]
+        updated_path_edge.aqi_cl = aq_snapshot.aqi_cl[edge_id]
+        return updated_path_edge
+
+    def __get_path_edge(self, edge_id: int) -> Union[PathEdge, None]:
+        if edge_id >= self.ecount:
+            # ids of linking edges are reused between requests, thus cache them only per request
+            path_edge = self.__link_path_edge_cache.get(edge_id)
+            if not path_edge:
+                path_edge = self.get_edge_object_by_id(edge_id)
+                self.__link_path_edge_cache[edge_id] = path_edge
+            return path_edge
+
+        aq_snapshot = self.get_aq_snapshot()
+        cached = self.__path_edge_cache.get(edge_id)
+        if cached:
+            aq_version, path_edge = cached
+            self.__path_edge_cache.move_to_end(edge_id)
+            if aq_version == aq_snapshot.version:
+                return path_edge
+            path_edge = self.__get_path_edge_with_current_aqi(edge_id, path_edge, aq_snapshot)
+        else:
+            path_edge = self.get_edge_object_by_id(edge_id)
+            if not path_edge:
+                return None
+
+        self.__path_edge_cache[edge_id] = (aq_snapshot.version, path_edge)
+        if len(self.__path_edge_cache) > self.__path_edge_cache_size:
+            self.__path_edge_cache.popitem(last=False)
+        return path_edge
+
     def get_path_edges_by_ids(self, edge_ids: List[int]) -> List[PathEdge]:
         """Loads edge attributes from graph by ordered list of edges representing a path.
+        Path edges are cached between requests (except for linking edges).
         """
         path_edges: List[PathEdge] = []
 
         for edge_id in edge_ids:
-            edge_d = self.__path_edge_cache.get(edge_id)
-            if edge_d:
-                path_edges.append(edge_d)
-                continue
-
-            path_edge = self.get_edge_object_by_id(edge_id)
-
+            path_edge = self.__get_path_edge(edge_id)
             if path_edge:
-                self.__path_edge_cache[edge_id] = path_edge
                 path_edges.append(path_edge)
 
         return path_edges
 
+    def get_path_edge_classes(self, edge_ids: List[int], class_attr: str) -> np.ndarray:
+        """Returns classes of path edges (class_attr: db_range, gvi_cl or aqi_cl) by ordered list of
+        edge ids as a numpy array (missing classes as missing_edge_class). As in
+        get_path_edges_by_ids, edges without length or geometry are skipped.
+        """
+        edge_ids = np.asarray(edge_ids, dtype=np.int64)
+        is_link_edge = edge_ids >= self.ecount
+        graph_edge_ids = edge_ids[~is_link_edge]
+
+        class_array = (
+            self.get_aq_snapshot().aqi_cl_array if class_attr == 'aqi_cl'
+            else self.__edge_class_arrays[class_attr]
+        )
+        classes = np.empty(len(edge_ids), dtype=np.int64)
+        classes[~is_link_edge] = class_array[graph_edge_ids]
+        is_path_edge = np.ones(len(edge_ids), dtype=bool)
+        is_path_edge[~is_link_edge] = self.__edge_is_path_edge[graph_edge_ids]
+
+        for idx in np.flatnonzero(is_link_edge):
+            path_edge = self.__get_path_edge(int(edge_ids[idx]))
+            is_path_edge[idx] = path_edge is not None
+            if path_edge:
+                edge_class = getattr(path_edge, class_attr)
+                classes[idx] = edge_class if edge_class is not None else missing_edge_class
+
+        return classes[is_path_edge]
+
     def __get_new_node_id(self) -> int:
         """Returns an unique node id that can be used in creating a new node to a graph.
         """
@@ -222,15 +459,152 @@ class GraphHandler:
         )
 
     def add_new_edges_to_graph(self, edges: Tuple[dict]) -> None:
+        """Adds new (linking) edges to the graph. The ids of the edges on which the linking edges
+        were created are kept aside (they are not edge attributes of the graph).
+        """
         time_add_edges = time.time()
         if edges:
             uvs = tuple(edge[E.uv.value] for edge in edges)
             new_edge_ids = self.__add_new_edges_to_graph(uvs)
             for idx, edge_id in enumerate(new_edge_ids):
-                self.graph.es[edge_id].update_attributes(edges[idx])
+                attrs = dict(edges[idx])
+                base_edge_id = attrs.pop(link_base_edge_id_key, None)
+                if base_edge_id is not None:
+                    self.__link_edge_base_ids[edge_id] = base_edge_id
+                self.graph.es[edge_id].update_attributes(attrs)
 
         self.log.duration(time_add_edges, 'loaded new features to graph', unit='ms')
 
+    def __get_edge_center_coords(self) -> np.ndarray:
+        if self.__edge_center_coords is None:
+            node_coords = np.array(
+                [(point.x, point.y) if point else (np.nan, np.nan)
+                 for point in self.graph.vs[:self.vcount][N.geometry.value]],
+                dtype=np.float64
+            )
+            edge_nodes = np.array(self.graph.get_edgelist()[:self.ecount], dtype=np.int64)
+            self.__edge_center_coords = (
+                node_coords[edge_nodes[:, 0]] + node_coords[edge_nodes[:, 1]]
+            ) / 2
+        return self.__edge_center_coords
+
+    def set_departure_time_aq_costs(
+        self,
+        depart_at: int,
+        orig_point: Point,
+        speed_ms: float,
+        travel_mode: TravelMode,
+        sensitivities: List[float]
+    ) -> bool:
+        """Sets AQ costs for the current routing request by the estimated arrival times to the
+        edges, if the current AQ snapshot has forecast hours. The arrival time to an edge is
+        estimated from the departure time and the straight line distance from the origin to the
+        center of the edge. AQ cost coefficients of the edges are interpolated between the hours
+        of the AQI update by the arrival times. AQ costs of the linking edges are calculated
+        from their own lengths and the coefficients of the edges on which they were created. The
+        costs are used until reset_edge_cache() is called.
+
+        Args:
+            depart_at: The departure time as unix time (s).
+            speed_ms: The travel speed (m/s) for estimating the arrival times.
+        Returns:
+            True if departure time dependent AQ costs were set, else False.
+        """
+        aq_snapshot = self.get_aq_snapshot()
+        if len(aq_snapshot.aqi_coeff_hours) < 2:
+            return False
+
+        edge_centers = self.__get_edge_center_coords()
+        distances = np.hypot(edge_centers[:, 0] - orig_point.x, edge_centers[:, 1] - orig_point.y)
+        arrival_hours = (depart_at + distances / speed_ms - aq_snapshot.data_time) / 3600
+        aqi_coeffs = aq_exps.interpolate_aqi_coeffs(aq_snapshot.aqi_coeff_hours, arrival_hours)
+
+        has_aqi = ~np.isnan(aq_snapshot.aqi_coeff_hours[0])
+        aq_costs = self.__get_aq_cost_arrays(
+            aqi_coeffs,
+            has_aqi,
+            self.__edge_lengths,
+            self.__edge_bike_time_costs if travel_mode == TravelMode.BIKE else None,
+            self.__edge_missing_aq_costs,
+            sensitivities,
+            travel_mode
+        )
+        if self.graph.ecount() > self.ecount:
+            link_aq_costs = self.__get_link_edge_aq_cost_arrays(
+                aqi_coeffs, has_aqi, sensitivities, travel_mode
+            )
+            aq_costs = {
+                cost_attr: np.concatenate((costs, link_aq_costs[cost_attr]))
+                for cost_attr, costs in aq_costs.items()
+            }
+        self.__request_aq_costs = aq_costs
+        return True
+
+    def __get_aq_cost_arrays(
+        self,
+        aqi_coeffs: np.ndarray,
+        has_aqi: np.ndarray,
+        lengths: np.ndarray,
+        bike_time_costs: Union[np.ndarray, None],
+        missing_aq_costs: np.ndarray,
+        sensitivities: List[float],
+        travel_mode: TravelMode
+    ) -> Dict[str, np.ndarray]:
+        aq_costs = aq_exps.get_aqi_coeff_cost_arrays(
+            aqi_coeffs,
+            lengths,
+            sensitivities,
+            bike_time_costs=bike_time_costs,
+            travel_mode=travel_mode
+        )
+        return {
+            cost_attr: np.where(has_aqi, costs, missing_aq_costs)
+            for cost_attr, costs in aq_costs.items()
+        }
+
+    def __get_link_edge_aq_cost_arrays(
+        self,
+        aqi_coeffs: np.ndarray,
+        has_aqi: np.ndarray,
+        sensitivities: List[float],
+        travel_mode: TravelMode
+    ) -> Dict[str, np.ndarray]:
+        """Returns AQ costs of the linking edges of the current request (by departure time), i.e.
+        the costs of the edges on which they were created scaled to the lengths of the links.
+        """
+        link_edges = self.graph.es[self.ecount:]
+        base_edge_ids = np.array(
+            [self.__link_edge_base_ids[edge.index] for edge in link_edges], dtype=np.int64
+        )
+        lengths = np.array(link_edges[E.length.value], dtype=np.float64)
+        bike_time_costs = np.array(
+            link_edges[E.bike_time_cost.value], dtype=np.float64
+        ) if travel_mode == TravelMode.BIKE else None
+        return self.__get_aq_cost_arrays(
+            aqi_coeffs[base_edge_ids],
+            has_aqi[base_edge_ids],
+            lengths,
+            bike_time_costs,
+            aq_exps.get_missing_aqi_cost_array(lengths),
+            sensitivities,
+            travel_mode
+        )
+
+    def __get_edge_weights(self, weight: str) -> Union[str, List[float], np.ndarray]:
+        """Returns AQ costs of the current request (by departure time) or from the current AQ
+        snapshot as edge weights (completed with the costs of the linking edges), or the name of
+        the weight attribute if the weight is not an AQ cost.
+        """
+        request_aq_costs = self.__request_aq_costs.get(weight)
+        if request_aq_costs is not None:
+            return request_aq_costs
+        aq_costs = self.get_aq_snapshot().aq_costs.get(weight)
+        if aq_costs is None:
+            return weight
+        if self.graph.ecount() == self.ecount:
+            return aq_costs
+        return aq_costs + self.graph.es[self.ecount:][weight]
+
     def get_least_cost_path(
         self,
         orig_node: int,
@@ -252,7 +626,7 @@ class GraphHandler:
                 s_path = self.graph.get_shortest_paths(
                     orig_node,
                     to=dest_node,
-                    weights=weight,
+                    weights=self.__get_edge_weights(weight),
                     mode=1,
                     output='epath'
                 )
@@ -263,7 +637,13 @@ class GraphHandler:
             raise RoutingException(ErrorKey.OD_SAME_LOCATION.value)
 
     def reset_edge_cache(self):
-        self.__path_edge_cache = {}
+        """Clears cached path edges of the linking edges of the current request (the ids of the
+        linking edges will be reused in the next requests) and releases the pinned AQ snapshot
+        and the AQ costs of the request.
+        """
+        self.__link_path_edge_cache = {}
+        self.__request_aq_snapshot = None
+        self.__request_aq_costs = {}
 
     def drop_nodes_edges(self, node_ids=Tuple) -> None:
         """Removes nodes and connected edges from the graph.
@@ -271,6 +651,7 @@ class GraphHandler:
         try:
             self.graph.delete_vertices(node_ids)
             self.log.debug(f'Removed {len(node_ids)} nodes')
+            self.__link_edge_base_ids = {}
         except Exception:
             self.log.error(f'Could not remove nodes from the graph: {node_ids}')
 
@@ -283,3 +664,23 @@ class GraphHandler:
             self.log.error(
                 f'Graph has incorrect number of nodes: {self.graph.vcount()} is not {self.vcount}'
             )
+
+
+def _get_mdB(noises: Union[dict, None], length: float) -> float:
+    # edges without length are not used as path edges
+    return noise_exps.get_mean_noise_level(noises, length) if noises and length else 0
+
+
+def _get_gvi_cl(gvi: Union[float, None]) -> Union[int, None]:
+    return gvi_exps.get_gvi_class(gvi) if gvi is not None else None
+
+
+def _get_aqi_cl(aqi: Union[float, None]) -> Union[int, None]:
+    return aq_exps.get_aqi_class(aqi) if aqi else None
+
+
+def _get_class_array(classes: List[Union[int, None]]) -> np.ndarray:
+    return np.array(
+        [edge_class if edge_class is not None else missing_edge_class for edge_class in classes],
+        dtype=np.int64
+    )
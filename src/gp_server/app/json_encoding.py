@@ -0,0 +1,87 @@
+"""
+This module provides functions for encoding routing responses as JSON (bytes).
+
+WGS coordinates of the edges are encoded to JSON fragments only once when the graph is loaded.
+Geometries of paths and edge groups can then be composed by concatenating the fragments instead of
+rounding and serializing nested coordinate lists on every request. The rest of the response
+(i.e. properties) is serialized with orjson.
+
+Geometries can alternatively be encoded as encoded polylines (precision 6) for clients that
+request the more compact polyline response format.
+
+"""
+
+from typing import List, Sequence, Tuple
+import orjson
+import common.geometry as geom_utils
+
+
+def dumps(obj) -> bytes:
+    """Serializes the object to JSON. Non-string keys (e.g. exposures to AQI classes) are
+    serialized as strings, like in the standard library json. Numpy scalars (e.g. aggregated
+    exposures) are serialized as native numbers.
+    """
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+def get_coords_json_fragment(coords: Sequence[Tuple[float, float]], digits: int = 6) -> bytes:
+    """Returns coordinates as rounded JSON array elements without the enclosing brackets, e.g.
+    b'[24.96716,60.20772],[24.9653,60.2037]'. Fragments can be joined with b','.
+    """
+    return dumps(geom_utils.round_coordinates(coords, digits=digits))[1:-1]
+
+
+def get_line_geometry_json(coords_fragments: List[bytes]) -> bytes:
+    """Returns a GeoJSON LineString geometry as JSON. The coordinates of the line are composed
+    from the given coordinate fragments.
+    """
+    return b''.join((
+        b'{"coordinates":[',
+        b','.join(coords_fragments),
+        b'],"type":"LineString"}'
+    ))
+
+
+def get_coords_from_fragments(coords_fragments: List[bytes]) -> List[List[float]]:
+    """Decodes coordinate fragments to a flat list of (rounded) coordinates.
+    """
+    return orjson.loads(b''.join((b'[', b','.join(coords_fragments), b']')))
+
+
+def get_polyline_geometries_json(
+    coords_lists: List[Sequence[Sequence[float]]],
+    precision: int = 6
+) -> List[bytes]:
+    """Returns line geometries as encoded polylines, e.g.
+    {"polyline":"...","precision":6,"type":"EncodedPolyline"}. The coordinates should be rounded
+    as in GeoJSON responses (see get_coords_from_fragments), so that decoded polylines match them
+    exactly. All lines are encoded at once as it is much faster than one by one.
+    """
+    return [
+        b''.join((
+            b'{"polyline":',
+            dumps(polyline),
+            b',"precision":%d,"type":"EncodedPolyline"}' % precision
+        ))
+        for polyline in geom_utils.encode_polylines(coords_lists, precision=precision)
+    ]
+
+
+def get_feature_json(geometry_json: bytes, props: dict) -> bytes:
+    """Returns a feature with the given (pre-encoded) geometry and properties as JSON.
+    """
+    return b''.join((
+        b'{"type":"Feature","properties":',
+        dumps(props),
+        b',"geometry":',
+        geometry_json,
+        b'}'
+    ))
+
+
+def get_feature_collection_json(features: List[bytes]) -> bytes:
+    return b''.join((
+        b'{"type":"FeatureCollection","features":[',
+        b','.join(features),
+        b']}'
+    ))
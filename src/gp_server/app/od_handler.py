@@ -5,7 +5,7 @@ from typing import Dict, Tuple, Union
 from shapely.geometry import Point, LineString
 from gp_server.app.graph_handler import GraphHandler
 from common.igraph import Edge as E
-from gp_server.app.constants import RoutingException, ErrorKey
+from gp_server.app.constants import RoutingException, ErrorKey, link_base_edge_id_key
 
 
 def __get_closest_point_on_line(line: LineString, point: Point) -> Point:
@@ -52,7 +52,11 @@ def __project_link_edge_attrs(
             on_edge_attrs.get(E.noises.value, None),
             link_len_ratio
         ),
-        E.aqi.value: on_edge_attrs.get(E.aqi.value, None)
+        E.aqi.value: on_edge_attrs.get(E.aqi.value, None),
+        # a link may also be created on a linking edge (of the origin)
+        link_base_edge_id_key: on_edge_attrs.get(
+            link_base_edge_id_key, on_edge_attrs.get(E.id_ig.value)
+        )
     }
     cost_attrs = {
         attr: round(value * link_len_ratio, 2)
@@ -1,10 +1,12 @@
+import numpy as np
 from shapely.geometry import LineString
-from typing import List, Tuple
+from typing import FrozenSet, List, Tuple, Union
 from gp_server.conf import conf
-import common.geometry as geom_utils
-from gp_server.app.constants import PathType, TravelMode
+import gp_server.app.json_encoding as json_enc
+from gp_server.app.constants import (
+    PathType, ResponseField, ResponseFormat, TravelMode, all_response_fields)
 from gp_server.app.logger import Logger
-from gp_server.app.types import PathEdge
+from gp_server.app.types import PathEdge, missing_edge_class
 from gp_server.app.path_noise_attrs import PathNoiseAttrs, create_path_noise_attrs
 from gp_server.app.path_aqi_attrs import PathAqiAttrs, create_aqi_attrs
 from gp_server.app.path_gvi_attrs import PathGviAttrs, create_gvi_attrs
@@ -27,7 +29,11 @@ class Path:
         self.edge_ids: List[int] = edge_ids
         self.cost_coeff: float = cost_coeff
         self.edges: List[PathEdge] = []
-        self.edge_groups: List[Tuple[int, List[dict]]] = []
+        # edge groups as tuples of group value and index range of the edges (start, end)
+        self.edge_groups: List[Tuple[int, int, int]] = []
+        self.__edge_classes: Union[Tuple[str, np.ndarray], None] = None
+        self.__coords_wgs: Union[list, None] = None
+        self.__coords_wgs_offsets: Union[List[int], None] = None
         self.geometry = None
         self.length: float = None
         self.length_bike_allowed: float = None
@@ -51,6 +57,15 @@ class Path:
         """Iterates through the path's edge IDs and loads edge attributes from a graph.
         """
         self.edges = G.get_path_edges_by_ids(self.edge_ids)
+        self.__edge_classes = None
+        self.__coords_wgs = None
+        self.__coords_wgs_offsets = None
+
+    def set_edge_classes(self, G: GraphHandler, class_attr: str) -> None:
+        """Loads classes of the path's edges (e.g. db_range) from precomputed class arrays of
+        the graph for grouping the edges by class.
+        """
+        self.__edge_classes = (class_attr, G.get_path_edge_classes(self.edge_ids, class_attr))
 
     def aggregate_path_attrs(self, log: Logger) -> None:
         """Aggregates path attributes form list of edges.
@@ -76,24 +91,25 @@ class Path:
         if self.missing_gvi:
             log.warning(f'Found missing GVI values for path ({[edge.gvi for edge in self.edges]})')
 
-    def set_noise_attrs(self, db_costs: dict) -> None:
+    def set_noise_attrs(self, db_costs: dict, class_exps: bool = True) -> None:
         if not self.missing_noises:
             noises_list = [edge.noises for edge in self.edges]
             self.noise_attrs = create_path_noise_attrs(
                 noises_list=noises_list,
                 db_costs=db_costs,
-                length=self.length
+                length=self.length,
+                class_exps=class_exps
             )
 
-    def set_aqi_attrs(self) -> None:
+    def set_aqi_attrs(self, class_exps: bool = True) -> None:
         if not self.missing_aqi:
             aqi_exp_list = [(edge.aqi, edge.length) for edge in self.edges]
-            self.aqi_attrs = create_aqi_attrs(aqi_exp_list, self.length)
+            self.aqi_attrs = create_aqi_attrs(aqi_exp_list, self.length, class_exps=class_exps)
 
-    def set_gvi_attrs(self) -> None:
+    def set_gvi_attrs(self, class_exps: bool = True) -> None:
         if not self.missing_gvi:
             gvi_exp_list = [(edge.gvi, edge.length) for edge in self.edges]
-            self.gvi_attrs = create_gvi_attrs(gvi_exp_list)
+            self.gvi_attrs = create_gvi_attrs(gvi_exp_list, class_exps=class_exps)
 
     def set_compare_to_fastest_attrs(self, fastest_path: 'Path') -> None:
         self.len_diff = round(self.length - fastest_path.length, 1)
@@ -107,50 +123,111 @@ class Path:
         if self.gvi_attrs and fastest_path.gvi_attrs:
             self.gvi_attrs.set_gvi_diff_attrs(fastest_path.gvi_attrs)
 
+    def __get_edge_classes(self, class_attr: str) -> np.ndarray:
+        if self.__edge_classes and self.__edge_classes[0] == class_attr:
+            return self.__edge_classes[1]
+        return np.array([
+            edge_class if edge_class is not None else missing_edge_class
+            for edge_class in (getattr(edge, class_attr) for edge in self.edges)
+        ], dtype=np.int64)
+
     def aggregate_edge_groups_by_attr(self, grouping_attr: str) -> None:
         """Create groups of edges by PathEdge attribute values. Groups are formed by
-        aggregating all adjacent edges with same attribute value (grouping_attr).
+        aggregating all adjacent edges with same attribute value (grouping_attr), i.e. by
+        run-length encoding the values of the edges.
         """
+        classes = self.__get_edge_classes(grouping_attr)
+        if not len(classes):
+            self.edge_groups = []
+            return
+        group_starts = np.flatnonzero(np.diff(classes, prepend=classes[0] - 1))
+        group_ends = np.append(group_starts[1:], len(classes))
+        self.edge_groups = [
+            (edge_class if edge_class != missing_edge_class else None, start, end)
+            for edge_class, start, end
+            in zip(classes[group_starts].tolist(), group_starts.tolist(), group_ends.tolist())
+        ]
+
+    def __get_coords_wgs(self, start: int, end: int) -> List[List[float]]:
+        """Returns rounded WGS coordinates of the edges in the given index range. Coordinates of
+        all edges of the path are decoded once (from the pre-encoded edge coordinates) to a flat
+        list, from which coordinates of the edges are sliced by coordinate offsets of the edges.
+        """
+        if self.__coords_wgs is None:
+            self.__coords_wgs = json_enc.get_coords_from_fragments(
+                [edge.coords_wgs_json for edge in self.edges]
+            )
+            self.__coords_wgs_offsets = np.concatenate((
+                [0], np.cumsum([len(edge.coords_wgs) for edge in self.edges], dtype=np.int64)
+            )).tolist()
+        return self.__coords_wgs[self.__coords_wgs_offsets[start]:self.__coords_wgs_offsets[end]]
+
+    def __get_geometries_json(
+        self,
+        edge_ranges: List[Tuple[int, int]],
+        response_format: ResponseFormat
+    ) -> List[bytes]:
+        if response_format == ResponseFormat.POLYLINE:
+            return json_enc.get_polyline_geometries_json(
+                [self.__get_coords_wgs(start, end) for start, end in edge_ranges]
+            )
+        return [
+            json_enc.get_line_geometry_json(
+                [edge.coords_wgs_json for edge in self.edges[start:end]]
+            )
+            for start, end in edge_ranges
+        ]
+
+    def __get_edge_group_props(self, group_value: int, comparison: bool) -> dict:
+        props = {
+            'value': group_value,
+            'path': self.path_id,
+            'p_length': self.length
+        }
+        if comparison:
+            props['p_len_diff'] = self.len_diff
+        return props
 
-        cur_group = []
-        cur_group_id: int = 0
-        for edge in self.edges:
-            # get either aqi class or noise range value
-            value = getattr(edge, grouping_attr)
-            # add edge to current or new group based on group_attr
-            if value == cur_group_id:
-                cur_group.append(edge)
-            else:
-                # before creating a new group, add the current group to self.edge_groups
-                if cur_group:
-                    self.edge_groups.append((cur_group_id, cur_group))
-                # create new edge group and add edge there
-                cur_group = []
-                cur_group_id = value
-                cur_group.append(edge)
-        self.edge_groups.append((cur_group_id, cur_group))
-
-    def get_edge_groups_as_features(self) -> List[dict]:
+    def get_edge_groups_as_features(
+        self,
+        fields: FrozenSet[ResponseField] = all_response_fields
+    ) -> List[dict]:
+        comparison = ResponseField.COMPARISON in fields
         features = []
-        for group in self.edge_groups:
-            group_coords = [coords for edge in group[1] for coords in edge.coords_wgs]
-            group_coords = geom_utils.round_coordinates(group_coords, digits=6)
-            feature = _get_geojson_feature_dict(group_coords)
-            feature['properties'] = {
-                'value': group[0],
-                'path': self.path_id,
-                'p_len_diff': self.len_diff,
-                'p_length': self.length
-            }
+        for value, start, end in self.edge_groups:
+            feature = _get_geojson_feature_dict(self.__get_coords_wgs(start, end))
+            feature['properties'] = self.__get_edge_group_props(value, comparison)
             features.append(feature)
         return features
 
-    def get_as_geojson_feature(self, travel_mode: TravelMode) -> dict:
-        wgs_coords = [coord for edge in self.edges for coord in edge.coords_wgs]
-        wgs_coords = geom_utils.round_coordinates(wgs_coords, digits=6)
-
-        feature_d = _get_geojson_feature_dict(wgs_coords)
+    def get_edge_groups_as_features_json(
+        self,
+        response_format: ResponseFormat = ResponseFormat.GEOJSON,
+        fields: FrozenSet[ResponseField] = all_response_fields
+    ) -> List[bytes]:
+        """Returns edge groups as features encoded to JSON. Geometries are composed from the
+        pre-encoded coordinates of the edges or encoded as polylines (by response_format).
+        """
+        comparison = ResponseField.COMPARISON in fields
+        geometries = self.__get_geometries_json(
+            [(start, end) for _, start, end in self.edge_groups], response_format
+        )
+        return [
+            json_enc.get_feature_json(geometry, self.__get_edge_group_props(group[0], comparison))
+            for group, geometry in zip(self.edge_groups, geometries)
+        ]
 
+    def __get_geojson_props(
+        self,
+        travel_mode: TravelMode,
+        fields: FrozenSet[ResponseField]
+    ) -> dict:
+        """Returns the properties of the path. Exposures to noise levels and AQI & GVI classes
+        and differences to the fastest path are only included if they are in the requested
+        response fields.
+        """
+        exposures = ResponseField.EXPOSURES in fields
+        comparison = ResponseField.COMPARISON in fields
         mode_lengths = {
             'walk': self.length_no_bike_allowed if travel_mode == TravelMode.BIKE else self.length,
             'bike': self.length_bike_allowed if travel_mode == TravelMode.BIKE else 0,
@@ -163,23 +240,30 @@ class Path:
             'mode_lengths': mode_lengths,
             'bike_time_cost': self.bike_time_cost,
             'bike_safety_cost': self.bike_safety_cost,
-            'len_diff': self.len_diff,
-            'len_diff_rat': self.len_diff_rat,
             'cost_coeff': self.cost_coeff,
             'missing_aqi': self.missing_aqi,
             'missing_noises': self.missing_noises,
             'missing_gvi': self.missing_gvi,
         }
-        noise_props = self.noise_attrs.get_noise_props_dict() if self.noise_attrs else {}
-        aqi_props = self.aqi_attrs.get_aqi_props_dict() if self.aqi_attrs else {}
-        gvi_props = self.gvi_attrs.get_gvi_props_dict() if self.gvi_attrs else {}
+        if comparison:
+            props['len_diff'] = self.len_diff
+            props['len_diff_rat'] = self.len_diff_rat
+        noise_props = self.noise_attrs.get_noise_props_dict(
+            exposures, comparison
+        ) if self.noise_attrs else {}
+        aqi_props = self.aqi_attrs.get_aqi_props_dict(
+            exposures, comparison
+        ) if self.aqi_attrs else {}
+        gvi_props = self.gvi_attrs.get_gvi_props_dict(
+            exposures, comparison
+        ) if self.gvi_attrs else {}
 
         edge_ids = {'edge_ids': self.edge_ids} if conf.research_mode else {}
         edge_data = {
             'edge_data': [edge.as_props() for edge in self.edges]
         } if conf.edge_data else {}
 
-        feature_d['properties'] = {
+        return {
             **props,
             **noise_props,
             **aqi_props,
@@ -187,8 +271,30 @@ class Path:
             **edge_ids,
             **edge_data
         }
+
+    def get_as_geojson_feature(
+        self,
+        travel_mode: TravelMode,
+        fields: FrozenSet[ResponseField] = all_response_fields
+    ) -> dict:
+        feature_d = _get_geojson_feature_dict(self.__get_coords_wgs(0, len(self.edges)))
+        feature_d['properties'] = self.__get_geojson_props(travel_mode, fields)
         return feature_d
 
+    def get_as_feature_json(
+        self,
+        travel_mode: TravelMode,
+        response_format: ResponseFormat = ResponseFormat.GEOJSON,
+        fields: FrozenSet[ResponseField] = all_response_fields
+    ) -> bytes:
+        """Returns the path as feature encoded to JSON. The geometry is composed from the
+        pre-encoded coordinates of the edges or encoded as polyline (by response_format).
+        """
+        return json_enc.get_feature_json(
+            self.__get_geometries_json([(0, len(self.edges))], response_format)[0],
+            self.__get_geojson_props(travel_mode, fields)
+        )
+
 
 def _get_geojson_feature_dict(coords: List[tuple]) -> dict:
     """Returns a dictionary with GeoJSON schema and geometry based on the given geometry.
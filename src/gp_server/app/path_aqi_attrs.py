@@ -10,8 +10,8 @@ class PathAqiAttrs:
     aqi_m: float
     aqc: float
     aqc_norm: float
-    aqi_cl_exps: Dict[int, float]
-    aqi_cl_pcts: dict
+    aqi_cl_exps: Dict[int, float] = None
+    aqi_cl_pcts: dict = None
     aqi_m_diff: float = None
     aqc_diff: float = None
     aqc_diff_rat: float = None
@@ -23,31 +23,38 @@ class PathAqiAttrs:
             self.aqc_diff / s_path_aqi_attrs.aqc) * 100, 1
         ) if s_path_aqi_attrs.aqc else 0
 
-    def get_aqi_props_dict(self) -> dict:
-        return {
+    def get_aqi_props_dict(self, exposures: bool = True, comparison: bool = True) -> dict:
+        props = {
             'aqi_m': self.aqi_m,
             'aqc': round(self.aqc, 2),
-            'aqc_norm': self.aqc_norm,
-            'aqi_cl_exps': self.aqi_cl_exps,
-            'aqi_cl_pcts': self.aqi_cl_pcts,
-            'aqi_m_diff': self.aqi_m_diff,
-            'aqc_diff': self.aqc_diff,
-            'aqc_diff_rat': self.aqc_diff_rat
+            'aqc_norm': self.aqc_norm
         }
+        if exposures:
+            props['aqi_cl_exps'] = self.aqi_cl_exps
+            props['aqi_cl_pcts'] = self.aqi_cl_pcts
+        if comparison:
+            props['aqi_m_diff'] = self.aqi_m_diff
+            props['aqc_diff'] = self.aqc_diff
+            props['aqc_diff_rat'] = self.aqc_diff_rat
+        return props
 
 
 def create_aqi_attrs(
     aqi_exp_list: List[Tuple[float, float]],
-    length: float
+    length: float,
+    class_exps: bool = True
 ) -> PathAqiAttrs:
-
+    """Aggregates AQI exposures of a path. Exposures to AQI classes are only aggregated if
+    class_exps is True.
+    """
     aqc = aq_exps.get_total_aqi_cost_from_exps(aqi_exp_list)
-    aqi_cl_exps = aq_exps.aggregate_aqi_class_exps(aqi_exp_list)
 
-    return PathAqiAttrs(
+    aqi_attrs = PathAqiAttrs(
         aqi_m=aq_exps.get_mean_aqi(aqi_exp_list),
         aqc=aqc,
-        aqc_norm=round(aqc / length, 3),
-        aqi_cl_exps=aqi_cl_exps,
-        aqi_cl_pcts=aq_exps.get_aqi_class_pcts(aqi_cl_exps, length),
+        aqc_norm=round(aqc / length, 3)
     )
+    if class_exps:
+        aqi_attrs.aqi_cl_exps = aq_exps.aggregate_aqi_class_exps(aqi_exp_list)
+        aqi_attrs.aqi_cl_pcts = aq_exps.get_aqi_class_pcts(aqi_attrs.aqi_cl_exps, length)
+    return aqi_attrs
@@ -11,8 +11,8 @@ class PathNoiseAttrs:
     mdB: float
     nei: float
     nei_norm: float
-    noise_range_exps: dict
-    noise_pcts: dict
+    noise_range_exps: dict = None
+    noise_pcts: dict = None
     mdB_diff: float = None
     nei_diff: float = None
     nei_diff_rat: float = None
@@ -24,36 +24,45 @@ class PathNoiseAttrs:
             self.nei_diff / s_path_noise_attrs.nei
         ) * 100, 1) if s_path_noise_attrs.nei > 0 else 0
 
-    def get_noise_props_dict(self) -> dict:
-        return {
-            'noises': self.noises,
+    def get_noise_props_dict(self, exposures: bool = True, comparison: bool = True) -> dict:
+        props = {
             'mdB': self.mdB,
             'nei': self.nei,
-            'nei_norm': round(self.nei_norm, 2),
-            'noise_range_exps': self.noise_range_exps,
-            'noise_pcts': self.noise_pcts,
-            'mdB_diff':  self.mdB_diff,
-            'nei_diff':  self.nei_diff,
-            'nei_diff_rat': self.nei_diff_rat
+            'nei_norm': round(self.nei_norm, 2)
         }
+        if exposures:
+            props['noises'] = self.noises
+            props['noise_range_exps'] = self.noise_range_exps
+            props['noise_pcts'] = self.noise_pcts
+        if comparison:
+            props['mdB_diff'] = self.mdB_diff
+            props['nei_diff'] = self.nei_diff
+            props['nei_diff_rat'] = self.nei_diff_rat
+        return props
 
 
 def create_path_noise_attrs(
     noises_list: List[dict],
     db_costs: dict,
-    length: float
+    length: float,
+    class_exps: bool = True
 ) -> PathNoiseAttrs:
-
+    """Aggregates noise exposures of a path. Exposures to noise level ranges are only
+    aggregated if class_exps is True.
+    """
     noises = noise_exps.aggregate_exposures(noises_list)
     nei = round(noise_exps.get_noise_exposure_index(noises, db_costs), 1)
     max_db_cost = max(db_costs.values())
-    noise_range_exps = noise_exps.get_noise_range_exps(noises, length)
 
-    return PathNoiseAttrs(
+    noise_attrs = PathNoiseAttrs(
         noises=noises,
         mdB=noise_exps.get_mean_noise_level(noises, length),
         nei=nei,
-        nei_norm=round(nei / (max_db_cost * length), 4),
-        noise_range_exps=noise_range_exps,
-        noise_pcts=noise_exps.get_noise_range_pcts(noise_range_exps, length)
+        nei_norm=round(nei / (max_db_cost * length), 4)
     )
+    if class_exps:
+        noise_attrs.noise_range_exps = noise_exps.get_noise_range_exps(noises, length)
+        noise_attrs.noise_pcts = noise_exps.get_noise_range_pcts(
+            noise_attrs.noise_range_exps, length
+        )
+    return noise_attrs
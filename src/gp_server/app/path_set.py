@@ -1,7 +1,10 @@
-from typing import List
+from typing import FrozenSet, List
 import gp_server.utils.paths_overlay_filter as path_overlay_filter
-from gp_server.app.constants import RoutingMode, PathType, TravelMode, path_type_by_routing_mode
+from gp_server.app.constants import (
+    RoutingMode, PathType, ResponseField, ResponseFormat, TravelMode, all_response_fields,
+    path_type_by_routing_mode)
 from gp_server.app.logger import Logger
+import gp_server.app.json_encoding as json_enc
 from gp_server.app.path import Path
 from gp_server.app.types import edge_group_attr_by_routing_mode
 
@@ -32,9 +35,15 @@ class PathSet:
             prev_edge_ids = path.edge_ids
         self.paths = filtered
 
-    def set_path_edges(self, G) -> None:
+    def set_path_edges(self, G, edge_classes: bool = True) -> None:
+        """Loads edges of the paths from the graph. Classes of the edges (for edge groups) are
+        only loaded if edge_classes is True.
+        """
+        edge_grouping_attr = edge_group_attr_by_routing_mode[self.routing_mode]
         for p in self.paths:
             p.set_path_edges(G)
+            if edge_classes:
+                p.set_edge_classes(G, edge_grouping_attr)
 
     def aggregate_path_attrs(self) -> None:
         for p in self.paths:
@@ -112,11 +121,11 @@ class PathSet:
         if filtered_out_count:
             self.log.info(f'Filtered out {filtered_out_count} green paths without exposure data')
 
-    def set_path_exp_attrs(self, db_costs) -> None:
+    def set_path_exp_attrs(self, db_costs, class_exps: bool = True) -> None:
         for path in self.paths:
-            path.set_noise_attrs(db_costs)
-            path.set_aqi_attrs()
-            path.set_gvi_attrs()
+            path.set_noise_attrs(db_costs, class_exps)
+            path.set_aqi_attrs(class_exps)
+            path.set_gvi_attrs(class_exps)
 
     def filter_out_unique_geom_paths(self, buffer_m=50) -> None:
         """Filters out fast / green paths with nearly similar geometries (using "greenest"
@@ -156,22 +165,64 @@ class PathSet:
             if path.path_type != PathType.FASTEST:
                 path.set_compare_to_fastest_attrs(fastest_path)
 
-    def get_paths_as_feature_collection(self) -> dict:
+    def reclassify_shortest_path(self) -> None:
+        """Labels the first path of the set as the shortest path (for research mode).
+        """
+        self.paths[0].set_path_type(PathType.SHORTEST)
+        self.paths[0].set_path_id(PathType.SHORTEST.value)
+
+    def get_paths_as_feature_collection(
+        self,
+        fields: FrozenSet[ResponseField] = all_response_fields
+    ) -> dict:
         """Returns paths of the set as GeoJSON FeatureCollection (dict).
         """
         return as_geojson_feature_collection([
-                path.get_as_geojson_feature(self.travel_mode) for path in self.paths
+                path.get_as_geojson_feature(self.travel_mode, fields) for path in self.paths
+            ]
+        )
+
+    def get_paths_as_feature_collection_json(
+        self,
+        response_format: ResponseFormat = ResponseFormat.GEOJSON,
+        fields: FrozenSet[ResponseField] = all_response_fields
+    ) -> bytes:
+        """Returns paths of the set as FeatureCollection encoded to JSON.
+        """
+        return json_enc.get_feature_collection_json([
+                path.get_as_feature_json(self.travel_mode, response_format, fields)
+                for path in self.paths
             ]
         )
 
-    def get_edges_as_feature_collection(self) -> dict:
+    def __aggregate_edge_groups(self) -> None:
         edge_grouping_attr = edge_group_attr_by_routing_mode[self.routing_mode]
         for path in self.paths:
             path.aggregate_edge_groups_by_attr(edge_grouping_attr)
 
-        feat_lists = [path.get_edge_groups_as_features() for path in self.paths]
+    def get_edges_as_feature_collection(
+        self,
+        fields: FrozenSet[ResponseField] = all_response_fields
+    ) -> dict:
+        self.__aggregate_edge_groups()
+        feat_lists = [path.get_edge_groups_as_features(fields) for path in self.paths]
 
         return as_geojson_feature_collection([
             feat for feat_list in feat_lists for feat in feat_list
             ]
         )
+
+    def get_edges_as_feature_collection_json(
+        self,
+        response_format: ResponseFormat = ResponseFormat.GEOJSON,
+        fields: FrozenSet[ResponseField] = all_response_fields
+    ) -> bytes:
+        self.__aggregate_edge_groups()
+        feat_lists = [
+            path.get_edge_groups_as_features_json(response_format, fields) for path in self.paths
+        ]
+
+        return json_enc.get_feature_collection_json([
+            feat for feat_list in feat_lists for feat in feat_list
+            ]
+        )
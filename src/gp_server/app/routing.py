@@ -1,4 +1,4 @@
-from typing import List, Union
+from typing import FrozenSet, List, Tuple, Union
 from gp_server.app.graph_aqi_updater import GraphAqiUpdater
 import time
 from gp_server.conf import conf
@@ -13,8 +13,8 @@ from gp_server.app.path_set import PathSet
 from gp_server.app.logger import Logger
 from gp_server.app.graph_handler import GraphHandler
 from gp_server.app.constants import (
-    ErrorKey, PathType, RoutingException, RoutingMode,
-    TravelMode, cost_prefix_dict, path_type_by_routing_mode)
+    ErrorKey, PathType, ResponseField, ResponseFormat, RoutingException, RoutingMode,
+    TravelMode, all_response_fields, cost_prefix_dict, path_type_by_routing_mode)
 from gp_server.app.types import OdData, OdSettings, RoutingConf
 
 
@@ -46,7 +46,8 @@ def parse_od_settings(
     orig_lon,
     dest_lat,
     dest_lon,
-    aqi_updater: Union[GraphAqiUpdater, None]
+    aqi_updater: Union[GraphAqiUpdater, None],
+    depart_at: Union[str, None] = None
 ) -> OdSettings:
 
     try:
@@ -90,7 +91,40 @@ def parse_od_settings(
     dest_point = geom_utils.project_geom(geom_utils.get_point_from_lat_lon(dest_latLon))
     sens = routing_conf.sensitivities_by_routing_mode[routing_mode]
 
-    return OdSettings(orig_point, dest_point, travel_mode, routing_mode, sens)
+    return OdSettings(
+        orig_point, dest_point, travel_mode, routing_mode, sens, parse_depart_at(depart_at)
+    )
+
+
+def parse_depart_at(depart_at: Union[str, None]) -> Union[int, None]:
+    """Parses the optional departure time (unix time in seconds, e.g. "1603634400") that is used
+    in clean path routing with forecast AQI.
+
+    Raises:
+        RoutingException
+    """
+    if depart_at is None:
+        return None
+    try:
+        return int(depart_at)
+    except Exception:
+        raise RoutingException(ErrorKey.INVALID_DEPART_AT_PARAM.value)
+
+
+def parse_response_fields(include: Union[str, None]) -> FrozenSet[ResponseField]:
+    """Parses the optional parts of the path response to include from a comma separated list
+    (e.g. "edge_FC,exposures"). All parts are included if the list is not given (None), whereas
+    an empty list includes only paths with their basic properties.
+
+    Raises:
+        RoutingException
+    """
+    if include is None:
+        return all_response_fields
+    try:
+        return frozenset(ResponseField(field) for field in include.split(',') if field)
+    except Exception:
+        raise RoutingException(ErrorKey.INVALID_INCLUDE_PARAM.value)
 
 
 def find_or_create_od_nodes(
@@ -163,6 +197,21 @@ def __find_exp_optimized_paths(G: GraphHandler, od_settings: OdSettings, od_node
     ]
 
 
+def __set_departure_time_aq_costs(log: Logger, G: GraphHandler, od_settings: OdSettings):
+    start_time = time.time()
+    speed_ms = (
+        conf.bike_speed_ms if od_settings.travel_mode == TravelMode.BIKE else conf.walk_speed_ms
+    )
+    if G.set_departure_time_aq_costs(
+        od_settings.depart_at,
+        od_settings.orig_point,
+        speed_ms,
+        od_settings.travel_mode,
+        od_settings.sensitivities
+    ):
+        log.duration(start_time, 'departure time AQ costs set', unit='ms', log_level='info')
+
+
 def find_least_cost_paths(
     log: Logger,
     G: GraphHandler,
@@ -191,6 +240,8 @@ def find_least_cost_paths(
             paths.append(__find_safest_path(G, od_nodes))
 
         if od_settings.routing_mode not in (RoutingMode.FAST, RoutingMode.SAFE):
+            if od_settings.routing_mode == RoutingMode.CLEAN and od_settings.depart_at:
+                __set_departure_time_aq_costs(log, G, od_settings)
             paths.extend(__find_exp_optimized_paths(G, od_settings, od_nodes))
 
         path_set.set_unique_paths(paths)
@@ -205,24 +256,27 @@ def find_least_cost_paths(
         raise RoutingException(ErrorKey.PATHFINDING_ERROR.value)
 
 
-def process_paths_to_FC(
+def process_paths(
     log: Logger,
     G: GraphHandler,
     routing_conf: RoutingConf,
     od_settings: OdSettings,
-    path_set: PathSet
-) -> dict:
+    path_set: PathSet,
+    fields: FrozenSet[ResponseField] = all_response_fields
+) -> None:
     """Loads & collects path attributes from the graph for all paths. Also aggregates and filters out
-    nearly identical paths based on geometries and length.
+    nearly identical paths based on geometries and length. Attributes that are only needed for
+    the optional parts of the response (edge classes, class exposures and differences to the
+    fastest path) are only collected if the parts are in the requested fields.
 
-    Returns:
-        All paths as GeoJSON FeatureCollection (as python dictionary).
     Raises:
         Only meaningful exception strings that can be shown in UI.
     """
     start_time = time.time()
     try:
-        path_set.set_path_edges(G)
+        path_set.set_path_edges(
+            G, edge_classes=ResponseField.EDGE_FC in fields and not conf.research_mode
+        )
         path_set.aggregate_path_attrs()
 
         if conf.research_mode and od_settings.travel_mode == TravelMode.BIKE:
@@ -231,19 +285,48 @@ def process_paths_to_FC(
             path_set.reclassify_path_types()
 
         path_set.filter_out_exp_optimized_paths_missing_exp_data()
-        path_set.set_path_exp_attrs(routing_conf.db_costs)
+        path_set.set_path_exp_attrs(
+            routing_conf.db_costs, class_exps=ResponseField.EXPOSURES in fields
+        )
         path_set.filter_out_unique_geom_paths(buffer_m=50)
 
-        path_set.set_compare_to_fastest_attrs()
+        if ResponseField.COMPARISON in fields:
+            path_set.set_compare_to_fastest_attrs()
+
+        if conf.research_mode:
+            path_set.reclassify_shortest_path()
+
         log.duration(start_time, 'aggregated paths', unit='ms', log_level='info')
 
-        start_time = time.time()
-        path_FC = path_set.get_paths_as_feature_collection()
-        edge_FC = path_set.get_edges_as_feature_collection() if not conf.research_mode else None
-        log.duration(start_time, 'processed paths & edges to FC', unit='ms', log_level='info')
+    except Exception:
+        raise RoutingException(ErrorKey.PATH_PROCESSING_ERROR.value)
 
-        if conf.research_mode:
-            __reclassify_shortest_path(path_FC)
+
+def process_paths_to_FC(
+    log: Logger,
+    G: GraphHandler,
+    routing_conf: RoutingConf,
+    od_settings: OdSettings,
+    path_set: PathSet,
+    fields: FrozenSet[ResponseField] = all_response_fields
+) -> Tuple[dict, Union[dict, None]]:
+    """Processes paths (see process_paths) and converts them to GeoJSON FeatureCollections.
+    Edge groups are only created if edge_FC is in the requested fields.
+
+    Returns:
+        All paths and edge groups as GeoJSON FeatureCollections (as python dictionaries).
+    Raises:
+        Only meaningful exception strings that can be shown in UI.
+    """
+    process_paths(log, G, routing_conf, od_settings, path_set, fields)
+    start_time = time.time()
+    try:
+        path_FC = path_set.get_paths_as_feature_collection(fields)
+        edge_FC = (
+            path_set.get_edges_as_feature_collection(fields)
+            if ResponseField.EDGE_FC in fields and not conf.research_mode else None
+        )
+        log.duration(start_time, 'processed paths & edges to FC', unit='ms', log_level='info')
 
         return (path_FC, edge_FC)
 
@@ -251,9 +334,39 @@ def process_paths_to_FC(
         raise RoutingException(ErrorKey.PATH_PROCESSING_ERROR.value)
 
 
-def __reclassify_shortest_path(path_FC: dict) -> None:
-    path_FC['features'][0]['properties']['type'] = 'short'
-    path_FC['features'][0]['properties']['id'] = 'short'
+def process_paths_to_json(
+    log: Logger,
+    G: GraphHandler,
+    routing_conf: RoutingConf,
+    od_settings: OdSettings,
+    path_set: PathSet,
+    response_format: ResponseFormat = ResponseFormat.GEOJSON,
+    fields: FrozenSet[ResponseField] = all_response_fields
+) -> bytes:
+    """Processes paths (see process_paths) and encodes them to the JSON response body. Path and
+    edge geometries are composed from the pre-encoded edge coordinates of the graph or encoded
+    as polylines (if response_format is POLYLINE). Edge groups are only created if edge_FC is
+    in the requested fields (otherwise edge_FC is null).
+
+    Returns:
+        JSON object with paths and edge groups as GeoJSON FeatureCollections (path_FC, edge_FC).
+    Raises:
+        Only meaningful exception strings that can be shown in UI.
+    """
+    process_paths(log, G, routing_conf, od_settings, path_set, fields)
+    start_time = time.time()
+    try:
+        path_FC = path_set.get_paths_as_feature_collection_json(response_format, fields)
+        edge_FC = (
+            path_set.get_edges_as_feature_collection_json(response_format, fields)
+            if ResponseField.EDGE_FC in fields and not conf.research_mode else b'null'
+        )
+        log.duration(start_time, 'processed paths & edges to JSON', unit='ms', log_level='info')
+
+        return b''.join((b'{"path_FC":', path_FC, b',"edge_FC":', edge_FC, b'}'))
+
+    except Exception:
+        raise RoutingException(ErrorKey.PATH_PROCESSING_ERROR.value)
 
 
 def delete_added_graph_features(G: GraphHandler, od_nodes: OdData):
@@ -1,8 +1,8 @@
 from enum import Enum
+import numpy as np
 from typing import Dict, Union, List, Tuple
 from dataclasses import dataclass, field
 import common.geometry as geom_utils
-import gp_server.app.noise_exposures as noise_exps
 from shapely.geometry import Point
 from common.igraph import Edge as E
 from gp_server.app.constants import RoutingMode, TravelMode
@@ -10,7 +10,13 @@ from gp_server.app.constants import RoutingMode, TravelMode
 
 @dataclass
 class PathEdge:
-    """Class for handling edge attributes during routing."""
+    """Class for handling edge attributes during routing. Derived attributes (mdB, db_range,
+    aqi_cl and gvi_cl) are given as precomputed values (see GraphHandler).
+    """
+    __slots__ = (
+        'id', 'length', 'bike_time_cost', 'bike_safety_cost', 'allows_biking', 'aqi', 'aqi_cl',
+        'noises', 'mdB', 'db_range', 'gvi', 'gvi_cl', 'coords', 'coords_wgs', 'coords_wgs_json'
+    )
     id: int
     length: float
     bike_time_cost: Union[float, None]
@@ -19,16 +25,13 @@ class PathEdge:
     aqi: Union[float, None]
     aqi_cl: Union[float, None]
     noises: Union[dict, None]
+    mdB: float
+    db_range: int
     gvi: Union[float, None]
     gvi_cl: Union[int, None]
     coords: List[Tuple[float]]
     coords_wgs: List[Tuple[float]]
-    mdB: float = field(init=False)
-    db_range: int = field(init=False)
-
-    def __post_init__(self):
-        self.mdB = noise_exps.get_mean_noise_level(self.noises, self.length) if self.noises else 0
-        self.db_range = noise_exps.get_noise_range(self.mdB)
+    coords_wgs_json: bytes
 
     def as_props(self) -> dict:
         """Returns length (m), AQI, GVI, mean dB and WGS coordinates of the edge as a dictionary.
@@ -50,6 +53,9 @@ edge_group_attr_by_routing_mode: Dict[RoutingMode, str] = {
     RoutingMode.SAFE: 'gvi_cl'
 }
 
+# edge class value that represents missing class (None) in arrays of edge classes
+missing_edge_class: int = -1
+
 
 class Bikeability(Enum):
     NO_BIKE_STAIRS = 1
@@ -75,6 +81,7 @@ class OdSettings:
     travel_mode: TravelMode
     routing_mode: RoutingMode
     sensitivities: Union[List[float], None]
+    depart_at: Union[int, None] = None  # departure time as unix time (s), if given
 
 
 @dataclass
@@ -102,3 +109,21 @@ class OdData:
     dest_node: OdNodeData
     orig_link_edges: Union[Tuple[dict], Tuple[()]]
     dest_link_edges: Union[Tuple[dict], Tuple[()]]
+
+
+@dataclass(frozen=True)
+class AqSnapshot:
+    """AQI, AQI classes and AQ costs of the edges of a graph (by edge ID) from one AQI update.
+    Snapshots are never modified after they are published to GraphHandler, so a routing request
+    can keep using the snapshot it started with while a newer one is being published.
+    """
+    version: int
+    aqi_data_name: Union[str, None]  # e.g. aqi_2020-10-25T14.csv
+    aqi: List[Union[float, None]]
+    aqi_cl: List[Union[int, None]]
+    aqi_cl_array: np.ndarray  # AQI classes as in PathEdge class arrays (see GraphHandler)
+    aq_costs: Dict[str, List[float]]  # by cost attribute name (e.g. c_aq_5)
+    data_time: Union[int, None] = None  # UTC time of the AQI data as unix time (s)
+    # AQ cost coefficients (by edge ID) of the hour of the AQI data and the following forecast
+    # hours (memory-mapped), empty if the AQI update has no forecast hours
+    aqi_coeff_hours: List[np.ndarray] = field(default_factory=list)
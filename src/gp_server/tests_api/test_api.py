@@ -1,5 +1,7 @@
 from gp_server.app.constants import ErrorKey
+import common.geometry as geom_utils
 import json
+import gzip
 
 
 def test_endpoint_returns_ok(client):
@@ -52,6 +54,38 @@ def test_returns_as_long_aqi_map_data_array_as_expected(client):
     assert len(data['data']) == 387411
 
 
+def test_returns_aqi_map_data_with_version_and_etag(client):
+    response = client.get('/aqi-map-data')
+    data = json.loads(response.data)
+    status = json.loads(client.get('/aqi-map-data-status').data)
+    assert data['version'] == status['aqi_map_data_version']
+    version = data['version']
+    assert response.headers['ETag'] == f'W/"{version}"'
+    assert response.headers['Last-Modified'] == 'Sun, 25 Oct 2020 14:00:00 GMT'
+
+
+def test_returns_not_modified_aqi_map_data_for_matching_etag(client):
+    etag = client.get('/aqi-map-data').headers['ETag']
+    response = client.get('/aqi-map-data', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert not response.data
+    response = client.get('/aqi-map-data', headers={'If-None-Match': 'W/"aqi_2020-10-25T13.bin"'})
+    assert response.status_code == 200
+
+
+def test_returns_aqi_map_data_changes_since_version(client):
+    version = json.loads(client.get('/aqi-map-data').data)['version']
+    response = client.get(f'/aqi-map-data?since={version}')
+    assert response.status_code == 200
+    assert json.loads(response.data) == {
+        'data': [], 'removed': [], 'since': version, 'version': version
+    }
+    # all data is returned for unknown versions
+    data = json.loads(client.get('/aqi-map-data?since=aqi_2020-10-24T14.bin').data)
+    assert len(data['data']) == 387411
+    assert 'since' not in data
+
+
 def test_returns_error_for_invalid_travel_mode(client):
     response = client.get('/paths/walkASDF/quiet/60.212031,24.968584/60.201520,24.961191')
     assert response.status_code == 400
@@ -131,3 +165,82 @@ def test_routes_only_safest_bike_path(client):
     assert data['path_FC']['features'][0]['properties']['type'] == 'safe'
     assert data['path_FC']['features'][0]['properties']['id'] == 'safe'
     assert len(data['edge_FC']['features']) > 1
+
+
+def test_returns_paths_as_encoded_polylines_if_requested(client):
+    url = '/paths/bike/fast/60.212031,24.968584/60.201520,24.961191'
+    response = client.get(url)
+    assert response.mimetype == 'application/json'
+    geojson_data = json.loads(response.data)
+    response = client.get(url, headers={'Accept': 'application/vnd.greenpaths.polyline+json'})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/vnd.greenpaths.polyline+json'
+    data = json.loads(response.data)
+    for fc in ('path_FC', 'edge_FC'):
+        assert len(data[fc]['features']) == len(geojson_data[fc]['features'])
+        for feat, geojson_feat in zip(data[fc]['features'], geojson_data[fc]['features']):
+            assert feat['properties'] == geojson_feat['properties']
+            assert feat['geometry']['type'] == 'EncodedPolyline'
+            assert feat['geometry']['precision'] == 6
+            coords = geom_utils.decode_polyline(feat['geometry']['polyline'])
+            assert [list(c) for c in coords] == geojson_feat['geometry']['coordinates']
+
+
+def test_returns_compressed_aqi_map_data_if_accepted(client):
+    data = client.get('/aqi-map-data').data
+    response = client.get('/aqi-map-data', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert len(response.data) < len(data)
+    assert gzip.decompress(response.data) == data
+
+
+def test_returns_compressed_paths_if_accepted(client):
+    url = '/paths/bike/quiet/60.212031,24.968584/60.201520,24.961191'
+    data = client.get(url).data
+    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(response.data)) == json.loads(data)
+
+
+def test_returns_error_for_invalid_include_param(client):
+    url = '/paths/walk/quiet/60.212031,24.968584/60.201520,24.961191?include=edge_FC,foo'
+    response = client.get(url)
+    assert response.status_code == 400
+    assert json.loads(response.data)['error_key'] == ErrorKey.INVALID_INCLUDE_PARAM.value
+
+
+def test_returns_error_for_invalid_depart_at_param(client):
+    url = '/paths/bike/clean/60.212031,24.968584/60.201520,24.961191?depart_at=tomorrow'
+    response = client.get(url)
+    assert response.status_code == 400
+    assert json.loads(response.data)['error_key'] == ErrorKey.INVALID_DEPART_AT_PARAM.value
+
+
+def test_returns_only_requested_response_fields(client):
+    url = '/paths/walk/quiet/60.212031,24.968584/60.201520,24.961191'
+    full_data = json.loads(client.get(url).data)
+    response = client.get(f'{url}?include=')
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data['edge_FC'] is None
+    assert len(data['path_FC']['features']) == len(full_data['path_FC']['features'])
+    for feat, full_feat in zip(data['path_FC']['features'], full_data['path_FC']['features']):
+        props, full_props = feat['properties'], full_feat['properties']
+        assert feat['geometry'] == full_feat['geometry']
+        for prop in ('noise_range_exps', 'noise_pcts', 'len_diff', 'nei_diff', 'aqi_cl_exps'):
+            assert prop not in props
+        for prop in ('id', 'length', 'mdB', 'nei', 'nei_norm', 'aqc'):
+            assert props[prop] == full_props[prop]
+
+
+def test_returns_edge_groups_without_comparison_attrs(client):
+    url = '/paths/walk/quiet/60.212031,24.968584/60.201520,24.961191'
+    full_data = json.loads(client.get(url).data)
+    data = json.loads(client.get(f'{url}?include=edge_FC').data)
+    assert len(data['edge_FC']['features']) == len(full_data['edge_FC']['features'])
+    for feat in data['edge_FC']['features']:
+        assert 'p_len_diff' not in feat['properties']
+        assert 'value' in feat['properties']
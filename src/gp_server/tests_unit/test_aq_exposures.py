@@ -0,0 +1,55 @@
+import numpy as np
+import gp_server.app.aq_exposures as aq_exps
+from gp_server.app.constants import TravelMode
+from common.aqi_coeffs import get_aqi_coeffs
+
+
+def test_gets_aqi_classes_as_for_single_aqi_values():
+    aqis = [None, 0.0, 1.0, 1.49, 1.5, 2.6, 4.99, 5.0, float('nan')]
+    aqi_classes = aq_exps.get_aqi_classes(aqis)
+    assert aqi_classes == [
+        aq_exps.get_aqi_class(aqi) if aqi else None for aqi in aqis
+    ]
+    assert aqi_classes == [None, None, 1, 1, 2, 4, 8, 9, 0]
+    assert all(isinstance(aqi_cl, int) for aqi_cl in aqi_classes if aqi_cl is not None)
+
+
+def test_gets_aqi_coeffs_as_for_single_aqi_values():
+    aqis = np.array([0.5, 0.97, 1.0, 1.5, 2.6, 5.0])
+    aqi_coeffs = get_aqi_coeffs(aqis)
+    assert aqi_coeffs.tolist() == [10.0] + [aq_exps.get_aqi_coeff(aqi) for aqi in aqis[1:]]
+    assert np.isnan(get_aqi_coeffs(np.array([np.nan]))[0])
+
+
+def test_interpolates_aqi_coeffs_by_arrival_hours():
+    aqi_coeff_hours = [
+        np.array([0.1, 0.2, 0.3, np.nan]),
+        np.array([0.3, np.nan, 0.5, np.nan], dtype=np.float32),
+        np.array([0.5, 0.4, 0.9, np.nan], dtype=np.float32)
+    ]
+    aqi_coeffs = aq_exps.interpolate_aqi_coeffs(aqi_coeff_hours, np.array([0.5, 0.5, 1.5, 1.0]))
+    assert np.allclose(aqi_coeffs[:3], [0.2, 0.2, 0.7])
+    assert np.isnan(aqi_coeffs[3])
+    # arrival times outside the forecast hours are clamped
+    aqi_coeffs = aq_exps.interpolate_aqi_coeffs(aqi_coeff_hours, np.array([-1.0, 5.0, 2.0, 0.0]))
+    assert np.allclose(aqi_coeffs[:3], [0.1, 0.4, 0.9])
+
+
+def test_gets_aqi_cost_arrays_as_for_single_edges():
+    aqis = np.array([0.0, 0.5, 0.97, 1.0, 1.49, 2.6, 5.0])
+    lengths = np.array([10.0, 10.0, 13.3, 0.0, 52.5, 7.77, 100.1])
+    bike_time_costs = np.array([5.0, 0.0, 6.7, 0.0, 26.4, 3.9, 50.2])
+    sens = [5, 15, 30]
+    for travel_mode, btcs in ((TravelMode.WALK, None), (TravelMode.BIKE, bike_time_costs)):
+        cost_arrays = aq_exps.get_aqi_cost_arrays(
+            aqis, lengths, sens, bike_time_costs=btcs, travel_mode=travel_mode
+        )
+        for idx, (aqi, length) in enumerate(zip(aqis, lengths)):
+            aq_costs = aq_exps.get_aqi_costs(
+                aqi,
+                length,
+                sens,
+                bike_time_cost=btcs[idx] if btcs is not None else None,
+                travel_mode=travel_mode
+            )
+            assert aq_costs == {attr: costs[idx] for attr, costs in cost_arrays.items()}
@@ -0,0 +1,53 @@
+import json
+import numpy as np
+import common.aqi_map_data as aqi_map_data
+
+
+version = 'aqi_2020-10-10T08.bin'
+
+
+def test_gets_aqi_classes():
+    aqis = np.array([1.0, 1.49, 1.5, 2.2, 4.99, 5.0, np.nan, np.inf])
+    assert aqi_map_data.get_aqi_classes(aqis).tolist() == [1, 1, 2, 3, 8, 9, 0, 0]
+
+
+def test_writes_aqi_map_data_in_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(aqi_map_data, 'write_chunk_size', 2)
+    file_path = str(tmp_path / 'aqi_map.json')
+    aqi_map_data.write_aqi_map_data(file_path, np.array([3, 5, 8, 13, 21]), [1, 2, 3, 4, 5], version)
+    with open(file_path, 'rb') as f:
+        map_data = f.read()
+    assert json.loads(map_data) == {
+        'version': version, 'data': [[3, 1], [5, 2], [8, 3], [13, 4], [21, 5]]
+    }
+    assert aqi_map_data.is_versioned_aqi_map_data(map_data)
+    assert aqi_map_data.is_aqi_map_data_of_version(map_data, version)
+    assert not aqi_map_data.is_aqi_map_data_of_version(map_data, 'aqi_2020-10-10T09.bin')
+
+
+def test_writes_empty_aqi_map_data(tmp_path):
+    file_path = str(tmp_path / 'aqi_map.json')
+    aqi_map_data.write_aqi_map_data(file_path, np.array([]), np.array([]), version)
+    with open(file_path) as f:
+        assert json.load(f) == {'version': version, 'data': []}
+
+
+def test_does_not_recognize_legacy_aqi_map_data_as_versioned():
+    assert not aqi_map_data.is_versioned_aqi_map_data(b'{"data": [[1, 2]]}')
+
+
+def test_writes_aqi_map_delta(tmp_path):
+    prev_classes = aqi_map_data.get_aqi_classes_by_id([[0, 1], [1, 2], [3, 3]])
+    classes = aqi_map_data.get_aqi_classes_by_id([[0, 1], [1, 3], [4, 2]])
+    changed, removed = aqi_map_data.get_aqi_class_changes(prev_classes, classes)
+    file_path = str(tmp_path / 'aqi_map_delta.json')
+    aqi_map_data.write_aqi_map_delta(
+        file_path, aqi_map_data.get_delta(changed, removed, 'aqi_2020-10-10T07.bin', version)
+    )
+    with open(file_path) as f:
+        assert json.load(f) == {
+            'data': [[1, 3], [4, 2]],
+            'removed': [3],
+            'since': 'aqi_2020-10-10T07.bin',
+            'version': version
+        }
@@ -0,0 +1,22 @@
+import numpy as np
+import gp_server.app.aqi_map_data_api as aqi_map_data_api
+
+
+def test_gets_aqi_classes_by_id():
+    aqi_classes = aqi_map_data_api.get_aqi_classes_by_id([[0, 3], [2, 4], [5, 0]])
+    assert aqi_classes.tolist() == [3, -1, 4, -1, -1, 0]
+
+
+def test_gets_changed_and_removed_aqi_classes():
+    prev_aqi_classes = aqi_map_data_api.get_aqi_classes_by_id([[0, 3], [1, 3], [2, 4], [6, 2]])
+    aqi_classes = aqi_map_data_api.get_aqi_classes_by_id([[0, 3], [1, 4], [2, 4], [3, 5], [8, 1]])
+    changed, removed = aqi_map_data_api.get_aqi_class_changes(prev_aqi_classes, aqi_classes)
+    assert changed == [[1, 4], [3, 5], [8, 1]]
+    assert removed == [6]
+
+
+def test_gets_no_changes_for_same_aqi_classes():
+    aqi_classes = aqi_map_data_api.get_aqi_classes_by_id([[0, 3], [1, 3]])
+    changed, removed = aqi_map_data_api.get_aqi_class_changes(aqi_classes, np.copy(aqi_classes))
+    assert changed == []
+    assert removed == []
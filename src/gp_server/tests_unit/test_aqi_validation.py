@@ -0,0 +1,57 @@
+import numpy as np
+import common.aqi_validation as aqi_validation
+from common.aqi_validation import AqiValidity
+
+
+def test_gets_aqi_validities():
+    aqis = np.array([1.0, 4.2, 5.05, 0.0, np.nan, 0.5, -1.0, -np.inf, 6.0, np.inf])
+    validities = aqi_validation.get_aqi_validities(aqis)
+    assert [AqiValidity(v) for v in validities] == [
+        AqiValidity.OK,
+        AqiValidity.OK,
+        AqiValidity.OK,
+        AqiValidity.Missing,
+        AqiValidity.Missing,
+        AqiValidity.UnderOne,
+        AqiValidity.UnderZero,
+        AqiValidity.UnderZero,
+        AqiValidity.HigherThan5,
+        AqiValidity.Missing
+    ]
+
+
+def test_gets_wrong_type_aqi_validities():
+    validities = aqi_validation.get_aqi_validities([2.0, None, '2.0', 2, np.nan])
+    assert [AqiValidity(v) for v in validities] == [
+        AqiValidity.OK,
+        AqiValidity.WrongType,
+        AqiValidity.WrongType,
+        AqiValidity.WrongType,
+        AqiValidity.Missing
+    ]
+
+
+def test_reports_aqi_validity_counts():
+    report = aqi_validation.validate_aqis(np.array([1.5, 2.0, np.nan, 0.0, 0.5, 6.0, -2.0, 3.0]))
+    assert report.count == 8
+    assert report.ok_count == 3
+    assert report.missing_count == 2
+    assert report.invalid_count == 3
+    assert report.validity_counts[AqiValidity.UnderOne] == 1
+    assert report.validity_counts[AqiValidity.HigherThan5] == 1
+    assert report.validity_counts[AqiValidity.UnderZero] == 1
+    assert report.validity_counts[AqiValidity.WrongType] == 0
+    assert report.get_ratio(report.ok_count) == 3 / 8
+
+
+def test_reports_empty_aqis():
+    report = aqi_validation.validate_aqis(np.array([], dtype=np.float64))
+    assert report.count == 0
+    assert report.get_ratio(report.ok_count) == 0.0
+
+
+def test_gets_valid_aqis_or_nan():
+    valid_aqis = aqi_validation.get_valid_aqis_or_nan([0.96, 2.5, 5.04, 0.0, 0.5, 6.0, None])
+    np.testing.assert_array_equal(
+        valid_aqis, [1.0, 2.5, 5.0, np.nan, np.nan, np.nan, np.nan]
+    )
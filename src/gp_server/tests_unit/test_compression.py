@@ -0,0 +1,45 @@
+import gzip
+import pytest
+from werkzeug.datastructures import Accept
+from werkzeug.http import parse_accept_header
+import gp_server.app.compression as compression
+
+
+def parse_accept_encodings(header: str):
+    return parse_accept_header(header, Accept)
+
+
+def test_negotiates_accepted_encoding():
+    assert compression.get_accepted_encoding(parse_accept_encodings('gzip, deflate')) == 'gzip'
+    assert compression.get_accepted_encoding(parse_accept_encodings('deflate')) == 'identity'
+    assert compression.get_accepted_encoding(parse_accept_encodings('')) == 'identity'
+    accepted = compression.get_accepted_encoding(parse_accept_encodings('gzip, deflate, br'))
+    assert accepted == ('br' if compression.brotli else 'gzip')
+
+
+def test_compresses_static_payloads_with_all_encodings():
+    data = b'{"data":[' + b','.join(b'[%d,3]' % i for i in range(1000)) + b']}'
+    payloads = compression.get_compressed_payloads(data)
+    assert payloads['identity'] == data
+    assert gzip.decompress(payloads['gzip']) == data
+    assert len(payloads['gzip']) < len(data)
+    if compression.brotli:
+        assert compression.brotli.decompress(payloads['br']) == data
+
+
+@pytest.mark.parametrize('encoding', compression.get_supported_encodings())
+def test_compresses_dynamic_payloads_in_chunks(encoding):
+    data = b'{"path_FC":' + b','.join(b'[24.%d,60.%d]' % (i, i) for i in range(20000)) + b'}'
+    assert len(data) > compression.chunk_size
+    assert compression.should_compress(data, encoding)
+    chunks = list(compression.iter_compressed(data, encoding))
+    compressed = b''.join(chunks)
+    if encoding == 'gzip':
+        assert gzip.decompress(compressed) == data
+    else:
+        assert compression.brotli.decompress(compressed) == data
+
+
+def test_does_not_compress_small_payloads():
+    assert not compression.should_compress(b'{"error_key":"od_are_same_location"}', 'gzip')
+    assert not compression.should_compress(b'x' * 10000, 'identity')
@@ -0,0 +1,58 @@
+import pytest
+import igraph as ig
+import numpy as np
+import common.edge_array_file as edge_array_file
+
+
+@pytest.fixture
+def graph():
+    return ig.Graph([(0, 1), (1, 2), (2, 3), (3, 0)], directed=True)
+
+
+def test_writes_and_reads_edge_arrays(tmp_path, graph):
+    file_path = str(tmp_path / 'aqi_2020-10-25T14.bin')
+    aqis = np.array([1.5, np.nan, 2.63, 4.99])
+    fingerprint = edge_array_file.get_graph_fingerprint(graph)
+    edge_array_file.write_edge_array_file(
+        file_path, {'aqi': aqis}, graph_fingerprint=fingerprint, data_time=1603634400
+    )
+    edge_aqi = edge_array_file.read_edge_array_file(file_path, graph_fingerprint=fingerprint)
+    assert edge_aqi.graph_fingerprint == fingerprint
+    assert edge_aqi.data_time == 1603634400
+    assert edge_aqi.edge_count == 4
+    assert list(edge_aqi.arrays) == ['aqi']
+    assert isinstance(edge_aqi.arrays['aqi'], np.memmap)
+    read_aqis = np.round(edge_aqi.arrays['aqi'].astype(np.float64), 2)
+    assert np.array_equal(read_aqis, aqis, equal_nan=True)
+    assert not (tmp_path / 'aqi_2020-10-25T14.bin.tmp').exists()
+
+
+def test_writes_multiple_bands(tmp_path, graph):
+    file_path = str(tmp_path / 'edge_arrays.bin')
+    arrays = {'a': np.arange(4), 'b': np.arange(4) * 2}
+    edge_array_file.write_edge_array_file(file_path, arrays, graph_fingerprint='', data_time=0)
+    edge_arrays = edge_array_file.read_edge_array_file(file_path)
+    assert edge_arrays.arrays['a'].tolist() == [0, 1, 2, 3]
+    assert edge_arrays.arrays['b'].tolist() == [0, 2, 4, 6]
+
+
+def test_detects_edge_arrays_of_another_graph(tmp_path, graph):
+    file_path = str(tmp_path / 'aqi_2020-10-25T14.bin')
+    edge_array_file.write_edge_array_file(
+        file_path,
+        {'aqi': np.ones(4)},
+        graph_fingerprint=edge_array_file.get_graph_fingerprint(graph),
+        data_time=1603634400
+    )
+    graph.add_edges([(1, 3)])
+    with pytest.raises(edge_array_file.EdgeArrayFileError):
+        edge_array_file.read_edge_array_file(
+            file_path, graph_fingerprint=edge_array_file.get_graph_fingerprint(graph)
+        )
+
+
+def test_raises_error_for_invalid_edge_array_file(tmp_path):
+    file_path = tmp_path / 'aqi_2020-10-25T14.csv'
+    file_path.write_text('id_ig,aqi\n0,1.5\n')
+    with pytest.raises(edge_array_file.EdgeArrayFileError):
+        edge_array_file.read_edge_array_file(str(file_path))
@@ -0,0 +1,75 @@
+import time
+import threading
+import pytest
+import gp_server.app.file_watcher as file_watcher
+from gp_server.app.file_watcher import FileWatcher
+import common.aqi_update_manifest as aqi_manifest
+from common.aqi_update_manifest import AqiUpdateManifest
+
+
+@pytest.fixture
+def changes():
+    return threading.Semaphore(0)
+
+
+def wait_for_change(changes: threading.Semaphore, timeout: float = 5) -> bool:
+    return changes.acquire(timeout=timeout)
+
+
+def write_manifest(aqi_dir: str, aqi_update: str):
+    aqi_manifest.write_manifest(
+        aqi_dir, AqiUpdateManifest(aqi_update, 'aqi_map.json', 1603634400)
+    )
+
+
+def test_reads_written_aqi_update_manifest(tmp_path):
+    aqi_dir = f'{tmp_path}/'
+    assert aqi_manifest.read_manifest(aqi_dir) is None
+    write_manifest(aqi_dir, 'aqi_2020-10-25T14.bin')
+    assert aqi_manifest.read_manifest(aqi_dir) == AqiUpdateManifest(
+        'aqi_2020-10-25T14.bin', 'aqi_map.json', 1603634400
+    )
+    assert not (tmp_path / f'{aqi_manifest.manifest_file_name}.tmp').exists()
+
+
+@pytest.mark.parametrize('inotify', [True, False])
+def test_calls_on_change_when_manifest_is_replaced(log, tmp_path, changes, monkeypatch, inotify):
+    if not inotify:
+        monkeypatch.setattr(file_watcher, '_init_inotify', lambda dir: None)
+    aqi_dir = f'{tmp_path}/'
+    watcher = FileWatcher(
+        log, aqi_dir, aqi_manifest.manifest_file_name, changes.release, poll_interval=0.1
+    )
+    watcher.start()
+    try:
+        # on_change is called once at start
+        assert wait_for_change(changes)
+        time.sleep(0.2)
+        (tmp_path / 'aqi_2020-10-25T14.bin').write_bytes(b'')
+        assert not wait_for_change(changes, timeout=0.5)
+        write_manifest(aqi_dir, 'aqi_2020-10-25T14.bin')
+        assert wait_for_change(changes)
+        write_manifest(aqi_dir, 'aqi_2020-10-25T15.bin')
+        assert wait_for_change(changes)
+    finally:
+        watcher.stop()
+
+
+def test_calls_on_change_when_manifest_is_replaced_during_initial_call(log, tmp_path, changes):
+    aqi_dir = f'{tmp_path}/'
+    calls = []
+
+    def on_change():
+        calls.append(True)
+        if len(calls) == 1:
+            # e.g. the AQI updater publishes an update while the initial AQI update is read
+            write_manifest(aqi_dir, 'aqi_2020-10-25T14.bin')
+        changes.release()
+
+    watcher = FileWatcher(log, aqi_dir, aqi_manifest.manifest_file_name, on_change)
+    watcher.start()
+    try:
+        assert wait_for_change(changes)
+        assert wait_for_change(changes)
+    finally:
+        watcher.stop()
@@ -1,6 +1,10 @@
 from gp_server.app.graph_handler import GraphHandler
+from common.igraph import Edge as E, Node as N
 from gp_server.app.constants import TravelMode, RoutingMode
+from gp_server.app.types import OdSettings
 import gp_server.app.routing as routing
+import common.geometry as geom_utils
+import numpy as np
 import pytest
 
 
@@ -292,3 +296,197 @@ def test_path_props_when_routing_with_created_OD_on_same_street(
     assert round(sum(props['noise_pcts'].values()),1) == 100.0
     assert props['bike_time_cost'] == 82.8
     assert props['bike_safety_cost'] == 82.8
+
+
+def test_caches_path_edges_between_requests(graph_handler: GraphHandler):
+    edge_ids = [edge.index for edge in graph_handler.graph.es[:50] if edge[E.length.value] > 0]
+    path_edges = graph_handler.get_path_edges_by_ids(edge_ids)
+    graph_handler.reset_edge_cache()
+    cached_path_edges = graph_handler.get_path_edges_by_ids(edge_ids)
+    assert len(path_edges) == len(cached_path_edges)
+    assert all(cached is edge for cached, edge in zip(cached_path_edges, path_edges))
+
+
+def test_refreshes_aqi_of_cached_path_edges_after_aqi_update(graph_handler: GraphHandler):
+    edge_id = next(edge.index for edge in graph_handler.graph.es if edge[E.length.value] > 0)
+    path_edge = graph_handler.get_path_edges_by_ids([edge_id])[0]
+    original_aq_snapshot = graph_handler.get_aq_snapshot()
+    aqi = list(original_aq_snapshot.aqi)
+    aqi[edge_id] = 2.6
+    try:
+        graph_handler.publish_aq_snapshot('aqi_test.csv', aqi, original_aq_snapshot.aq_costs)
+        updated_path_edge = graph_handler.get_path_edges_by_ids([edge_id])[0]
+        assert updated_path_edge is not path_edge
+        assert updated_path_edge.aqi == 2.6
+        assert updated_path_edge.aqi_cl == 4
+        assert updated_path_edge.mdB == path_edge.mdB
+        assert updated_path_edge.gvi_cl == path_edge.gvi_cl
+    finally:
+        graph_handler.publish_aq_snapshot(
+            original_aq_snapshot.aqi_data_name,
+            original_aq_snapshot.aqi,
+            original_aq_snapshot.aq_costs
+        )
+
+
+def test_uses_pinned_aq_snapshot_until_reset(graph_handler: GraphHandler):
+    edge_id = next(edge.index for edge in graph_handler.graph.es if edge[E.length.value] > 0)
+    original_aq_snapshot = graph_handler.get_aq_snapshot()
+    aqi = list(original_aq_snapshot.aqi)
+    aqi[edge_id] = 2.6
+    aq_costs = {'c_aq_test': [1.0] * graph_handler.ecount}
+    try:
+        pinned_aq_snapshot = graph_handler.pin_aq_snapshot()
+        path_edge = graph_handler.get_path_edges_by_ids([edge_id])[0]
+        graph_handler.publish_aq_snapshot('aqi_test.csv', aqi, aq_costs)
+        # AQI and AQ costs of the request do not change during the request
+        assert graph_handler.get_aq_snapshot() is pinned_aq_snapshot
+        assert graph_handler.get_path_edges_by_ids([edge_id])[0] is path_edge
+        assert 'c_aq_test' not in graph_handler.get_edge_attrs_by_id(edge_id)
+        graph_handler.reset_edge_cache()
+        assert graph_handler.get_aq_snapshot().version == pinned_aq_snapshot.version + 1
+        assert graph_handler.get_path_edges_by_ids([edge_id])[0].aqi == 2.6
+        assert graph_handler.get_edge_attrs_by_id(edge_id)['c_aq_test'] == 1.0
+        assert original_aq_snapshot.aqi[edge_id] != 2.6
+    finally:
+        graph_handler.reset_edge_cache()
+        graph_handler.publish_aq_snapshot(
+            original_aq_snapshot.aqi_data_name,
+            original_aq_snapshot.aqi,
+            original_aq_snapshot.aq_costs
+        )
+
+
+def test_sets_aq_costs_by_departure_time(graph_handler: GraphHandler):
+    original_aq_snapshot = graph_handler.get_aq_snapshot()
+    aqi_coeff_hours = [np.full(graph_handler.ecount, 0.1), np.full(graph_handler.ecount, 0.5)]
+    edge_id = next(edge.index for edge in graph_handler.graph.es if edge[E.length.value] > 0)
+    length = graph_handler.graph.es[edge_id][E.length.value]
+    orig_point = graph_handler.graph.vs[graph_handler.graph.es[edge_id].source][N.geometry.value]
+    try:
+        graph_handler.publish_aq_snapshot(
+            'aqi_test.bin',
+            original_aq_snapshot.aqi,
+            original_aq_snapshot.aq_costs,
+            data_time=1603634400,
+            aqi_coeff_hours=aqi_coeff_hours
+        )
+        for depart_at, aqi_coeff in ((1603634400 - 7200, 0.1), (1603634400 + 7200, 0.5)):
+            assert graph_handler.set_departure_time_aq_costs(
+                depart_at, orig_point, 1.2, TravelMode.WALK, [5]
+            )
+            # weights of the request are used instead of AQ costs of the snapshot
+            assert graph_handler._GraphHandler__get_edge_weights('c_aq_5')[edge_id] == (
+                round(length + length * aqi_coeff * 5, 2)
+            )
+            graph_handler.reset_edge_cache()
+        graph_handler.publish_aq_snapshot(
+            'aqi_test.csv', original_aq_snapshot.aqi, original_aq_snapshot.aq_costs
+        )
+        # no forecast hours in the AQ snapshot
+        assert not graph_handler.set_departure_time_aq_costs(
+            1603634400, orig_point, 1.2, TravelMode.WALK, [5]
+        )
+        assert graph_handler._GraphHandler__get_edge_weights('c_aq_5') == (
+            original_aq_snapshot.aq_costs.get('c_aq_5', 'c_aq_5')
+        )
+    finally:
+        graph_handler.reset_edge_cache()
+        graph_handler.publish_aq_snapshot(
+            original_aq_snapshot.aqi_data_name,
+            original_aq_snapshot.aqi,
+            original_aq_snapshot.aq_costs,
+            data_time=original_aq_snapshot.data_time,
+            aqi_coeff_hours=original_aq_snapshot.aqi_coeff_hours
+        )
+
+
+def test_sets_aq_costs_of_linking_edges_by_departure_time(
+    log,
+    graph_handler: GraphHandler,
+    routing_conf
+):
+    original_aq_snapshot = graph_handler.get_aq_snapshot()
+    # AQ cost coefficients of the second hour differ between the edges
+    aqi_coeff_hours = [
+        np.full(graph_handler.ecount, 0.1),
+        (np.arange(graph_handler.ecount) % 10) / 10
+    ]
+    # the same (created) OD as in test_finds_routes_between_created_OD
+    orig_point, dest_point = (
+        geom_utils.project_geom(geom_utils.get_point_from_lat_lon(lat_lon)) for lat_lon in (
+            {'lat': 60.21352729760156, 'lon': 24.97086446863051},
+            {'lat': 60.21128945130093, 'lon': 24.968455167858025}
+        )
+    )
+    # arrival times to all edges are after the second hour
+    od_settings = OdSettings(
+        orig_point, dest_point, TravelMode.WALK, RoutingMode.CLEAN, [5], 1603634400 + 7200
+    )
+    od_nodes = None
+    try:
+        graph_handler.publish_aq_snapshot(
+            'aqi_test.bin',
+            original_aq_snapshot.aqi,
+            original_aq_snapshot.aq_costs,
+            data_time=1603634400,
+            aqi_coeff_hours=aqi_coeff_hours
+        )
+        od_nodes = routing.find_or_create_od_nodes(log, graph_handler, od_settings)
+        assert od_nodes.orig_link_edges and od_nodes.dest_link_edges
+        path_set = routing.find_least_cost_paths(
+            log, graph_handler, routing_conf, od_settings, od_nodes
+        )
+        assert len(path_set.paths) >= 1
+
+        weights = graph_handler._GraphHandler__get_edge_weights('c_aq_5')
+        assert len(weights) == graph_handler.graph.ecount()
+        link_edge_id = graph_handler.ecount
+        for od_node, link_edges in (
+            (od_nodes.orig_node, od_nodes.orig_link_edges),
+            (od_nodes.dest_node, od_nodes.dest_link_edges)
+        ):
+            # the costs of the edges on which the links were created by their own lengths
+            aqi_coeff = aqi_coeff_hours[1][od_node.link_to_edge_spec.edge[E.id_ig.value]]
+            for _ in link_edges:
+                length = graph_handler.graph.es[link_edge_id][E.length.value]
+                assert weights[link_edge_id] == round(length + length * aqi_coeff * 5, 2)
+                link_edge_id += 1
+    finally:
+        if od_nodes:
+            routing.delete_added_graph_features(graph_handler, od_nodes)
+        graph_handler.reset_edge_cache()
+        graph_handler.publish_aq_snapshot(
+            original_aq_snapshot.aqi_data_name,
+            original_aq_snapshot.aqi,
+            original_aq_snapshot.aq_costs,
+            data_time=original_aq_snapshot.data_time,
+            aqi_coeff_hours=original_aq_snapshot.aqi_coeff_hours
+        )
+
+
+def test_does_not_cache_linking_edges_between_requests(
+    log,
+    graph_handler: GraphHandler,
+    routing_conf
+):
+    link_edge_coords = []
+    for orig, dest in (
+        (('60.21352729760156', '24.97086446863051'), ('60.21128945130093', '24.968455167858025')),
+        (('60.214233', '24.971411'), ('60.213558', '24.970785'))
+    ):
+        od_settings = routing.parse_od_settings(
+            TravelMode.WALK,
+            RoutingMode.GREEN,
+            routing_conf,
+            *orig,
+            *dest,
+            aqi_updater = None
+        )
+        od_nodes = routing.find_or_create_od_nodes(log, graph_handler, od_settings)
+        link_edge_id = graph_handler.ecount
+        link_edge_coords.append(graph_handler.get_path_edges_by_ids([link_edge_id])[0].coords_wgs)
+        routing.delete_added_graph_features(graph_handler, od_nodes)
+        graph_handler.reset_edge_cache()
+
+    assert list(link_edge_coords[0]) != list(link_edge_coords[1])
@@ -35,9 +35,7 @@ def test_updates_aqi_values_to_graph(aqi_updater, graph_handler):
     aqi_updater._GraphAqiUpdater__read_update_aqi_to_graph(aqi_edge_updates_csv)
     
     # check the updated graph (edge attributes)
-    aqi_updates = []
-    for e in graph_handler.graph.es:
-        aqi_updates.append(e.attributes()[E.aqi.value])
+    aqi_updates = graph_handler.get_aq_snapshot().aqi
     
     assert len(aqi_updates) == 16643
     aqi_updates_ok = [aqi for aqi in aqi_updates if aqi]
@@ -0,0 +1,67 @@
+import json
+import common.geometry as geom_utils
+import gp_server.app.json_encoding as json_enc
+
+
+def test_encodes_rounded_coords_fragment():
+    coords = [(24.967161234, 60.207721234), (24.9653, 60.2037)]
+    fragment = json_enc.get_coords_json_fragment(coords)
+    assert fragment == b'[24.967161,60.207721],[24.9653,60.2037]'
+
+
+def test_composes_feature_from_coords_fragments():
+    fragments = [
+        json_enc.get_coords_json_fragment([(24.1, 60.1), (24.2, 60.2)]),
+        json_enc.get_coords_json_fragment([(24.2, 60.2), (24.3, 60.3)])
+    ]
+    geometry = json_enc.get_line_geometry_json(fragments)
+    feature = json.loads(json_enc.get_feature_json(geometry, {'id': 'fast', 'aqc': {1: 2.5}}))
+    assert feature == {
+        'type': 'Feature',
+        'properties': {'id': 'fast', 'aqc': {'1': 2.5}},
+        'geometry': {
+            'coordinates': [[24.1, 60.1], [24.2, 60.2], [24.2, 60.2], [24.3, 60.3]],
+            'type': 'LineString'
+        }
+    }
+
+
+def test_composes_feature_collection():
+    geometry = json_enc.get_line_geometry_json([b'[24.1,60.1],[24.2,60.2]'])
+    features = [json_enc.get_feature_json(geometry, {'id': i}) for i in range(2)]
+    fc = json.loads(json_enc.get_feature_collection_json(features))
+    assert fc['type'] == 'FeatureCollection'
+    assert [feat['properties']['id'] for feat in fc['features']] == [0, 1]
+    assert json.loads(json_enc.get_feature_collection_json([])) == {
+        'type': 'FeatureCollection', 'features': []
+    }
+
+
+def test_encodes_polyline():
+    # the example of the encoded polyline algorithm (precision 5)
+    coords = [(-120.2, 38.5), (-120.95, 40.7), (-126.453, 43.252)]
+    assert geom_utils.encode_polyline(coords, precision=5) == '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+    assert geom_utils.decode_polyline('_p~iF~ps|U_ulLnnqC_mqNvxq`@', precision=5) == coords
+    assert geom_utils.encode_polyline([]) == ''
+
+
+def test_encodes_multiple_polylines_at_once():
+    lines = [[(24.1, 60.1), (24.2, 60.2)], [], [(24.2, 60.2)], [(-24.3, -60.3), (24.123456, 60.9)]]
+    polylines = geom_utils.encode_polylines(lines)
+    assert polylines == [geom_utils.encode_polyline(line) for line in lines]
+    assert [geom_utils.decode_polyline(polyline) for polyline in polylines] == lines
+
+
+def test_encodes_polyline_geometries_from_decoded_coords_fragments():
+    coords = [(24.967161234, 60.207721234), (24.9653, 60.2037), (24.9653005, 60.2037)]
+    fragments = [json_enc.get_coords_json_fragment(coords[:2]), json_enc.get_coords_json_fragment(coords[1:])]
+    geometries = json_enc.get_polyline_geometries_json([
+        json_enc.get_coords_from_fragments(fragments),
+        json_enc.get_coords_from_fragments(fragments[1:])
+    ])
+    geometry = json.loads(geometries[0])
+    assert geometry['type'] == 'EncodedPolyline'
+    assert geometry['precision'] == 6
+    rounded_coords = geom_utils.round_coordinates(coords)
+    assert geom_utils.decode_polyline(geometry['polyline']) == [*rounded_coords[:2], *rounded_coords[1:]]
+    assert geom_utils.decode_polyline(json.loads(geometries[1])['polyline']) == rounded_coords[1:]
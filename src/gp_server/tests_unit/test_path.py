@@ -0,0 +1,51 @@
+from typing import List, Tuple, Union
+import gp_server.app.json_encoding as json_enc
+from gp_server.app.path import Path
+from gp_server.app.constants import PathType
+from gp_server.app.types import PathEdge
+
+
+def create_path_edge(
+    gvi_cl: Union[int, None],
+    coords_wgs: List[Tuple[float, float]]
+) -> PathEdge:
+    return PathEdge(
+        id=None, length=10.0, bike_time_cost=10.0, bike_safety_cost=10.0, allows_biking=True,
+        aqi=None, aqi_cl=None, noises={}, mdB=0, db_range=40, gvi=None, gvi_cl=gvi_cl,
+        coords=coords_wgs, coords_wgs=coords_wgs,
+        coords_wgs_json=json_enc.get_coords_json_fragment(coords_wgs)
+    )
+
+
+def create_path(gvi_classes: List[Union[int, None]]) -> Path:
+    path = Path('fast', PathType.FASTEST, list(range(len(gvi_classes))))
+    path.edges = [
+        create_path_edge(gvi_cl, [(24.9 + idx / 1000, 60.2), (24.9 + (idx + 1) / 1000, 60.2)])
+        for idx, gvi_cl in enumerate(gvi_classes)
+    ]
+    return path
+
+
+def test_groups_adjacent_edges_by_class():
+    path = create_path([3, 3, 5, None, None, 3, 4, 4])
+    path.aggregate_edge_groups_by_attr('gvi_cl')
+    assert path.edge_groups == [(3, 0, 2), (5, 2, 3), (None, 3, 5), (3, 5, 6), (4, 6, 8)]
+    assert all(isinstance(group[0], int) for group in path.edge_groups if group[0] is not None)
+
+    path.aggregate_edge_groups_by_attr('db_range')
+    assert path.edge_groups == [(40, 0, 8)]
+
+    empty_path = create_path([])
+    empty_path.aggregate_edge_groups_by_attr('gvi_cl')
+    assert empty_path.edge_groups == []
+
+
+def test_slices_edge_group_coordinates():
+    path = create_path([3, 3, 5])
+    path.aggregate_edge_groups_by_attr('gvi_cl')
+    features = path.get_edge_groups_as_features()
+    assert [feat['properties']['value'] for feat in features] == [3, 5]
+    assert features[0]['geometry']['coordinates'] == [
+        [24.9, 60.2], [24.901, 60.2], [24.901, 60.2], [24.902, 60.2]
+    ]
+    assert features[1]['geometry']['coordinates'] == [[24.902, 60.2], [24.903, 60.2]]
@@ -1,15 +1,18 @@
 import logging
 import traceback
+from datetime import datetime, timezone
 from typing import Tuple, Union, Any
 from flask import Flask
 from flask_cors import CORS
-from flask import jsonify
+from flask import jsonify, request
 from gp_server.conf import conf
 import gp_server.app.routing as routing
+import gp_server.app.compression as compression
 from gp_server.app.aqi_map_data_api import get_aqi_map_data_api
 from gp_server.app.graph_handler import GraphHandler
 from gp_server.app.graph_aqi_updater import GraphAqiUpdater
-from gp_server.app.constants import RoutingException, ErrorKey, status_code_by_error
+from gp_server.app.constants import (
+    RoutingException, ErrorKey, ResponseFormat, status_code_by_error)
 from gp_server.app.logger import Logger
 import common.geometry as geom_utils
 
@@ -61,7 +64,30 @@ def aqi_map_data_status():
 
 @app.route('/aqi-map-data')
 def aqi_map_data():
-    return aqi_map_data_api.get_data()
+    """Returns the latest AQI map data, or only the changes since the previous AQI update if its
+    version is given as query parameter since. The response has ETag and Last-Modified headers
+    by the version of the data, so that cached data can be revalidated (304 Not Modified).
+    """
+    encoding = compression.get_accepted_encoding(request.accept_encodings)
+    # data & version are read from the same AQI update (even if the data gets updated meanwhile)
+    data, version, utc_time_secs = aqi_map_data_api.get_data(encoding, request.args.get('since'))
+    response = app.response_class(
+        data,
+        status=200,
+        mimetype='application/json'
+    )
+    if encoding != compression.IDENTITY:
+        response.content_encoding = encoding
+    response.vary.add('Accept-Encoding')
+
+    if not version:
+        return response
+    # weak ETag, as the same version is sent with different content encodings
+    response.set_etag(version, weak=True)
+    if utc_time_secs:
+        response.last_modified = datetime.fromtimestamp(utc_time_secs, timezone.utc)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 
 @app.route('/edge-attrs-near-point/<lat>,<lon>')
@@ -77,6 +103,7 @@ def edge_attrs_near_point(lat, lon):
 def paths(travel_mode, routing_mode, orig_lat, orig_lon, dest_lat, dest_lon):
 
     try:
+        fields = routing.parse_response_fields(request.args.get('include'))
         od_settings = routing.parse_od_settings(
             travel_mode,
             routing_mode,
@@ -85,7 +112,8 @@ def paths(travel_mode, routing_mode, orig_lat, orig_lon, dest_lat, dest_lon):
             orig_lon,
             dest_lat,
             dest_lon,
-            aqi_updater
+            aqi_updater,
+            request.args.get('depart_at')
         )
     except RoutingException as e:
         log.error(traceback.format_exc())
@@ -93,10 +121,17 @@ def paths(travel_mode, routing_mode, orig_lat, orig_lon, dest_lat, dest_lon):
 
     od_nodes = None
     try:
+        # use the same AQI & AQ costs during the whole request even if AQI gets updated meanwhile
+        G.pin_aq_snapshot()
         od_nodes = routing.find_or_create_od_nodes(log, G, od_settings)
         path_set = routing.find_least_cost_paths(log, G, routing_conf, od_settings, od_nodes)
-        path_FC, edge_FC = routing.process_paths_to_FC(log, G, routing_conf, od_settings, path_set)
-        return jsonify({'path_FC': path_FC, 'edge_FC': edge_FC}), 200
+        response_format = get_response_format()
+        paths_json = routing.process_paths_to_json(
+            log, G, routing_conf, od_settings, path_set, response_format, fields
+        )
+        response = create_compressed_response(paths_json, response_format.value)
+        response.vary.add('Accept')
+        return response
 
     except RoutingException as e:
         log.error(traceback.format_exc())
@@ -112,6 +147,33 @@ def paths(travel_mode, routing_mode, orig_lat, orig_lon, dest_lat, dest_lon):
         G.reset_edge_cache()
 
 
+def get_response_format() -> ResponseFormat:
+    """Negotiates the format of the path response from the Accept header of the request. Paths
+    are returned as GeoJSON unless encoded polylines are explicitly preferred.
+    """
+    mimetype = request.accept_mimetypes.best_match(
+        [response_format.value for response_format in ResponseFormat],
+        default=ResponseFormat.GEOJSON.value
+    )
+    return ResponseFormat(mimetype)
+
+
+def create_compressed_response(data: bytes, mimetype: str):
+    """Creates a response that is compressed (while sending it) if the client accepts
+    compressed responses and if the data is large enough to benefit from compression.
+    """
+    encoding = compression.get_accepted_encoding(request.accept_encodings)
+    if compression.should_compress(data, encoding):
+        response = app.response_class(
+            compression.iter_compressed(data, encoding), status=200, mimetype=mimetype
+        )
+        response.content_encoding = encoding
+    else:
+        response = app.response_class(data, status=200, mimetype=mimetype)
+    response.vary.add('Accept-Encoding')
+    return response
+
+
 def create_error_response(error: Union[ErrorKey, str]) -> Tuple[Any, int]:
     error_msg = error.value if isinstance(error, ErrorKey) else error
     code = status_code_by_error.get(error_msg, 500)
@@ -2,6 +2,7 @@ from graph_build.graph_export.conf import GraphExportConf
 import logging
 import geopandas as gpd
 import common.igraph as ig_utils
+import common.sampling_manifest as sampling_manifest
 import graph_build.graph_export.utils as utils
 import numpy as np
 from common.igraph import Edge as E, Node as N
@@ -72,6 +73,12 @@ def graph_export(
     # set combined GVI to GVI attribute & export graph
     graph.es[E.gvi.value] = list(graph.es[E.gvi_comb_gsv_veg.value])
     ig_utils.export_to_graphml(graph, out_graph, n_attrs=out_node_attrs, e_attrs=out_edge_attrs)
+    # export the edges to sample AQI to for the AQI updater (so that it does not need the graph)
+    out_sampling_manifest = sampling_manifest.get_sampling_manifest_file_path(out_graph)
+    sampling_manifest.write_sampling_manifest(
+        out_sampling_manifest, sampling_manifest.get_sampling_manifest(graph)
+    )
+    log.info(f'Exported sampling manifest: {out_sampling_manifest}')
 
     # create GeoJSON files for vector tiles
     geojson = utils.create_geojson(graph)
@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from typing import Union
 
 
 @dataclass(frozen=True)
@@ -12,6 +13,8 @@ class OtpGraphImportConf:
     b_export_final_graph_to_gpkg: bool
     debug_otp_graph_gpkg: str
     debug_igraph_gpkg: str
+    # the number of rows of the CSV files to read at a time (or None for reading them at once)
+    csv_chunk_size: Union[int, None] = None
 
 
 conf = OtpGraphImportConf(
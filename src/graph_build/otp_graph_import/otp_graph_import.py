@@ -1,13 +1,13 @@
 import logging
 from conf import gp_conf
-from typing import Union
+from typing import Iterator, List, Tuple, Union
 from graph_build.otp_graph_import.conf import OtpGraphImportConf
 from shapely.geometry import Point, LineString
 import numpy as np
 import pandas as pd
 import geopandas as gpd
 import igraph as ig
-import shapely.wkt
+import shapely
 from pyproj import CRS
 from common.igraph import Node, Edge
 import common.igraph as ig_utils
@@ -17,6 +17,151 @@ import common.geometry as geom_utils
 log = logging.getLogger('otp_graph_import')
 
 
+def __from_wkt(wkts: pd.Series, empty_geom) -> np.ndarray:
+    """Parses an array of WKT strings to geometries at once. Missing values (non-strings) are
+    parsed to empty_geom.
+    """
+    is_wkt = np.array([isinstance(wkt, str) for wkt in wkts], dtype=bool)
+    geoms = shapely.from_wkt(np.where(is_wkt, wkts.to_numpy(dtype=object), None))
+    geoms[~is_wkt] = empty_geom
+    return geoms
+
+
+def __is_linestring(geoms: np.ndarray) -> np.ndarray:
+    """Returns a mask of the geometries that are LineStrings (as with isinstance, also LinearRings).
+    """
+    return np.isin(
+        shapely.get_type_id(geoms),
+        (shapely.GeometryType.LINESTRING, shapely.GeometryType.LINEARRING)
+    )
+
+
+def __get_ig_ids(ids_otp: pd.Series, node_ids_otp: pd.Series) -> np.ndarray:
+    """Returns igraph ids (i.e. positions in node_ids_otp) of nodes by OTP ids. Raises ValueError
+    for unknown OTP ids.
+    """
+    # like a dict of OTP ids, the last one of any duplicate ids is used
+    ids_otp_ig = pd.Series(np.arange(len(node_ids_otp)), index=node_ids_otp.to_numpy())
+    ids_otp_ig = ids_otp_ig[~ids_otp_ig.index.duplicated(keep='last')]
+    ids_ig = ids_otp_ig.reindex(ids_otp.to_numpy(), fill_value=-1).to_numpy()
+    if (ids_ig == -1).any():
+        raise ValueError(f'unknown node ids: {ids_otp[ids_ig == -1].unique()[:10].tolist()}')
+    return ids_ig
+
+
+def __read_csv_chunks(csv_file: str, chunk_size: Union[int, None]) -> Iterator[pd.DataFrame]:
+    """Reads a CSV file of OTP graph data in chunks of chunk_size rows, or at once if chunk_size
+    is not given.
+    """
+    if chunk_size:
+        yield from pd.read_csv(csv_file, sep=';', chunksize=chunk_size)
+    else:
+        yield pd.read_csv(csv_file, sep=';')
+
+
+def __to_projected_gdf(df: pd.DataFrame, empty_geom) -> gpd.GeoDataFrame:
+    """Parses the WKT geometries of OTP graph data to (WGS) geom_wgs and projected geometry.
+    """
+    df[Edge.geometry.name] = __from_wkt(df[Edge.geometry.name], empty_geom)
+    df[Edge.geom_wgs.name] = df[Edge.geometry.name]
+    gdf = gpd.GeoDataFrame(df, geometry=Edge.geometry.name, crs=CRS.from_epsg(4326))
+    return gdf.to_crs(epsg=gp_conf.proj_crs_epsg)
+
+
+def __export_otp_data_to_gpkg(gdf: gpd.GeoDataFrame, gpkg: str, layer: str, append: bool) -> None:
+    gdf.drop(columns=[Edge.geom_wgs.name]).to_file(
+        gpkg, layer=layer, driver='GPKG', mode='a' if append else 'w'
+    )
+
+
+def __select_graph_columns(df: pd.DataFrame, attrs, other_columns: List[str] = []) -> pd.DataFrame:
+    """Returns the columns of node or edge attributes (and other_columns) of the data, so that
+    the other columns of the CSV data are not kept in memory for the graph build.
+    """
+    columns = {attr.name for attr in attrs}.union(other_columns)
+    return df.drop(columns=[column for column in df.columns if column not in columns])
+
+
+# queries for filtering out edges that are unsuitable for both walking and cycling
+edge_filter_queries = [
+    f'{Edge.allows_walking.name} == True or {Edge.allows_biking.name} == True',
+    f'{Edge.is_no_thru_traffic.name} == False'
+]
+
+
+def __filter_edges(e: pd.DataFrame) -> Tuple[pd.DataFrame, List[int]]:
+    """Returns the edges that pass edge_filter_queries and the numbers of the edges filtered out
+    by each query.
+    """
+    filtered_counts = []
+    for query in edge_filter_queries:
+        count_before = len(e.index)
+        e = e.query(query)
+        filtered_counts.append(count_before - len(e.index))
+    return e.copy(), filtered_counts
+
+
+def __concat(dfs: List[pd.DataFrame]) -> pd.DataFrame:
+    return dfs[0] if len(dfs) == 1 else pd.concat(dfs, ignore_index=True)
+
+
+def __get_small_subgraph_edge_ids(G: ig.Graph, max_edge_count: int) -> np.ndarray:
+    """Returns ids of the edges of the subgraphs (strongly connected components) of the graph that
+    have at most max_edge_count edges (as in the subgraphs from G.decompose(mode='STRONG')). Also
+    logs the numbers of the subgraphs by size.
+    """
+    membership = np.array(G.connected_components(mode='STRONG').membership, dtype=np.int64)
+    edges = np.array(G.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+    source_comps, target_comps = membership[edges[:, 0]], membership[edges[:, 1]]
+    # a subgraph of a component has the edges between its nodes
+    in_comp = source_comps == target_comps
+    graph_sizes = np.bincount(
+        source_comps[in_comp], minlength=membership.max() + 1 if len(membership) else 0
+    )
+    log.info(f'found {len(graph_sizes)} subgraphs')
+    for size in (10, 50, 100, 500, 10000):
+        log.info(f'subgraphs with more than {size} edges: {np.count_nonzero(graph_sizes > size)}')
+    return np.flatnonzero(in_comp & (graph_sizes[source_comps] <= max_edge_count))
+
+
+def __export_subgraphs_to_gpkg(G: ig.Graph, debug_igraph_gpkg: str) -> None:
+    """Exports the edges of small (<= 15 edges), medium (15-500 edges) and big (> 500 edges)
+    subgraphs (strongly connected components) of the graph to gpkg for debugging.
+    """
+    sub_graphs = G.decompose(mode='STRONG')
+    layer_graphs = {
+        'small_graph_edges': [graph for graph in sub_graphs if graph.ecount() <= 15],
+        'medium_graph_edges': [graph for graph in sub_graphs if (graph.ecount() > 15 and graph.ecount() <= 500)],
+        'big_graph_edges': [graph for graph in sub_graphs if graph.ecount() > 500]
+    }
+    log.info('exporting subgraphs to gpkg')
+    for layer, graphs in layer_graphs.items():
+        graph_edges = []
+        for graph_id, graph in enumerate(graphs):
+            edges = ig_utils.get_edge_dicts(graph, attrs=[Edge.id_otp, Edge.id_ig, Edge.geometry])
+            for edge in edges:
+                edge['graph_id'] = graph_id
+            graph_edges.extend(edges)
+        graph_edges_gdf = gpd.GeoDataFrame(graph_edges, crs=CRS.from_epsg(gp_conf.proj_crs_epsg))
+        graph_edges_gdf.to_file(debug_igraph_gpkg, layer=layer, driver='GPKG')
+    log.info('graphs exported')
+
+
+def __log_id_mismatches(G: ig.Graph, msg_suffix: str = '') -> None:
+    """Logs the number of edges of which id_ig does not match the index of the edge in the graph.
+    """
+    mismatch_count = np.count_nonzero(np.array(G.es[Edge.id_ig.value]) != np.arange(G.ecount()))
+    log.info(f'invalid edge ids: {mismatch_count}{msg_suffix}')
+
+
+def __reset_ig_ids(G: ig.Graph) -> None:
+    """Reassigns igraph indexes to edge and node attributes (id_ig)."""
+    __log_id_mismatches(G)
+    G.es[Edge.id_ig.value] = list(range(G.ecount()))
+    G.vs[Node.id_ig.value] = list(range(G.vcount()))
+    __log_id_mismatches(G, ' (after re-indexing)')
+
+
 def convert_otp_graph_to_igraph(
     node_csv_file: str,
     edge_csv_file: str,
@@ -27,69 +172,65 @@ def convert_otp_graph_to_igraph(
     b_export_final_graph_to_gpkg: bool = False,
     debug_otp_graph_gpkg: str = 'debug/otp_graph_features.gpkg',
     debug_igraph_gpkg: str = 'debug/otp2igraph_features.gpkg',
+    csv_chunk_size: Union[int, None] = None
 ) -> ig.Graph:
+    """Creates an igraph graph from OTP graph data (nodes & edges CSV). If csv_chunk_size is given,
+    the CSV files are read, parsed and reprojected in chunks of csv_chunk_size rows and only the
+    columns (and edges) needed for the graph are kept from each chunk, so that the peak memory of
+    reading the CSV data depends on the chunk size rather than on the size of the data.
+    """
 
     hma_poly = geom_utils.project_geom(gpd.read_file(hma_poly_file)['geometry'][0])
 
-    # 1) read nodes nodes from CSV
-    n = pd.read_csv(node_csv_file, sep=';')
+    # 1) read nodes from CSV (and export them to gpkg)
+    log.info('reading nodes to gdf')
+    n_chunks = []
+    for chunk_idx, n_chunk in enumerate(__read_csv_chunks(node_csv_file, csv_chunk_size)):
+        log.debug(f'node column types: {n_chunk.dtypes}')
+        log.debug(f'nodes head: {n_chunk.head()}')
+        n_chunk = __to_projected_gdf(n_chunk, Point())
+        if b_export_otp_data_to_gpkg:
+            __export_otp_data_to_gpkg(n_chunk, debug_otp_graph_gpkg, 'nodes', chunk_idx > 0)
+        n_chunks.append(__select_graph_columns(n_chunk, Node))
+    n = __concat(n_chunks)
+    del n_chunks
     log.info(f'read {len(n.index)} nodes')
-    log.debug(f'node column types: {n.dtypes}')
-    log.debug(f'nodes head: {n.head()}')
-    log.info('creating node gdf')
-    n[Node.geometry.name] = [
-        shapely.wkt.loads(geom) if isinstance(geom, str) else Point() for geom in n[Node.geometry.name]
-    ]
-    n[Node.geom_wgs.name] = n[Node.geometry.name]
-    n = gpd.GeoDataFrame(n, geometry=Node.geometry.name, crs=CRS.from_epsg(4326))
-    log.info('reprojecting nodes to etrs')
-    n = n.to_crs(epsg=gp_conf.proj_crs_epsg)
-    log.debug(f'nodes head: {n.head()}')
-
-    # 2) read edges from CSV
-    e = pd.read_csv(edge_csv_file, sep=';')
-    log.info(f'read {len(e.index)} edges')
-    log.debug(f'edge column types: {e.dtypes}')
-    log.debug(f'edges head: {e.head()}')
-    log.info('creating edge gdf')
-    e[Edge.geometry.name] = [
-        shapely.wkt.loads(geom) if isinstance(geom, str) else LineString() for geom in e[Edge.geometry.name]
-    ]
-    e[Edge.geom_wgs.name] = e[Edge.geometry.name]
-    e = gpd.GeoDataFrame(e, geometry=Edge.geometry.name, crs=CRS.from_epsg(4326))
-    log.info('reprojecting edges to etrs')
-    e = e.to_crs(epsg=gp_conf.proj_crs_epsg)
-    log.debug(f'edges head: {e.head()}')
-
-    # 3) export graph data to gpkg
     if b_export_otp_data_to_gpkg:
-        log.info('writing otp graph data to gpkg')
-        e.drop(columns=[Edge.geom_wgs.name]).to_file(debug_otp_graph_gpkg, layer='edges', driver='GPKG')
-        log.info(f'exported edges to {debug_otp_graph_gpkg} (layer=edges)')
-        n.drop(columns=[Edge.geom_wgs.name]).to_file(debug_otp_graph_gpkg, layer='nodes', driver='GPKG')
         log.info(f'exported nodes to {debug_otp_graph_gpkg} (layer=nodes)')
 
-    # 4) filter out edges that are unsuitable for both walking and cycling
-    def filter_df_by_query(df: pd.DataFrame, query: str, name: str = 'rows'):
-        count_before = len(df.index)
-        df_filt = df.query(query).copy()
-        filt_ratio = (count_before-len(df_filt.index)) / count_before
-        log.info(f'filtered out {count_before-len(df_filt.index)} {name} ({round(filt_ratio * 100, 1)} %) by {query}')
-        return df_filt
+    # 2) read edges from CSV (and export them to gpkg) and filter out edges that are unsuitable for
+    # both walking and cycling
+    log.info('reading edges to gdf')
+    e_count = 0
+    filtered_counts = np.zeros(len(edge_filter_queries), dtype=np.int64)
+    e_chunks = []
+    for chunk_idx, e_chunk in enumerate(__read_csv_chunks(edge_csv_file, csv_chunk_size)):
+        log.debug(f'edge column types: {e_chunk.dtypes}')
+        log.debug(f'edges head: {e_chunk.head()}')
+        e_count += len(e_chunk.index)
+        e_chunk = __to_projected_gdf(e_chunk, LineString())
+        if b_export_otp_data_to_gpkg:
+            __export_otp_data_to_gpkg(e_chunk, debug_otp_graph_gpkg, 'edges', chunk_idx > 0)
+        e_chunk = __select_graph_columns(e_chunk, Edge, ['node_orig_id', 'node_dest_id'])
+        e_chunk, chunk_filtered_counts = __filter_edges(e_chunk)
+        filtered_counts += chunk_filtered_counts
+        e_chunks.append(e_chunk)
+    e_filt = __concat(e_chunks)
+    del e_chunks
+    log.info(f'read {e_count} edges')
+    if b_export_otp_data_to_gpkg:
+        log.info(f'exported edges to {debug_otp_graph_gpkg} (layer=edges)')
 
-    e_filt = filter_df_by_query(e, f'{Edge.allows_walking.name} == True or {Edge.allows_biking.name} == True', name='edges')
-    e_filt = filter_df_by_query(e_filt, f'{Edge.is_no_thru_traffic.name} == False', name='edges')
+    count_before = e_count
+    for query, filtered_count in zip(edge_filter_queries, filtered_counts.tolist()):
+        filt_ratio = filtered_count / count_before if count_before else 0.0
+        log.info(f'filtered out {filtered_count} edges ({round(filt_ratio * 100, 1)} %) by {query}')
+        count_before -= filtered_count
 
-    # 5) create a dictionaries for converting otp ids to ig ids and vice versa
-    log.debug('create maps for converting otp ids to ig ids')
+    # 3) set ig ids to nodes (by position) for converting otp ids to ig ids
     n[Node.id_ig.name] = np.arange(len(n.index))
-    ids_otp_ig = {}
-    ids_ig_otp = {}
-    for node in n.itertuples():
-        ids_otp_ig[getattr(node, Node.id_otp.name)] = getattr(node, Node.id_ig.name)
-        ids_ig_otp[getattr(node, Node.id_ig.name)] = getattr(node, Node.id_otp.name)
 
-    # 6) add nodes to graph
+    # 4) add nodes to graph
     log.info('adding nodes to graph')
     G = ig.Graph(directed=True)
     G.add_vertices(len(n.index))
@@ -99,120 +240,59 @@ def convert_otp_graph_to_igraph(
         else:
             log.warning(f'node column {attr.name} not present in dataframe')
 
-    # 7) add edges to graph
+    # 5) add edges to graph
     log.info('adding edges to graph')
 
     # get edge lengths by projected geometry
-    e_filt[Edge.length.name] = [
-        round(geom.length, 4) if isinstance(geom, LineString) else 0.0 for geom in e_filt[Edge.geometry.name]
-    ]
-
-    def get_ig_uv(edge):
-        return (ids_otp_ig[edge['node_orig_id']], ids_otp_ig[edge['node_dest_id']])
+    e_geoms = e_filt[Edge.geometry.name].to_numpy()
+    e_filt[Edge.length.name] = np.where(
+        __is_linestring(e_geoms), np.round(shapely.length(e_geoms), 4), 0.0
+    )
 
-    e_filt['uv_ig'] = e_filt.apply(lambda row: get_ig_uv(row), axis=1)
+    uv_ig = np.column_stack((
+        __get_ig_ids(e_filt['node_orig_id'], n[Node.id_otp.name]),
+        __get_ig_ids(e_filt['node_dest_id'], n[Node.id_otp.name])
+    ))
     e_filt[Edge.id_ig.name] = np.arange(len(e_filt.index))
-    G.add_edges(list(e_filt['uv_ig']))
+    G.add_edges(uv_ig.tolist())
     for attr in Edge:
         if attr.name in e_filt.columns:
             G.es[attr.value] = list(e_filt[attr.name])
         else:
             log.warning(f'edge column {attr.name} not present in dataframe')
 
-    # 8) delete edges outside Helsinki Metropolitan Area (HMA)
+    # 6) delete edges outside Helsinki Metropolitan Area (HMA)
     hma_buffered = hma_poly.buffer(100)
 
-    def intersects_hma(geom: Union[LineString, None]):
-        if not geom or geom.is_empty:
-            return True
-        return geom.intersects(hma_buffered)
-
-    e_gdf = ig_utils.get_edge_gdf(G)
     log.info('finding edges that intersect with HMA')
-    e_gdf['in_hma'] = [intersects_hma(line) for line in e_gdf[Edge.geometry.name]]
-    e_gdf_del = e_gdf.query('in_hma == False').copy()
-    out_ratio = round(100 * len(e_gdf_del.index)/len(e_gdf.index), 1)
-    log.info(f'found {len(e_gdf_del.index)} ({out_ratio} %) edges outside HMA')
+    # edges without (non-empty) LineString geometry are kept (edges of G are in the order of e_filt)
+    in_hma = ~__is_linestring(e_geoms) | shapely.is_empty(e_geoms)
+    in_hma[shapely.STRtree(e_geoms).query(hma_buffered, predicate='intersects')] = True
+    del_edge_ids = np.flatnonzero(~in_hma)
+    out_ratio = round(100 * len(del_edge_ids)/len(e_geoms), 1)
+    log.info(f'found {len(del_edge_ids)} ({out_ratio} %) edges outside HMA')
 
     log.info('deleting edges')
     before_count = G.ecount()
-    G.delete_edges(e_gdf_del.index.tolist())
+    G.delete_edges(del_edge_ids.tolist())
     after_count = G.ecount()
     log.info(f'deleted {before_count-after_count} edges')
 
-    # check if id_ig:s need to be updated to edge attributes
-    mismatch_count = len(
-        [edge.index for edge in G.es if edge.attributes()[Edge.id_ig.value] != edge.index]
-    )
-    log.info(f'invalid edge ids: {mismatch_count}')
-    # reassign igraph indexes to edge and node attributes
-    G.es[Edge.id_ig.value] = [e.index for e in G.es]
-    G.vs[Node.id_ig.value] = [v.index for v in G.vs]
-    # check if id_ig:s need to be updated to edge attributes
-    mismatch_count = len(
-        [edge.index for edge in G.es if edge.attributes()[Edge.id_ig.value] != edge.index]
-    )
-    log.info(f'invalid edge ids: {mismatch_count} (after re-indexing)')
-
-    # 9) find and inspect subgraphs by decomposing the graph
-    sub_graphs = G.decompose(mode='STRONG')
-    log.info(f'found {len(sub_graphs)} subgraphs')
-
-    graph_sizes = [graph.ecount() for graph in sub_graphs]
-    log.info(f'subgraphs with more than 10 edges: {len([s for s in graph_sizes if s > 10])}')
-    log.info(f'subgraphs with more than 50 edges: {len([s for s in graph_sizes if s > 50])}')
-    log.info(f'subgraphs with more than 100 edges: {len([s for s in graph_sizes if s > 100])}')
-    log.info(f'subgraphs with more than 500 edges: {len([s for s in graph_sizes if s > 500])}')
-    log.info(f'subgraphs with more than 10000 edges: {len([s for s in graph_sizes if s > 10000])}')
-
-    small_graphs = [graph for graph in sub_graphs if graph.ecount() <= 15]
-    medium_graphs = [graph for graph in sub_graphs if (graph.ecount() > 15 and graph.ecount() <= 500)]
-    big_graphs = [graph for graph in sub_graphs if graph.ecount() > 500]
-
-    small_graph_edges = []
-    for graph_id, graph in enumerate(small_graphs):
-        edges = ig_utils.get_edge_dicts(graph, attrs=[Edge.id_otp, Edge.id_ig, Edge.geometry])
-        for edge in edges:
-            edge['graph_id'] = graph_id
-        small_graph_edges.extend(edges)
-
-    medium_graph_edges = []
-    for graph_id, graph in enumerate(medium_graphs):
-        edges = ig_utils.get_edge_dicts(graph, attrs=[Edge.id_otp, Edge.id_ig, Edge.geometry])
-        for edge in edges:
-            edge['graph_id'] = graph_id
-        medium_graph_edges.extend(edges)
-
-    big_graph_edges = []
-    for graph_id, graph in enumerate(big_graphs):
-        edges = ig_utils.get_edge_dicts(graph, attrs=[Edge.id_otp, Edge.id_ig, Edge.geometry])
-        for edge in edges:
-            edge['graph_id'] = graph_id
-        big_graph_edges.extend(edges)
+    __reset_ig_ids(G)
 
+    # 7) find subgraphs (strongly connected components) and delete the smallest ones from the graph
     if b_export_decomposed_igraphs_to_gpkg:
-        log.info('exporting subgraphs to gpkg')
-        # graphs with <= 15 edges
-        small_graph_edges_gdf = gpd.GeoDataFrame(small_graph_edges, crs=CRS.from_epsg(gp_conf.proj_crs_epsg))
-        small_graph_edges_gdf.to_file(debug_igraph_gpkg, layer='small_graph_edges', driver='GPKG')
-        # graphs with  15–500 edges
-        medium_graph_edges_gdf = gpd.GeoDataFrame(medium_graph_edges, crs=CRS.from_epsg(gp_conf.proj_crs_epsg))
-        medium_graph_edges_gdf.to_file(debug_igraph_gpkg, layer='medium_graph_edges', driver='GPKG')
-        # graphs with > 500 edges
-        big_graph_edges_gdf = gpd.GeoDataFrame(big_graph_edges, crs=CRS.from_epsg(gp_conf.proj_crs_epsg))
-        big_graph_edges_gdf.to_file(debug_igraph_gpkg, layer='big_graph_edges', driver='GPKG')
-        log.info('graphs exported')
-
-    # 10) delete smallest subgraphs from the graph
-    del_edge_ids = [edge[Edge.id_ig.name] for edge in small_graph_edges]
+        __export_subgraphs_to_gpkg(G, debug_igraph_gpkg)
+
+    del_edge_ids = __get_small_subgraph_edge_ids(G, 15)
     log.info(f'deleting {len(del_edge_ids)} isolated edges')
     before_count = G.ecount()
-    G.delete_edges(del_edge_ids)
+    G.delete_edges(del_edge_ids.tolist())
     after_count = G.ecount()
     del_ratio = round(100 * (before_count-after_count) / before_count, 1)
     log.info(f'deleted {before_count-after_count} ({del_ratio} %) edges')
 
-    # 11) delete isolated nodes from the graph
+    # 8) delete isolated nodes from the graph
     del_node_ids = [v.index for v in G.vs.select(_degree_eq=0)]
     log.info(f'deleting {len(del_node_ids)} isolated nodes')
     before_count = G.vcount()
@@ -221,17 +301,9 @@ def convert_otp_graph_to_igraph(
     del_ratio = round(100 * (before_count-after_count) / before_count, 1)
     log.info(f'deleted {before_count-after_count} ({del_ratio} %) nodes')
 
-    # check if id_ig:s need to be updated to edge attributes
-    mismatch_count = len([edge.index for edge in G.es if edge.attributes()[Edge.id_ig.value] != edge.index])
-    log.info(f'invalid edge ids: {mismatch_count}')
-    # reassign igraph indexes to edge and node attributes
-    G.es[Edge.id_ig.value] = [e.index for e in G.es]
-    G.vs[Node.id_ig.value] = [v.index for v in G.vs]
-    # check if id_ig:s need to be updated to edge attributes
-    mismatch_count = len([edge.index for edge in G.es if edge.attributes()[Edge.id_ig.value] != edge.index])
-    log.info(f'invalid edge ids: {mismatch_count} (after re-indexing)')
+    __reset_ig_ids(G)
 
-    # 12) export graph data to GeoDataFrames fro debugging
+    # 9) export graph data to GeoDataFrames for debugging
 
     if b_export_final_graph_to_gpkg:
         log.info(f'exporting final graph to {debug_igraph_gpkg} for debugging')
@@ -257,5 +329,6 @@ def main(conf: OtpGraphImportConf):
         b_export_final_graph_to_gpkg = conf.b_export_final_graph_to_gpkg,
         debug_otp_graph_gpkg = conf.debug_otp_graph_gpkg,
         debug_igraph_gpkg = conf.debug_igraph_gpkg,
+        csv_chunk_size = conf.csv_chunk_size,
     )
     log.info(f'created igraph of {graph.ecount()} edges and {graph.vcount()} nodes from OTP data')
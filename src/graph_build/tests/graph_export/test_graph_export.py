@@ -6,6 +6,8 @@ from common.igraph import Edge as E
 import pytest
 import graph_build.graph_export.main as graph_export
 import common.igraph as ig_utils
+import common.edge_array_file as edge_array_file
+import common.sampling_manifest as sampling_manifest
 
 
 conf = GraphExportConf(
@@ -78,3 +80,13 @@ def test_length_attributes(graph):
 
     assert 16643 == len([l for l in lengths if l is not None])
     assert 24.1 == round(sum(lengths) / len(lengths), 1)
+
+
+def test_exports_sampling_manifest_of_graph(graph):
+    manifest = sampling_manifest.read_sampling_manifest(
+        fr'{conf.base_dir}/graph_out/{conf.graph_id}_sampling.npz',
+        graph_fingerprint=edge_array_file.get_graph_fingerprint(graph)
+    )
+    assert manifest.edge_count == 16643
+    assert len(manifest.id_ig) == len(manifest.lon) == len(manifest.lat)
+    assert len(set(manifest.id_way.tolist())) == len(set(graph.es[E.id_way.value]))
@@ -57,6 +57,26 @@ def test_imports_otp_graph_to_igraph():
     assert graph.vcount() == 1328
 
 
+def test_imports_otp_graph_to_igraph_in_chunks():
+    graphs = [
+        convert_otp_graph_to_igraph(
+            node_csv_file = conf.node_csv_file,
+            edge_csv_file = conf.edge_csv_file,
+            hma_poly_file = conf.hma_poly_file,
+            igraph_out_file = None,
+            csv_chunk_size = csv_chunk_size
+        )
+        for csv_chunk_size in (None, 500)
+    ]
+    graph_read_at_once, graph = graphs
+    assert graph.ecount() == 3702
+    assert graph.vcount() == 1328
+    assert graph.get_edgelist() == graph_read_at_once.get_edgelist()
+    for attr in (Edge.id_otp, Edge.length, Edge.allows_biking):
+        assert graph.es[attr.value] == graph_read_at_once.es[attr.value]
+    assert graph.vs[Node.id_otp.value] == graph_read_at_once.vs[Node.id_otp.value]
+
+
 def test_reads_the_created_igraph():
     graph = ig_utils.read_graphml(conf.igraph_out_file)
     assert graph.ecount() == 3702